@@ -0,0 +1,127 @@
+import time
+from datetime import date, timedelta
+from sqlalchemy import and_, or_
+from sqlmodel import Session, select
+from models import BillPaymentStatus, BillPaymentStatusArchive, Exclusion, ExclusionArchive, ArchiveState
+from database import get_config
+from writer import run_write
+
+BATCH = 2000
+
+def archive_state(s: Session) -> ArchiveState:
+    return s.get(ArchiveState, 1) or ArchiveState(id=1)
+
+def _move_batch(s: Session, rows, to_archive):
+    now = time.time()
+    s.add_all([to_archive(r, now) for r in rows])
+    for r in rows:
+        s.delete(r)
+
+def run_archive(payment_months: int = None, exclusion_days: int = None, progress=None):
+    """
+    Moves paid payment status rows older than `payment_months` and exclusions
+    that ended more than `exclusion_days` ago into the archive tables, in
+    batches so the writer is never held for long. Unpaid and partial months
+    stay in the live table since pending balances are computed from them.
+    """
+    settings = get_config()
+    payment_months = payment_months if payment_months is not None else settings.get("archive_payment_months", 12)
+    exclusion_days = exclusion_days if exclusion_days is not None else settings.get("archive_exclusion_days", 90)
+    today = date.today()
+    payments_before = today.year * 12 + today.month - 1 - payment_months
+    year, month = divmod(payments_before, 12)
+    exclusions_before = today - timedelta(days=exclusion_days)
+
+    old_paid = and_(BillPaymentStatus.status == "paid",
+                    or_(BillPaymentStatus.year < year,
+                        and_(BillPaymentStatus.year == year, BillPaymentStatus.month < month)))
+    expired = Exclusion.date_to < exclusions_before
+
+    def payments(s: Session):
+        rows = s.exec(select(BillPaymentStatus).where(old_paid).limit(BATCH)).all()
+        _move_batch(s, rows, lambda r, now: BillPaymentStatusArchive(
+            source_id=r.id, user_id=r.user_id, year=r.year, month=r.month, status=r.status,
+            amount_paid=r.amount_paid, balance=r.balance, archived_at=now))
+        return len(rows)
+
+    def exclusions(s: Session):
+        rows = s.exec(select(Exclusion).where(expired).limit(BATCH)).all()
+        _move_batch(s, rows, lambda r, now: ExclusionArchive(
+            source_id=r.id, user_id=r.user_id, paper_id=r.paper_id, date_from=r.date_from,
+            date_to=r.date_to, archived_at=now))
+        return len(rows)
+
+    def mark(s: Session):
+        # Readers consult the archive for anything before these marks
+        state = archive_state(s)
+        state.payments_before = max(state.payments_before, payments_before)
+        state.exclusions_before = max(filter(None, [state.exclusions_before, exclusions_before]))
+        s.add(state)
+
+    run_write(mark)
+    moved = {"payments": 0, "exclusions": 0}
+    for key, move in (("payments", payments), ("exclusions", exclusions)):
+        while True:
+            count = run_write(move)
+            moved[key] += count
+            if progress:
+                progress(0.5 if key == "exclusions" else 0.0)
+            if count < BATCH:
+                break
+    return {
+        "payments_before": {"year": year, "month": month},
+        "exclusions_before": exclusions_before.isoformat(),
+        "archived_payments": moved["payments"],
+        "archived_exclusions": moved["exclusions"],
+    }
+
+def payment_history(s: Session, user_id: int) -> dict:
+    """
+    A user's payment status rows keyed by (year, 0-based month), including
+    archived months once anything has been archived.
+    """
+    rows = list(s.exec(select(BillPaymentStatus).where(BillPaymentStatus.user_id == user_id)
+                       .order_by(BillPaymentStatus.id)).all())
+    if archive_state(s).payments_before:
+        rows += s.exec(select(BillPaymentStatusArchive).where(BillPaymentStatusArchive.user_id == user_id)
+                       .order_by(BillPaymentStatusArchive.id)).all()
+    history = {}
+    for r in rows:
+        history.setdefault((r.year, r.month), r)
+    return history
+
+def with_archived_exclusions(s: Session, excluded):
+    """
+    Wraps an `excluded(user_id, paper_id, target)` check so dates before the
+    archive mark also consult archived exclusions, loaded once per user.
+    """
+    before = archive_state(s).exclusions_before
+    if before is None:
+        return excluded
+    archived = {}
+
+    def check(user_id: int, paper_id: int, target: date):
+        if excluded(user_id, paper_id, target):
+            return True
+        if target >= before:
+            return False
+        if user_id not in archived:
+            archived[user_id] = s.exec(select(ExclusionArchive).where(ExclusionArchive.user_id == user_id)).all()
+        for e in archived[user_id]:
+            if e.paper_id is not None and e.paper_id != paper_id: continue
+            if e.date_from <= target <= e.date_to:
+                return True
+        return False
+    return check
+
+def exclusions_between(s: Session, date_from: date, date_to: date) -> list:
+    """
+    (user_id, paper_id, date_from, date_to) of every exclusion overlapping
+    the window, archived ones included when it starts before the archive mark.
+    """
+    tables = [Exclusion]
+    before = archive_state(s).exclusions_before
+    if before is not None and date_from < before:
+        tables.append(ExclusionArchive)
+    return [row for t in tables for row in s.exec(
+        select(t.user_id, t.paper_id, t.date_from, t.date_to).where(t.date_to >= date_from, t.date_from <= date_to)).all()]
@@ -0,0 +1,231 @@
+"""
+Online snapshots of agency databases using SQLite's backup API.
+
+    python backup.py snapshot [--agency NAME] [--keep N]
+    python backup.py list [--agency NAME]
+    python backup.py verify FILE
+    python backup.py restore FILE TARGET [--force]
+
+Pages are copied a few at a time with a short sleep between steps, so a
+writer is never locked out for longer than one step. When writes keep
+restarting the copy it is retried after a growing pause, and fails rather
+than finishing in one locking step. Snapshots are gzipped
+next to a manifest holding their checksum and row counts, and older ones are
+rotated away once more than `keep` exist.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+from config import config
+
+class Restarted(Exception):
+    pass
+
+def database_path(engine) -> str:
+    return os.path.abspath(engine.url.database)
+
+def backup_dir(agency: str = None) -> str:
+    return os.path.join(config.get("backup_dir", "./backups"), agency or "default")
+
+def step_settings(now: datetime = None):
+    """
+    (pages per step, sleep between steps) for the current time. Inside
+    business hours the copy yields to the app; outside them it runs flat out.
+    """
+    start, end = config.get("backup_business_hours", (7, 21))
+    hour = (now or datetime.now()).hour
+    if start <= hour < end:
+        return config.get("backup_pages_per_step", 64), config.get("backup_step_sleep_ms", 20) / 1000
+    return -1, 0
+
+def table_counts(con: sqlite3.Connection) -> dict:
+    names = [r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+    return {name: con.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0] for name in sorted(names)}
+
+def sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def snapshot(source: str, dest_dir: str, keep: int = None, progress=None) -> dict:
+    """
+    Copies the live database at `source` into a gzipped snapshot in
+    `dest_dir` and returns its manifest.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    name = f"{os.path.splitext(os.path.basename(source))[0]}-{stamp}.db.gz"
+    started = time.monotonic()
+    fd, raw = tempfile.mkstemp(suffix=".db", dir=dest_dir)
+    os.close(fd)
+    try:
+        src = sqlite3.connect(source)
+        dst = sqlite3.connect(raw)
+        restarts = [0]
+
+        def copy():
+            pages, pause = step_settings()
+            last = [None]
+            restarts_before = restarts[0]
+
+            def step(status, remaining, total):
+                # A write through another connection restarts the copy from page one
+                if last[0] is not None and remaining > last[0]:
+                    restarts[0] += 1
+                    if restarts[0] - restarts_before > config.get("backup_max_restarts", 3):
+                        raise Restarted()
+                last[0] = remaining
+                if progress and total:
+                    progress((total - remaining) / total)
+                if pause and remaining:
+                    time.sleep(pause)
+
+            src.backup(dst, pages=pages, progress=step)
+
+        attempts = config.get("backup_attempts", 4)
+        try:
+            for attempt in range(attempts):
+                try:
+                    copy()
+                    break
+                except Restarted:
+                    # Never fall back to a one-step copy: it would hold the lock for the whole file
+                    if attempt + 1 == attempts:
+                        raise Restarted(f"writes kept restarting the copy after {attempts} attempts")
+                    time.sleep(config.get("backup_retry_backoff_s", 5) * 2 ** attempt)
+            counts = table_counts(dst)
+            page_count = dst.execute("PRAGMA page_count").fetchone()[0]
+        finally:
+            dst.close()
+            src.close()
+        manifest = {
+            "file": name,
+            "source": source,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "pages": page_count,
+            "restarts": restarts[0],
+            "attempts": attempt + 1,
+            "size": os.path.getsize(raw),
+            "sha256": sha256(raw),
+            "tables": counts,
+        }
+        with open(raw, "rb") as f, gzip.open(os.path.join(dest_dir, name), "wb", compresslevel=6) as out:
+            shutil.copyfileobj(f, out, 1 << 20)
+    finally:
+        os.remove(raw)
+    manifest["compressed_size"] = os.path.getsize(os.path.join(dest_dir, name))
+    manifest["duration_ms"] = round((time.monotonic() - started) * 1000, 1)
+    with open(os.path.join(dest_dir, name + ".json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    rotate(dest_dir, keep if keep is not None else config.get("backup_keep", 14))
+    return manifest
+
+def list_snapshots(dest_dir: str) -> list:
+    if not os.path.isdir(dest_dir):
+        return []
+    manifests = []
+    for f in sorted(os.listdir(dest_dir)):
+        if f.endswith(".db.gz.json"):
+            with open(os.path.join(dest_dir, f)) as fh:
+                manifests.append(json.load(fh))
+    return sorted(manifests, key=lambda m: m["created_at"], reverse=True)
+
+def rotate(dest_dir: str, keep: int):
+    """Deletes all but the newest `keep` snapshots."""
+    removed = []
+    for manifest in list_snapshots(dest_dir)[keep:]:
+        for path in (manifest["file"], manifest["file"] + ".json"):
+            path = os.path.join(dest_dir, path)
+            if os.path.exists(path):
+                os.remove(path)
+        removed.append(manifest["file"])
+    return removed
+
+def _restore_to(path: str, target: str):
+    with gzip.open(path, "rb") as f, open(target, "wb") as out:
+        shutil.copyfileobj(f, out, 1 << 20)
+
+def verify(path: str) -> dict:
+    """
+    Restores a snapshot into a scratch file and checks it: the checksum must
+    match its manifest, SQLite's integrity check must pass and every table
+    must hold the row count recorded when the snapshot was taken.
+    """
+    with open(path + ".json") as f:
+        manifest = json.load(f)
+    problems = []
+    with tempfile.TemporaryDirectory() as scratch:
+        restored = os.path.join(scratch, "restore.db")
+        _restore_to(path, restored)
+        if sha256(restored) != manifest["sha256"]:
+            problems.append("checksum mismatch")
+        con = sqlite3.connect(restored)
+        try:
+            integrity = con.execute("PRAGMA integrity_check").fetchone()[0]
+            if integrity != "ok":
+                problems.append(f"integrity check: {integrity}")
+            counts = table_counts(con)
+        finally:
+            con.close()
+        for table, rows in manifest["tables"].items():
+            if counts.get(table) != rows:
+                problems.append(f"{table}: expected {rows} rows, found {counts.get(table)}")
+    return {"file": manifest["file"], "ok": not problems, "problems": problems}
+
+def restore(path: str, target: str, force: bool = False) -> dict:
+    """Verifies a snapshot, then writes it out as the database at `target`."""
+    result = verify(path)
+    if not result["ok"]:
+        raise ValueError(f"snapshot failed verification: {'; '.join(result['problems'])}")
+    if os.path.exists(target) and not force:
+        raise FileExistsError(f"{target} exists, pass force to overwrite")
+    partial = target + ".restoring"
+    _restore_to(path, partial)
+    os.replace(partial, target)
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(target + suffix):
+            os.remove(target + suffix)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("snapshot")
+    p.add_argument("--agency")
+    p.add_argument("--keep", type=int)
+    p = sub.add_parser("list")
+    p.add_argument("--agency")
+    p = sub.add_parser("verify")
+    p.add_argument("file")
+    p = sub.add_parser("restore")
+    p.add_argument("file")
+    p.add_argument("target")
+    p.add_argument("--force", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "snapshot":
+        from database import tenants
+        tenant = tenants.get(args.agency)
+        print(json.dumps(snapshot(database_path(tenant.engine), backup_dir(args.agency), args.keep), indent=2))
+    elif args.command == "list":
+        for m in list_snapshots(backup_dir(args.agency)):
+            print(f"{m['created_at']}  {m['compressed_size']:>10}  {m['file']}")
+    elif args.command == "verify":
+        result = verify(args.file)
+        print(json.dumps(result, indent=2))
+        sys.exit(0 if result["ok"] else 1)
+    elif args.command == "restore":
+        print(json.dumps(restore(args.file, args.target, args.force), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Per-row hydration cost of the hot read paths before and after the Core
+fast path: ORM entities or Rows copied into dicts against plain tuples and
+__slots__ records from fastread.
+
+    python benchmarks/bench_hydration.py [users]
+
+The default of 50000 users gives roughly 100k subscription rows.
+"""
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+from benchmarks.synthetic_db import build
+
+def timed(fn, repeat=3):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    path = build(os.path.join(tempfile.mkdtemp(prefix="hydration_"), "bench.db"), users)
+    os.environ["DB_URL"] = f"sqlite:///{path}"
+
+    from sqlmodel import Session, select
+    from database import engine
+    from models import Subscription, Paper, User
+    from readmodel import SubRec
+    from routes.subscriptions import DAYS, rows_from_database
+    from fastread import tuples, records, subscriptions_with_names, SUBSCRIPTION_COLUMNS
+
+    def orm_list(s):
+        # list_subscriptions before: ORM query of labelled columns, Rows copied into dicts
+        results = (
+            s.query(Subscription.id, Subscription.paper_id, Subscription.day_of_month, Subscription.user_id,
+                    Subscription.frequency, Subscription.weekday, Subscription.start_date, Subscription.end_date,
+                    Paper.name.label("paper_name"), User.name.label("user_name"))
+            .join(Paper, Paper.id == Subscription.paper_id)
+            .join(User, User.id == Subscription.user_id)
+            .all()
+        )
+        return [{"id": r.id, "day_of_month": r.day_of_month, "user_id": r.user_id, "user_name": r.user_name,
+                 "paper_id": r.paper_id, "paper_name": r.paper_name, "frequency": r.frequency,
+                 "weekday": DAYS[r.weekday], "start_date": r.start_date, "end_date": r.end_date} for r in results]
+
+    def orm_indent_join(s):
+        return (
+            s.query(Subscription.id, Subscription.paper_id, Subscription.day_of_month, Subscription.user_id,
+                    Subscription.frequency, Subscription.weekday, Subscription.start_date, Subscription.end_date,
+                    Paper.name.label("paper_name"), User.name.label("user_name"),
+                    User.flat_id.label("flat_id"), User.apt_name.label("apt_name"))
+            .join(Paper, Paper.id == Subscription.paper_id)
+            .join(User, User.id == Subscription.user_id)
+            .all()
+        )
+
+    cases = [
+        ("subscription list -> dicts", orm_list, rows_from_database),
+        ("indent join", orm_indent_join, lambda s: tuples(s, subscriptions_with_names())),
+        ("billing subscription load", lambda s: s.exec(select(Subscription)).all(),
+         lambda s: records(s, select(*SUBSCRIPTION_COLUMNS), SubRec)),
+    ]
+    print(f"{'path':<30} {'rows':>8} {'before us/row':>14} {'after us/row':>13} {'speedup':>8}")
+    for name, before, after in cases:
+        with Session(engine) as s:
+            t_before, rows = timed(lambda: (s.expunge_all(), before(s))[1])
+        with Session(engine) as s:
+            t_after, _ = timed(lambda: after(s))
+        n = len(rows)
+        print(f"{name:<30} {n:>8} {t_before / n * 1e6:>14.2f} {t_after / n * 1e6:>13.2f} {t_before / t_after:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
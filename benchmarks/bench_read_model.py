@@ -0,0 +1,68 @@
+"""
+Memory footprint of the in-memory read model and its latency win over the
+ORM path for indents, per-user bills and the subscription list.
+
+    python benchmarks/bench_read_model.py [users]
+"""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+from benchmarks.synthetic_db import build
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    path = build(os.path.join(tempfile.mkdtemp(prefix="readmodel_"), "bench.db"), users)
+    os.environ["DB_URL"] = f"sqlite:///{path}"
+
+    from sqlmodel import Session
+    from database import tenants, engine
+    from readmodel import ReadModel
+    from routes.indents import get_indent
+    from routes.billing import monthly_bill
+    from routes.subscriptions import filter_subscriptions
+
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    with Session(engine) as s:
+        model = ReadModel()
+        model.load(s)
+    load_ms = (time.perf_counter() - t0) * 1000
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{users} users, {len(model.subs)} subscriptions, {len(model.exclusions)} exclusions")
+    print(f"read model: {current / 2**20:.1f} MiB, loaded in {load_ms:.0f} ms\n")
+
+    sample = range(1, users + 1, max(1, users // 50))
+    cases = [
+        ("GET /indents", lambda: get_indent("2025-06-15"), 1),
+        (f"GET /billing/user x{len(sample)}", lambda: [monthly_bill(u, 2025, 6) for u in sample], 1),
+        ("GET /subscriptions/filter x50", lambda: [filter_subscriptions(user_id=u) for u in sample], 1),
+    ]
+    settings = tenants.default.config
+    print(f"{'endpoint':<32} {'orm ms':>10} {'read model ms':>14} {'speedup':>8}")
+    for name, fn, repeat in cases:
+        settings["read_model"] = False
+        orm = timed(fn, repeat)
+        settings["read_model"] = True
+        timed(fn, 1)  # first call loads the model
+        fast = timed(fn, repeat)
+        print(f"{name:<32} {orm:>10.1f} {fast:>14.1f} {orm / fast:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Serialization time and bytes on the wire for 10k-row list payloads.
+
+    python benchmarks/bench_serialization.py [rows]
+
+Compares FastAPI's default path (jsonable_encoder + json.dumps) with the
+response_model + orjson path used by the list endpoints, and reports raw,
+gzip and brotli sizes of the encoded body.
+"""
+import gzip
+import json
+import sys
+import os
+import time
+from datetime import date, timedelta
+from typing import List
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from schemas import SubscriptionWithNames, PaymentStatusWithName, PaperPriceWithName
+from models import Frequency
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday", None]
+MONTH_NAMES = ["Jan", "Feb", "Mar", "Apr", "May", "Jun",
+               "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+def subscription_rows(n):
+    start = date(2025, 1, 1)
+    return [
+        {
+            "id": i,
+            "day_of_month": None,
+            "user_id": i % 5000,
+            "user_name": f"Customer {i % 5000}",
+            "paper_id": i % 8,
+            "paper_name": f"Paper {i % 8}",
+            "frequency": Frequency.DAILY if i % 3 else Frequency.WEEKLY,
+            "weekday": DAYS[i % 8],
+            "start_date": start + timedelta(days=i % 300),
+            "end_date": None
+        }
+        for i in range(n)
+    ]
+
+def payment_rows(n):
+    return [
+        {
+            "id": i,
+            "user_id": i % 5000,
+            "user_name": f"Customer {i % 5000}",
+            "year": 2025,
+            "status": "unpaid" if i % 4 else "paid",
+            "month": MONTH_NAMES[i % 12],
+            "amount_paid": 0.0,
+            "balance": 300.0 + i % 100
+        }
+        for i in range(n)
+    ]
+
+def price_rows(n):
+    return [
+        {"id": i, "paper_id": i % 8, "day_of_week": (i % 8) or None, "price": 4.5, "paper_name": f"Paper {i % 8}"}
+        for i in range(n)
+    ]
+
+def timeit(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        body = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, body
+
+def run(name, rows, model):
+    adapter = TypeAdapter(List[model])
+
+    def default_path():
+        return json.dumps(jsonable_encoder(rows), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def fast_path():
+        return orjson.dumps(adapter.dump_python(adapter.validate_python(rows), mode="json"))
+
+    t_default, b_default = timeit(default_path)
+    t_fast, b_fast = timeit(fast_path)
+    gz = len(gzip.compress(b_fast, compresslevel=9))
+    br = f"{len(brotli.compress(b_fast, quality=4)) / 1024:6.1f} KiB" if brotli else "   n/a"
+    print(f"{name:<14} {len(rows):>6} rows  "
+          f"jsonable_encoder {t_default * 1000:8.1f} ms  "
+          f"orjson+model {t_fast * 1000:8.1f} ms  "
+          f"x{t_default / t_fast:4.1f}  "
+          f"raw {len(b_fast) / 1024:7.1f} KiB  "
+          f"gzip {gz / 1024:6.1f} KiB  "
+          f"brotli {br}")
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    run("subscriptions", subscription_rows(n), SubscriptionWithNames)
+    run("payments", payment_rows(n), PaymentStatusWithName)
+    run("paperprice", price_rows(n), PaperPriceWithName)
@@ -0,0 +1,201 @@
+"""
+End-to-end load test against a locally launched uvicorn.
+
+    python benchmarks/loadtest.py --users 2000 --workers 2 --concurrency 32 \
+        --duration 60 --mix crud=60,indent=10,bill=25,bulk=1,pdf=4
+
+Builds a synthetic database in a temp dir, starts `uvicorn main:app` on it,
+replays a weighted mix of request types from `--concurrency` async clients
+and prints throughput, p50/p95/p99 per route, error counts and how many
+"database is locked" errors the server logged.
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+from benchmarks.synthetic_db import build
+
+DEFAULT_MIX = "crud=60,indent=10,bill=25,bulk=1,pdf=4"
+
+def parse_mix(spec: str):
+    mix = {}
+    for part in spec.split(","):
+        name, weight = part.split("=")
+        if name not in SCENARIOS:
+            raise SystemExit(f"unknown scenario {name!r}, choose from {', '.join(SCENARIOS)}")
+        mix[name] = float(weight)
+    return mix
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class Context:
+    def __init__(self, users: int, year: int, month: int):
+        self.users = users
+        self.year = year
+        self.month = month
+        self.rnd = random.Random()
+
+    def user_id(self):
+        return self.rnd.randint(1, self.users)
+
+# Each scenario issues one or more requests and returns [(route label, response)]
+async def crud(client: httpx.AsyncClient, ctx: Context):
+    roll = ctx.rnd.random()
+    if roll < 0.25:
+        return [("GET /users", await client.get("/users/"))]
+    if roll < 0.45:
+        return [("GET /subscriptions/filter", await client.get("/subscriptions/filter", params={"user_id": ctx.user_id()}))]
+    if roll < 0.6:
+        return [("GET /payment/by-filter", await client.get("/payment/by-filter", params={"user_id": ctx.user_id()}))]
+    if roll < 0.8:
+        start = date(ctx.year, ctx.month, 1) + timedelta(days=ctx.rnd.randrange(28))
+        payload = {"user_id": ctx.user_id(), "paper_id": None,
+                   "date_from": start.isoformat(), "date_to": (start + timedelta(days=2)).isoformat()}
+        return [("POST /exclusions", await client.post("/exclusions/", json=payload))]
+    payload = {"user_id": ctx.user_id(), "year": ctx.year, "month": ctx.rnd.randrange(12),
+               "status": "paid", "amount_paid": 300.0, "balance": 0.0}
+    return [("POST /payment", await client.post("/payment/", json=payload))]
+
+async def indent(client: httpx.AsyncClient, ctx: Context):
+    day = date(ctx.year, ctx.month, 1) + timedelta(days=ctx.rnd.randrange(28))
+    return [("GET /indents", await client.get("/indents/", params={"date_str": day.isoformat()}))]
+
+async def bill(client: httpx.AsyncClient, ctx: Context):
+    uid = ctx.user_id()
+    return [("GET /billing/user/{id}", await client.get(f"/billing/user/{uid}", params={"year": ctx.year, "month": ctx.month}))]
+
+async def bulk(client: httpx.AsyncClient, ctx: Context):
+    return [("GET /billing/bulk", await client.get("/billing/bulk", params={"year": ctx.year, "month": ctx.month}))]
+
+async def pdf(client: httpx.AsyncClient, ctx: Context):
+    uid = ctx.user_id()
+    r = await client.get(f"/billing/user/{uid}", params={"year": ctx.year, "month": ctx.month})
+    out = [("GET /billing/user/{id}", r)]
+    if r.status_code == 200:
+        out.append(("POST /billing/pdf/user", await client.post("/billing/pdf/user", json=r.json())))
+    return out
+
+SCENARIOS = {"crud": crud, "indent": indent, "bill": bill, "bulk": bulk, "pdf": pdf}
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(q / 100 * (len(values) - 1)))))
+    return values[k]
+
+async def client_loop(base_url, ctx, mix, deadline, timeout, stats):
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout) as client:
+        while time.perf_counter() < deadline:
+            scenario = ctx.rnd.choices(names, weights)[0]
+            try:
+                results = await SCENARIOS[scenario](client, ctx)
+            except httpx.TimeoutException:
+                stats["timeouts"][scenario] += 1
+                continue
+            except httpx.HTTPError:
+                stats["errors"][scenario] += 1
+                continue
+            for label, response in results:
+                stats["latency"][label].append(response.elapsed.total_seconds())
+                if response.status_code >= 500:
+                    stats["errors"][label] += 1
+                elif response.status_code >= 400:
+                    stats["rejected"][label] += 1
+
+async def run_load(base_url, ctx, mix, concurrency, duration, timeout):
+    stats = {"latency": defaultdict(list), "errors": defaultdict(int), "rejected": defaultdict(int),
+             "timeouts": defaultdict(int)}
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(client_loop(base_url, ctx, mix, deadline, timeout, stats) for _ in range(concurrency)))
+    return stats
+
+def wait_until_up(base_url, proc, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit("uvicorn exited during startup")
+        try:
+            if httpx.get(f"{base_url}/health/").status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit("uvicorn did not come up")
+
+def report(stats, duration, log_path):
+    total = sum(len(v) for v in stats["latency"].values())
+    print(f"\n{total} requests in {duration:.0f}s -> {total / duration:.1f} req/s\n")
+    print(f"{'route':<28} {'count':>7} {'rps':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'4xx':>6} {'5xx':>6}")
+    for label in sorted(stats["latency"]):
+        lat = [v * 1000 for v in stats["latency"][label]]
+        print(f"{label:<28} {len(lat):>7} {len(lat) / duration:>7.1f} {percentile(lat, 50):>9.1f} "
+              f"{percentile(lat, 95):>9.1f} {percentile(lat, 99):>9.1f} {stats['rejected'].get(label, 0):>6} {stats['errors'].get(label, 0):>6}")
+    for scenario, n in sorted(stats["timeouts"].items()):
+        print(f"client timeouts in {scenario}: {n}")
+    with open(log_path, errors="replace") as f:
+        locked = f.read().count("database is locked")
+    print(f"'database is locked' errors in server log: {locked}")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--users", type=int, default=2000)
+    ap.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    ap.add_argument("--concurrency", type=int, default=16, help="concurrent clients")
+    ap.add_argument("--duration", type=float, default=30.0, help="seconds of load")
+    ap.add_argument("--timeout", type=float, default=30.0, help="per-request client timeout")
+    ap.add_argument("--mix", default=DEFAULT_MIX, help="scenario=weight list, scenarios: " + ", ".join(SCENARIOS))
+    ap.add_argument("--year", type=int, default=2025)
+    ap.add_argument("--month", type=int, default=6)
+    ap.add_argument("--url", help="target an already running server instead of launching one")
+    args = ap.parse_args()
+    mix = parse_mix(args.mix)
+
+    workdir = tempfile.mkdtemp(prefix="loadtest_")
+    log_path = os.path.join(workdir, "server.log")
+    proc = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+        open(log_path, "w").close()
+    else:
+        db_path = build(os.path.join(workdir, "load.db"), args.users)
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        env = dict(os.environ, DB_URL=f"sqlite:///{db_path}")
+        log = open(log_path, "w")
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+             "--workers", str(args.workers), "--no-access-log"],
+            cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+    try:
+        if proc:
+            wait_until_up(base_url, proc)
+        print(f"target {base_url}, mix {mix}, {args.concurrency} clients for {args.duration:.0f}s")
+        ctx = Context(args.users, args.year, args.month)
+        stats = asyncio.run(run_load(base_url, ctx, mix, args.concurrency, args.duration, args.timeout))
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait(timeout=30)
+    report(stats, args.duration, log_path)
+
+if __name__ == "__main__":
+    main()
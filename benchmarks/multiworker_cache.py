@@ -0,0 +1,133 @@
+"""
+Cross-worker cache check: starts `uvicorn main:app --workers N` on a
+synthetic database, warms bills and indents in every worker, then writes
+through one request (an exclusion, a price change) and reads back through
+fresh connections that land on whichever worker the kernel picks. Any read
+that still returns the pre-write answer is counted as stale.
+
+    python benchmarks/multiworker_cache.py --workers 4 --backends memory,shared
+
+The shared backend must report 0 stale reads (exit status 1 otherwise); the
+memory backend is run alongside to show what it replaces. A small run of
+the shared backend is part of the test suite
+(tests/test_multiworker_cache.py).
+"""
+import argparse
+import calendar
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from datetime import date
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+from benchmarks.synthetic_db import build
+from benchmarks.loadtest import free_port, wait_until_up
+
+def fresh_get(base_url, path, **params):
+    # A new connection per request so the kernel spreads them over the workers
+    with httpx.Client(base_url=base_url, timeout=30) as client:
+        response = client.get(path, params=params)
+        response.raise_for_status()
+        return response.json()
+
+def indent_total(indent):
+    return sum(p["quantity"] for p in indent["papers"])
+
+def stale_reads(read, before, reads):
+    return sum(1 for _ in range(reads) if read() == before)
+
+def run_backend(backend, args):
+    workdir = tempfile.mkdtemp(prefix=f"cache_{backend}_")
+    db_path = build(os.path.join(workdir, "cache.db"), args.users)
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, DB_URL=f"sqlite:///{db_path}", CACHE_BACKEND=backend)
+    log = open(os.path.join(workdir, "server.log"), "w")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+         "--workers", str(args.workers), "--no-access-log"],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    rnd = random.Random(args.seed)
+    warm = args.workers * 8
+    month_start = date(args.year, args.month, 1)
+    month_end = month_start.replace(day=calendar.monthrange(args.year, args.month)[1])
+    stale = {"exclusion -> bill": 0, "exclusion -> indent": 0, "price -> bill": 0}
+    checked = dict.fromkeys(stale, 0)
+    used = set()
+
+    def daily_subscriber():
+        # Someone not written to yet who gets a paper every day of the month,
+        # so each write below must change their answers
+        while True:
+            user_id = rnd.randint(1, args.users)
+            if user_id in used:
+                continue
+            used.add(user_id)
+            for sub in fresh_get(base_url, "/subscriptions/filter", user_id=user_id):
+                if (sub["frequency"] == "daily" and date.fromisoformat(sub["start_date"]) <= month_start
+                        and (sub["end_date"] is None or date.fromisoformat(sub["end_date"]) >= month_end)):
+                    return user_id, sub["paper_id"]
+
+    def check(name, read, write):
+        before = [read() for _ in range(warm)][-1]
+        write()
+        stale[name] += stale_reads(read, before, args.reads)
+        checked[name] += args.reads
+
+    try:
+        wait_until_up(base_url, proc)
+        for _ in range(args.rounds):
+            user_id, paper_id = daily_subscriber()
+            bill = lambda: fresh_get(base_url, f"/billing/user/{user_id}", year=args.year, month=args.month)["total"]
+            day = month_start.replace(day=rnd.randint(1, 28)).isoformat()
+            indent = lambda: indent_total(fresh_get(base_url, "/indents/", date_str=day))
+            excluded = {"user_id": user_id, "paper_id": paper_id,
+                        "date_from": month_start.isoformat(), "date_to": month_end.isoformat()}
+            exclude = lambda: httpx.post(f"{base_url}/exclusions/", json=excluded).raise_for_status()
+            # Warm the indent first so the exclusion lands after both are cached
+            before = [indent() for _ in range(warm)][-1]
+            check("exclusion -> bill", bill, exclude)
+            stale["exclusion -> indent"] += stale_reads(indent, before, args.reads)
+            checked["exclusion -> indent"] += args.reads
+
+            user_id, paper_id = daily_subscriber()
+            price = {"price": rnd.randint(20, 40), "effective_from": month_start.isoformat()}
+            check("price -> bill", bill,
+                  lambda: httpx.post(f"{base_url}/papers/{paper_id}/price", json=price).raise_for_status())
+        stats = fresh_get(base_url, "/billing/cache-stats")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+        log.close()
+    return stale, checked, stats
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--users", type=int, default=300)
+    ap.add_argument("--workers", type=int, default=4, help="uvicorn worker processes")
+    ap.add_argument("--rounds", type=int, default=10, help="write/read-back rounds per backend")
+    ap.add_argument("--reads", type=int, default=20, help="reads after each write")
+    ap.add_argument("--backends", default="memory,shared")
+    ap.add_argument("--year", type=int, default=2025)
+    ap.add_argument("--month", type=int, default=6)
+    ap.add_argument("--seed", type=int, default=11)
+    args = ap.parse_args()
+
+    failed = False
+    print(f"{'backend':<8} {'check':<22} {'stale':>7} {'reads':>7}")
+    for backend in args.backends.split(","):
+        stale, checked, stats = run_backend(backend, args)
+        for check in stale:
+            print(f"{backend:<8} {check:<22} {stale[check]:>7} {checked[check]:>7}")
+        print(f"{backend:<8} cache {stats}")
+        failed |= backend == "shared" and any(stale.values())
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Query-plan regression check for the hot endpoints. Each endpoint is called
+against a synthetic database while every SQL statement it issues is
+captured; each distinct statement is then run through EXPLAIN QUERY PLAN.
+A statement that scans a large table without an index fails the check,
+unless the endpoint is expected to read that whole table.
+
+    python benchmarks/query_plans.py [users] [--min-rows N]
+
+Prints the plans per endpoint and exits with status 1 on any failure.
+"""
+import argparse
+import contextlib
+import io
+import os
+import re
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+from benchmarks.synthetic_db import build
+
+SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?(?: USING (?:COVERING )?INDEX .*)?$")
+
+def cases(sample_user: int):
+    from routes.billing import monthly_bill, bulk_billing, get_pending_payments
+    from routes.indents import get_indent
+    from routes.subscriptions import filter_subscriptions
+    from routes.bill_payment_status import get_user_by_filter as payment_filter, get_aging
+    from routes.users import get_user_by_filter as user_filter
+    from sqlmodel import Session
+    from database import get_engine
+
+    def pending():
+        with Session(get_engine()) as s:
+            return get_pending_payments(s, sample_user, 2025, 6)
+
+    # name, call, tables the endpoint is expected to read in full
+    return [
+        ("monthly_bill", lambda: monthly_bill(sample_user, 2025, 6), set()),
+        ("get_pending_payments", pending, set()),
+        ("get_indent", lambda: get_indent("2025-06-15"), {"subscription"}),
+        ("bulk_billing", lambda: bulk_billing(2025, 6), {"user"}),
+        ("subscriptions/filter?user_id", lambda: filter_subscriptions(user_id=sample_user), set()),
+        ("subscriptions/filter?paper_id", lambda: filter_subscriptions(paper_id=1), set()),
+        ("payment/by-filter?user_id", lambda: payment_filter(user_id=sample_user), set()),
+        ("payment/by-filter?year&month", lambda: payment_filter(year=2025, month=5), set()),
+        ("users/by-filter?flat_id", lambda: user_filter(flat_id="A101"), set()),
+        ("payment/aging", lambda: get_aging("2025-07-01"), {"billpaymentstatus", "circulationsummary"}),
+    ]
+
+def capture(engine, fn):
+    """Runs `fn` and returns the distinct statements it sent, with parameters."""
+    from sqlalchemy import event
+    seen = {}
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            seen.setdefault(statement, parameters)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return seen
+
+def explain(con, statement, parameters):
+    return [row[3] for row in con.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ())]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("users", type=int, nargs="?", default=5000)
+    parser.add_argument("--min-rows", type=int, default=1000)
+    args = parser.parse_args()
+    users, min_rows = args.users, args.min_rows
+    path = build(os.path.join(tempfile.mkdtemp(prefix="plans_"), "plans.db"), users)
+    os.environ["DB_URL"] = f"sqlite:///{path}"
+
+    import sqlite3
+    from database import engine, create_db_and_tables
+    create_db_and_tables()
+    con = sqlite3.connect(path)
+    sizes = {name: con.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+             for (name,) in con.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+    failures = 0
+    for name, fn, full_reads in cases(sample_user=users // 2):
+        statements = capture(engine, fn)
+        print(f"== {name} ({len(statements)} distinct statements)")
+        for statement, parameters in statements.items():
+            plan = explain(con, statement, parameters)
+            bad = []
+            for step in plan:
+                m = SCAN.match(step.strip())
+                if m and "INDEX" not in step and m.group(1) not in full_reads and sizes.get(m.group(1), 0) >= min_rows:
+                    bad.append(f"{m.group(1)} ({sizes[m.group(1)]} rows)")
+            failures += bool(bad)
+            print(f"  {'FAIL' if bad else 'ok  '} {' '.join(statement.split())[:160]}")
+            for step in plan:
+                print(f"         {step}")
+            if bad:
+                print(f"         full scan of {', '.join(bad)}")
+        print()
+    print(f"{failures} statement(s) scan a table of {min_rows}+ rows without an index")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Builds a synthetic agency database for benchmarks and load tests.
+
+    python benchmarks/synthetic_db.py out.db [users]
+
+Users are spread over apartments and blocks, each with one to three
+subscriptions over a mix of frequencies, a sprinkling of exclusions and a
+few months of payment status rows.
+"""
+import os
+import random
+import sqlite3
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from sqlmodel import SQLModel, create_engine
+import models  # noqa: F401  registers the tables on SQLModel.metadata
+
+PAPERS = ["Times Now", "Vijaya Karnataka", "Bangalore Mirror", "Deccan Herald",
+          "Economic Times", "Prajavani", "The Hindu", "Udayavani"]
+APARTMENTS = ["Prestige", "Brigade", "Sobha", "Purva", "Mantri"]
+BLOCKS = "ABCDEFGH"
+FREQUENCIES = ["DAILY"] * 7 + ["WEEKLY", "MONTHLY", "ALTERNATING"]
+
+def build(path: str, users: int = 1000, seed: int = 7, start: date = date(2025, 1, 1)):
+    if os.path.exists(path):
+        os.remove(path)
+    engine = create_engine(f"sqlite:///{path}")
+    SQLModel.metadata.create_all(engine)
+    engine.dispose()
+
+    rnd = random.Random(seed)
+    con = sqlite3.connect(path)
+    con.executemany("INSERT INTO paper (id, name) VALUES (?, ?)",
+                    [(i + 1, name) for i, name in enumerate(PAPERS)])
+    prices = []
+    for pid in range(1, len(PAPERS) + 1):
+        prices.append((pid, None, rnd.choice([4.0, 4.5, 5.0, 6.0])))
+        prices.append((pid, 6, rnd.choice([6.0, 6.5, 7.0])))
+    con.executemany("INSERT INTO paperprice (paper_id, day_of_week, price) VALUES (?, ?, ?)", prices)
+
+    user_rows, sub_rows, ex_rows, pay_rows = [], [], [], []
+    for uid in range(1, users + 1):
+        apt = APARTMENTS[uid % len(APARTMENTS)]
+        flat = f"{BLOCKS[(uid // len(APARTMENTS)) % len(BLOCKS)]}{100 + uid % 400}"
+        user_rows.append((uid, f"Customer {uid}", f"9{uid:09d}", flat, apt))
+        sub_start = start + timedelta(days=rnd.randrange(0, 180))
+        for pid in rnd.sample(range(1, len(PAPERS) + 1), rnd.randint(1, 3)):
+            freq = rnd.choice(FREQUENCIES)
+            weekday = rnd.randrange(7) if freq in ("WEEKLY", "ALTERNATING") else None
+            dom = rnd.randint(1, 28) if freq == "MONTHLY" else None
+            end = sub_start + timedelta(days=rnd.randrange(90, 400)) if rnd.random() < 0.2 else None
+            sub_rows.append((uid, pid, freq, weekday, dom, sub_start.isoformat(), end.isoformat() if end else None))
+        if rnd.random() < 0.3:
+            frm = start + timedelta(days=rnd.randrange(0, 300))
+            ex_rows.append((uid, None if rnd.random() < 0.5 else rnd.randint(1, len(PAPERS)),
+                            frm.isoformat(), (frm + timedelta(days=rnd.randrange(1, 10))).isoformat()))
+        for month in range(sub_start.month - 1, 6):
+            status = rnd.choice(["paid", "paid", "partial", "unpaid"])
+            pay_rows.append((uid, 2025, month, status, 0.0 if status == "unpaid" else 100.0,
+                             0.0 if status == "paid" else 50.0))
+
+    con.executemany("INSERT INTO user (id, name, mobile, flat_id, apt_name) VALUES (?, ?, ?, ?, ?)", user_rows)
+    con.executemany("INSERT INTO subscription (user_id, paper_id, frequency, weekday, day_of_month, start_date, end_date) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", sub_rows)
+    con.executemany("INSERT INTO exclusion (user_id, paper_id, date_from, date_to) VALUES (?, ?, ?, ?)", ex_rows)
+    con.executemany("INSERT INTO billpaymentstatus (user_id, year, month, status, amount_paid, balance) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", pay_rows)
+    con.commit()
+    con.close()
+    return path
+
+if __name__ == "__main__":
+    out = sys.argv[1] if len(sys.argv) > 1 else "synthetic.db"
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    build(out, n)
+    print(f"wrote {out} with {n} users")
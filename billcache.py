@@ -0,0 +1,151 @@
+from collections import OrderedDict
+from threading import Lock
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session as OrmSession
+from models import User, Paper, PaperPrice, Subscription, Exclusion, BillPaymentStatus
+from sharedcache import SharedCache, shared_cache_path
+
+class BillCache:
+    """
+    Computed monthly bills keyed by (user, year, month), least recently used
+    first out. Each entry records the tags it was built from, ("user", id)
+    for the user's subscriptions, exclusions and payments and ("paper", id)
+    for names and prices, so a write only evicts the bills it can change.
+    Invalidations also bump a per-tag version that stamp() reports, so other
+    per-process caches (price timelines) can check freshness on read.
+    """
+    shared = False
+
+    def __init__(self, size: int):
+        self.size = size
+        self.entries = OrderedDict()
+        self.by_tag = {}
+        self.lock = Lock()
+        self.generation = 0
+        self.versions = {}
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None, self.generation
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[0], self.generation
+
+    def put(self, key, value, tags, generation: int):
+        """Stores `value` unless something was invalidated since `generation`."""
+        with self.lock:
+            if generation != self.generation:
+                return
+            self._drop(key)
+            self.entries[key] = (value, tags)
+            for tag in tags:
+                self.by_tag.setdefault(tag, set()).add(key)
+            while len(self.entries) > self.size:
+                self._drop(next(iter(self.entries)))
+                self.stats["evictions"] += 1
+
+    def invalidate(self, tags):
+        with self.lock:
+            self.generation += 1
+            for tag in tags:
+                self.versions[tag] = self.versions.get(tag, 0) + 1
+                for key in self.by_tag.pop(tag, ()):
+                    if self._drop(key):
+                        self.stats["invalidations"] += 1
+
+    def _drop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return False
+        for tag in entry[1]:
+            keys = self.by_tag.get(tag)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self.by_tag[tag]
+        return True
+
+    def stamp(self, tag) -> int:
+        with self.lock:
+            return self.versions.get(tag, 0)
+
+    def summary(self):
+        with self.lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return dict(self.stats, size=len(self.entries), max_size=self.size, backend="memory",
+                        hit_rate=round(self.stats["hits"] / lookups, 4) if lookups else 0.0)
+
+_create_lock = Lock()
+
+def new_cache(tenant):
+    """
+    BillCache in this process, or with `cache_backend` set to "shared" a
+    SharedCache every worker on the host reads and invalidates.
+    """
+    size = tenant.config.get("bill_cache_size", 2048)
+    if tenant.config.get("cache_backend") == "shared":
+        path = shared_cache_path(tenant.engine)
+        if path:
+            return SharedCache(path, size)
+    return BillCache(size)
+
+def get_bill_cache(tenant=None):
+    from database import get_tenant
+    tenant = tenant or get_tenant()
+    cache = tenant.caches.get("bills")
+    if cache is None:
+        with _create_lock:
+            cache = tenant.caches.get("bills")
+            if cache is None:
+                cache = tenant.caches["bills"] = new_cache(tenant)
+    return cache
+
+# model: (tag kind, attribute naming the tagged row)
+DEPENDENCIES = {
+    User: ("user", "id"),
+    Subscription: ("user", "user_id"),
+    Exclusion: ("user", "user_id"),
+    BillPaymentStatus: ("user", "user_id"),
+    Paper: ("paper", "id"),
+    PaperPrice: ("paper", "paper_id"),
+}
+
+# Indents read every subscription, so any change to these tables re-renders them
+INDENTS = ("indents",)
+INDENT_DEPENDENCIES = (User, Paper, Subscription, Exclusion)
+
+def tags_for(obj):
+    kind, attr = DEPENDENCIES[type(obj)]
+    history = inspect(obj).attrs[attr].history
+    # A row moved to another user or paper affects both the old and the new one
+    return {(kind, value) for value in (*history.unchanged, *history.added, *history.deleted) if value is not None}
+
+@event.listens_for(OrmSession, "after_flush")
+def collect_tags(session, flush_context):
+    tags = session.info.setdefault("bill_tags", set())
+    for objs in (session.new, session.dirty, session.deleted):
+        for obj in objs:
+            if type(obj) in DEPENDENCIES:
+                tags |= tags_for(obj)
+            if isinstance(obj, INDENT_DEPENDENCIES):
+                tags.add(INDENTS)
+
+@event.listens_for(OrmSession, "after_commit")
+def evict_bills(session):
+    tags = session.info.pop("bill_tags", None)
+    if not tags:
+        return
+    from database import tenants
+    engine = session.get_bind()
+    for tenant in [tenants.default, *list(tenants.open.values())]:
+        # Shared stamps must move even if this worker never read a bill
+        if tenant.engine is engine and ("bills" in tenant.caches or tenant.config.get("cache_backend") == "shared"):
+            get_bill_cache(tenant).invalidate(tags)
+
+@event.listens_for(OrmSession, "after_rollback")
+def discard_tags(session):
+    session.info.pop("bill_tags", None)
@@ -0,0 +1,62 @@
+import time
+import orjson
+from sqlalchemy import event, func, delete, select
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session
+from models import User, Paper, PaperPrice, Subscription, Exclusion, BillPaymentStatus, ChangeLog, ChangeLogState
+
+TRACKED = (User, Paper, PaperPrice, Subscription, Exclusion, BillPaymentStatus)
+
+def _snapshot(obj):
+    return orjson.dumps(obj.model_dump(mode="json")).decode()
+
+@event.listens_for(OrmSession, "after_flush")
+def record_changes(session, flush_context):
+    """
+    Appends one change-log row per inserted, updated or deleted tracked
+    object in the same transaction as the write itself.
+    """
+    now = time.time()
+    rows = []
+    for obj in session.new:
+        if isinstance(obj, TRACKED):
+            rows.append({"table_name": obj.__tablename__, "row_id": obj.id, "op": "insert", "data": _snapshot(obj), "ts": now})
+    for obj in session.dirty:
+        if isinstance(obj, TRACKED) and session.is_modified(obj, include_collections=False):
+            rows.append({"table_name": obj.__tablename__, "row_id": obj.id, "op": "update", "data": _snapshot(obj), "ts": now})
+    for obj in session.deleted:
+        if isinstance(obj, TRACKED):
+            rows.append({"table_name": obj.__tablename__, "row_id": obj.id, "op": "delete", "data": None, "ts": now})
+    if rows:
+        session.connection().execute(ChangeLog.__table__.insert(), rows)
+
+def latest_seq(session: Session) -> int:
+    # Compaction can purge the newest entries; the head never moves back past the purge point
+    head = session.exec(select(func.coalesce(func.max(ChangeLog.seq), 0))).one()[0]
+    return max(head, purged_through(session))
+
+def purged_through(session: Session) -> int:
+    state = session.get(ChangeLogState, 1)
+    return state.purged_through if state else 0
+
+def compact_changes(session: Session, retention_days: float = 30):
+    """
+    Keeps only the newest entry per row, then drops delete markers older than
+    the retention window. Clients whose cursor is older than the purge point
+    are told to resync from scratch. Caller commits.
+    """
+    before = session.exec(select(func.count(ChangeLog.seq))).one()[0]
+    newest = select(func.max(ChangeLog.seq)).group_by(ChangeLog.table_name, ChangeLog.row_id)
+    session.exec(delete(ChangeLog).where(ChangeLog.seq.not_in(newest)))
+
+    cutoff = time.time() - retention_days * 86400
+    horizon = session.exec(
+        select(func.max(ChangeLog.seq)).where(ChangeLog.op == "delete", ChangeLog.ts < cutoff)
+    ).one()[0]
+    if horizon:
+        session.exec(delete(ChangeLog).where(ChangeLog.op == "delete", ChangeLog.seq <= horizon))
+        state = session.get(ChangeLogState, 1) or ChangeLogState(id=1)
+        state.purged_through = max(state.purged_through, horizon)
+        session.add(state)
+    after = session.exec(select(func.count(ChangeLog.seq))).one()[0]
+    return {"before": before, "after": after, "purged_through": purged_through(session)}
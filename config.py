@@ -1,3 +1,59 @@
+import os
+
 config = {
-    "agency_name":"SLN"
+    "agency_name":"SLN",
+    # Route mutating endpoints through one writer thread that batches commits
+    "single_writer": os.environ.get("SINGLE_WRITER", "0") == "1",
+    "writer_window_ms": 5,
+    # Per-agency databases live in data_dir as <agency>.db, selected by the
+    # X-Agency header or an /agency/<agency>/ path prefix
+    "data_dir": os.environ.get("DATA_DIR", "./agencies"),
+    "max_open_agencies": 32,
+    # Per-agency overrides, e.g. {"mysore": {"agency_name": "SLN Mysore"}}
+    "agencies": {},
+    # Delete markers older than this are dropped by /sync/compact
+    "change_log_retention_days": 30,
+    # Serve indents, billing and list reads from the in-memory read model
+    "read_model": os.environ.get("READ_MODEL", "0") == "1",
+    # Computed monthly bills and rendered bill PDFs kept per agency, evicted by writes they depend on
+    "bill_cache_size": 2048,
+    # "shared" (the default) keeps bills, bill PDFs, indents and the price stamp in a
+    # SQLite file beside the agency database, so every uvicorn worker on the host sees
+    # the same entries and invalidations. "memory" is per process and only safe with
+    # a single worker
+    "cache_backend": os.environ.get("CACHE_BACKEND", "shared"),
+    # Background jobs: pool size, then per type (concurrent runs, queued jobs allowed)
+    "job_workers": 2,
+    # Running jobs heartbeat this often; other workers reclaim a job only once its lease has lapsed
+    "job_heartbeat_s": 10,
+    "job_lease_s": 60,
+    # Finished jobs and their results are deleted after this many days
+    "job_retention_days": 7,
+    "job_limits": {
+        "bulk_billing": (1, 4),
+        "close_month": (1, 2),
+        "pending_payments": (2, 50),
+        "bill_pdf": (2, 200),
+        "indent_pdf": (1, 10),
+        "backup": (1, 1),
+        "archive": (1, 1),
+    },
+    # Online snapshots: copied in small page steps during business hours
+    "backup_dir": os.environ.get("BACKUP_DIR", "./backups"),
+    "backup_keep": 14,
+    "backup_pages_per_step": 64,
+    "backup_step_sleep_ms": 20,
+    "backup_business_hours": (7, 21),
+    # Restarts tolerated per attempt; a snapshot gives up after backup_attempts, pausing backoff_s * 2^n between them
+    "backup_max_restarts": 3,
+    "backup_attempts": 4,
+    "backup_retry_backoff_s": 5,
+    # Paid months and ended exclusions older than this move to the archive tables
+    "archive_payment_months": 12,
+    "archive_exclusion_days": 90,
+    # Requests sent with this token in X-Profile (or ?_profile=) are profiled; unset disables profiling entirely
+    "profile_token": os.environ.get("PROFILE_TOKEN"),
+    "profile_dir": os.environ.get("PROFILE_DIR", "./profiles"),
+    "profile_keep": 50,
+    "profile_max_events": 500_000
 }
\ No newline at end of file
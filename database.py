@@ -1,12 +1,213 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
 from sqlmodel import create_engine, SQLModel, Session
 from models import User, Paper, PaperPrice, Subscription, Exclusion
+from config import config
+import changes  # noqa: F401  registers the change-log flush listener
+import schedules  # registers the schedule mask listeners
 
-DB_URL = "sqlite:///./newspaper.db"
-engine = create_engine(DB_URL, connect_args={"check_same_thread": False})
+DB_URL = os.environ.get("DB_URL", "sqlite:///./newspaper.db")
 
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+def sqlite_engine(url: str):
+    """
+    An engine whose transactions really start at BEGIN. pysqlite otherwise
+    only opens one before DML, so a SAVEPOINT would run (and its RELEASE
+    commit) outside any transaction and the writer's batches would never
+    share a commit. This is SQLAlchemy's documented pysqlite workaround.
+    Connections with the `immediate` execution option begin IMMEDIATE and
+    take the write lock up front: a read-then-write transaction that has to
+    upgrade its lock fails at once, rather than waiting out the busy
+    timeout, when another process is writing.
+    """
+    new_engine = create_engine(url, connect_args={"check_same_thread": False})
+
+    @event.listens_for(new_engine, "connect")
+    def disable_pysqlite_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(new_engine, "begin")
+    def emit_begin(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE" if conn.get_execution_options().get("immediate") else "BEGIN")
+
+    return new_engine
+
+engine = sqlite_engine(DB_URL)
+
+# Columns added after the first release; create_all does not alter existing tables
+MIGRATIONS = [
+    ("paperprice", "effective_from", "DATE"),
+    ("paperprice", "effective_to", "DATE"),
+    ("subscription", "weekdays", "INTEGER"),
+    ("subscription", "month_days", "INTEGER"),
+    ("subscription", "interval_days", "INTEGER"),
+    ("subscription", "week_pattern", "VARCHAR"),
+    ("job", "owner", "VARCHAR"),
+    ("job", "heartbeat", "FLOAT"),
+    ("billpaymentstatusarchive", "source_id", "INTEGER"),
+    ("exclusionarchive", "source_id", "INTEGER"),
+]
+
+def migrate(engine=engine):
+    with engine.execution_options(immediate=True).begin() as conn:
+        for table, column, ddl in MIGRATIONS:
+            existing = {row[1] for row in conn.exec_driver_sql(f'PRAGMA table_info("{table}")')}
+            if existing and column not in existing:
+                conn.exec_driver_sql(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}')
+        conn.exec_driver_sql(schedules.backfill_sql())
+        # Indexes declared on the models after their tables already existed
+        for table in SQLModel.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+def create_db_and_tables(engine=engine):
+    # Workers starting together all run this; IMMEDIATE makes them queue
+    SQLModel.metadata.create_all(engine.execution_options(immediate=True))
+    migrate(engine)
+
+AGENCY_NAME = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+
+class UnknownAgency(LookupError):
+    pass
+
+class Tenant:
+    """
+    One agency: its own SQLite file, engine, config overrides and a dict of
+    per-agency caches that other modules key their state into.
+    """
+
+    def __init__(self, name: Optional[str], engine, settings: dict):
+        self.name = name
+        self.engine = engine
+        self.config = settings
+        self.caches = {}
+        # Requests and jobs currently using this tenant; an evicted tenant closes when the last one ends
+        self.active = 0
+        self.evicted = False
+
+    def close(self):
+        for cache in self.caches.values():
+            close = getattr(cache, "stop", None)
+            if close:
+                close()
+        self.caches.clear()
+        self.engine.dispose()
+
+class TenantRegistry:
+    """
+    Opens agency databases lazily and keeps at most `max_open` of them,
+    disposing the least recently used engine when a new one is needed.
+    Only agencies listed in config or with a database in `data_dir` exist;
+    anything else raises UnknownAgency instead of creating a file.
+    """
+
+    def __init__(self, data_dir: str, max_open: int):
+        self.data_dir = data_dir
+        self.max_open = max_open
+        self.open = OrderedDict()
+        self.lock = threading.Lock()
+        self.default = Tenant(None, engine, dict(config))
+
+    def path_for(self, name: str):
+        return os.path.join(self.data_dir, f"{name}.db")
+
+    def known(self):
+        if not os.path.isdir(self.data_dir):
+            return []
+        return sorted(f[:-3] for f in os.listdir(self.data_dir) if f.endswith(".db") and AGENCY_NAME.match(f[:-3]))
+
+    def exists(self, name: str) -> bool:
+        return name in config.get("agencies", {}) or name in self.open or os.path.exists(self.path_for(name))
+
+    def settings_for(self, name: str) -> dict:
+        return {**config, "agency_name": name.upper(), **config.get("agencies", {}).get(name, {})}
+
+    def get(self, name: Optional[str]) -> Tenant:
+        if not name:
+            return self.default
+        with self.lock:
+            return self._get(name)
+
+    def acquire(self, name: Optional[str]) -> Tenant:
+        """Like get(), but the tenant stays open until release() even if evicted meanwhile."""
+        if not name:
+            return self.default
+        with self.lock:
+            tenant = self._get(name)
+            tenant.active += 1
+            return tenant
+
+    def release(self, tenant: Tenant):
+        if tenant is self.default:
+            return
+        with self.lock:
+            tenant.active -= 1
+            if tenant.evicted and tenant.active == 0:
+                tenant.close()
+
+    @contextmanager
+    def reading(self, name: Optional[str]):
+        """
+        A tenant for a one-off read. Open agencies are used as they are;
+        others get a throwaway engine so a sweep over every agency does not
+        churn the LRU.
+        """
+        with self.lock:
+            tenant = self.open.get(name) if name else self.default
+            if tenant is not None:
+                tenant.active += 1
+        if tenant is not None:
+            try:
+                yield tenant
+            finally:
+                self.release(tenant)
+            return
+        if not os.path.exists(self.path_for(name)):
+            raise UnknownAgency(name)
+        scratch = Tenant(name, sqlite_engine(f"sqlite:///{self.path_for(name)}"), self.settings_for(name))
+        try:
+            yield scratch
+        finally:
+            scratch.engine.dispose()
+
+    def _get(self, name: str) -> Tenant:
+        if not AGENCY_NAME.match(name):
+            raise ValueError(f"invalid agency name {name!r}")
+        tenant = self.open.get(name)
+        if tenant is not None:
+            self.open.move_to_end(name)
+            return tenant
+        if not self.exists(name):
+            raise UnknownAgency(name)
+        os.makedirs(self.data_dir, exist_ok=True)
+        tenant_engine = sqlite_engine(f"sqlite:///{self.path_for(name)}")
+        create_db_and_tables(tenant_engine)
+        tenant = Tenant(name, tenant_engine, self.settings_for(name))
+        self.open[name] = tenant
+        while len(self.open) > self.max_open:
+            _, evicted = self.open.popitem(last=False)
+            evicted.evicted = True
+            if evicted.active == 0:
+                evicted.close()
+        return tenant
+
+tenants = TenantRegistry(config.get("data_dir", "./agencies"), config.get("max_open_agencies", 32))
+current_agency: ContextVar[Optional[str]] = ContextVar("current_agency", default=None)
+
+def get_tenant() -> Tenant:
+    return tenants.get(current_agency.get())
+
+def get_engine():
+    return get_tenant().engine
+
+def get_config() -> dict:
+    return get_tenant().config
 
 def get_session():
-    with Session(engine) as session:
+    with Session(get_engine()) as session:
         yield session
@@ -0,0 +1,58 @@
+"""
+Core selects for hot read paths. Statements run straight on the session's
+connection, so rows skip ORM entity hydration, the identity map and
+attribute instrumentation, and come back as plain tuples or __slots__
+records that callers unpack into their response shape.
+"""
+from typing import List
+from sqlalchemy import select
+from sqlmodel import Session
+from models import Subscription, Paper, User, PaperPrice, Exclusion
+
+# Same order as readmodel.SubRec's constructor
+SUBSCRIPTION_COLUMNS = (Subscription.id, Subscription.user_id, Subscription.paper_id, Subscription.frequency,
+                        Subscription.weekday, Subscription.day_of_month, Subscription.start_date, Subscription.end_date,
+                        Subscription.weekdays, Subscription.month_days, Subscription.interval_days,
+                        Subscription.week_pattern)
+
+def tuples(s: Session, stmt) -> List[tuple]:
+    """Runs a Core select and returns its rows as plain tuples."""
+    return [tuple(r) for r in s.connection().execute(stmt)]
+
+def records(s: Session, stmt, cls) -> list:
+    """Runs a Core select and builds one `cls(*row)` per row."""
+    return [cls(*r) for r in s.connection().execute(stmt)]
+
+def subscriptions_with_names(user_id: int = None, paper_id: int = None):
+    """SUBSCRIPTION_COLUMNS followed by paper name, user name, flat and apartment."""
+    stmt = (
+        select(*SUBSCRIPTION_COLUMNS, Paper.name, User.name, User.flat_id, User.apt_name)
+        .join(Paper, Paper.id == Subscription.paper_id)
+        .join(User, User.id == Subscription.user_id)
+    )
+    if user_id:
+        stmt = stmt.where(Subscription.user_id == user_id)
+    if paper_id:
+        stmt = stmt.where(Subscription.paper_id == paper_id)
+    return stmt
+
+def user_subscriptions(user_id: int):
+    return select(*SUBSCRIPTION_COLUMNS).where(Subscription.user_id == user_id)
+
+def user_exclusions(user_id: int):
+    return select(Exclusion.paper_id, Exclusion.date_from, Exclusion.date_to).where(Exclusion.user_id == user_id)
+
+class PriceRec:
+    __slots__ = ("id", "paper_id", "day_of_week", "price", "effective_from", "effective_to")
+
+    def __init__(self, id, paper_id, day_of_week, price, effective_from, effective_to):
+        self.id = id
+        self.paper_id = paper_id
+        self.day_of_week = day_of_week
+        self.price = price
+        self.effective_from = effective_from
+        self.effective_to = effective_to
+
+def all_prices():
+    return select(PaperPrice.id, PaperPrice.paper_id, PaperPrice.day_of_week, PaperPrice.price,
+                  PaperPrice.effective_from, PaperPrice.effective_to)
@@ -0,0 +1,255 @@
+import os
+import socket
+import time
+import uuid
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock, Thread
+import orjson
+from sqlmodel import Session, select
+from sqlalchemy import delete, func, update, or_
+from models import Job
+from database import get_engine, get_tenant, current_agency, tenants
+from writer import run_write
+from config import config
+
+# Written to Job.owner by this process; unique across workers and restarts
+BOOT_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+UNFINISHED = ("queued", "running")
+
+class QueueFull(Exception):
+    pass
+
+def _json(value):
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY), "application/json", None
+
+def bulk_billing_job(params, progress):
+    from routes.billing import bulk_bills
+    return _json(bulk_bills(int(params["year"]), int(params["month"]), progress))
+
+def close_month_job(params, progress):
+    from routes.billing import run_month_close
+    return _json(run_month_close(int(params["year"]), int(params["month"]), bool(params.get("force")), progress))
+
+def pending_payments_job(params, progress):
+    from routes.billing import get_pending_payments
+    with Session(get_engine()) as s:
+        return _json(get_pending_payments(s, int(params["user_id"]), int(params["year"]), int(params["month"])))
+
+def bill_pdf_job(params, progress):
+    from routes.billing import build_bill, render_bill_pdf, bill_file_name, BillRequest
+    from models import User
+    user_id, year, month = int(params["user_id"]), int(params["year"]), int(params["month"])
+    with Session(get_engine()) as s:
+        user = s.get(User, user_id)
+        if not user:
+            raise ValueError(f"user {user_id} not found")
+        data = BillRequest(**build_bill(s, user_id, year, month))
+        return render_bill_pdf(user, data), "application/pdf", bill_file_name(user, year, month)
+
+def indent_pdf_job(params, progress):
+    from routes.indents import get_indent, render_indent_pdf, IndentPDFPayload
+    indent = get_indent(params.get("date"))
+    progress(0.5)
+    return render_indent_pdf(IndentPDFPayload(**indent)), "application/pdf", f"indents_{indent['date']}.pdf"
+
+def backup_job(params, progress):
+    from backup import snapshot, database_path, backup_dir
+    agency = current_agency.get()
+    return _json(snapshot(database_path(get_engine()), backup_dir(agency), params.get("keep"), progress))
+
+def archive_job(params, progress):
+    from archive import run_archive
+    return _json(run_archive(params.get("payment_months"), params.get("exclusion_days"), progress))
+
+JOB_TYPES = {
+    "bulk_billing": bulk_billing_job,
+    "close_month": close_month_job,
+    "pending_payments": pending_payments_job,
+    "bill_pdf": bill_pdf_job,
+    "indent_pdf": indent_pdf_job,
+    "backup": backup_job,
+    "archive": archive_job,
+}
+
+def lease_expired(now: float):
+    return or_(Job.heartbeat.is_(None), Job.heartbeat < now - config.get("job_lease_s", 60))
+
+def job_limits(job_type: str):
+    """(concurrent runs, queued jobs allowed) for a job type."""
+    return config.get("job_limits", {}).get(job_type, (1, 10))
+
+class JobRunner:
+    """
+    Runs jobs on a bounded thread pool. Each job type has its own limit on
+    concurrent runs and on how many may wait; submissions beyond the queue
+    depth are refused. Job state lives in the agency's job table, so queued
+    or interrupted jobs are picked up again after a restart. Jobs carry the
+    owning process and a heartbeat it refreshes while they are queued or
+    running, so several workers can share a job table.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.executor = None
+        self.lock = Lock()
+        self.waiting = defaultdict(deque)
+        self.running = defaultdict(int)
+        # agency -> ids of the jobs this process has queued or running
+        self.owned = defaultdict(set)
+        self.heartbeat = None
+        self.stopping = Event()
+
+    def submit(self, job_type: str, params: dict) -> Job:
+        now = time.time()
+        job = Job(id=uuid.uuid4().hex, type=job_type, params=orjson.dumps(params).decode(),
+                  status="queued", created_at=now, owner=BOOT_ID, heartbeat=now)
+        def work(s: Session):
+            # Counted in the table, inside the write transaction, so the limit holds across workers
+            queued = s.exec(select(func.count()).select_from(Job).where(Job.type == job_type, Job.status == "queued")).one()
+            if queued >= job_limits(job_type)[1]:
+                raise QueueFull(f"too many {job_type} jobs queued")
+            s.add(job); s.flush(); s.refresh(job)
+            return job
+        run_write(work)
+        self._enqueue(current_agency.get(), job.id, job_type)
+        return job
+
+    def recover(self):
+        """
+        Re-queues the current agency's unfinished jobs whose owner has not
+        heartbeated within the lease, i.e. whose process is gone. Jobs a live
+        worker holds are left alone.
+        """
+        now = time.time()
+        with Session(get_engine()) as s:
+            candidates = s.exec(select(Job.id, Job.type).where(Job.status.in_(UNFINISHED), lease_expired(now))
+                                .order_by(Job.created_at)).all()
+
+        def claim(s: Session):
+            # Guarded per job so two workers recovering at once never both take it
+            return [(job_id, job_type) for job_id, job_type in candidates if s.execute(
+                update(Job).where(Job.id == job_id, Job.status.in_(UNFINISHED), lease_expired(now))
+                .values(status="queued", owner=BOOT_ID, heartbeat=now)
+            ).rowcount]
+
+        claimed = run_write(claim) if candidates else []
+        for job_id, job_type in claimed:
+            self._enqueue(current_agency.get(), job_id, job_type)
+        return len(claimed)
+
+    def prune(self):
+        """Deletes the current agency's finished jobs, results included, once past `job_retention_days`."""
+        cutoff = time.time() - config.get("job_retention_days", 7) * 86400
+        return run_write(lambda s: s.execute(delete(Job).where(
+            Job.status.in_(("done", "failed")), Job.finished_at < cutoff)).rowcount)
+
+    def stop(self):
+        """Stops taking new work; jobs still waiting stay queued in their tables."""
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
+            self.stopping.set()
+            self.heartbeat = None
+            self.waiting.clear()
+            self.owned.clear()
+
+    def _enqueue(self, agency, job_id, job_type):
+        with self.lock:
+            self.waiting[job_type].append((agency, job_id))
+            self.owned[agency].add(job_id)
+        self._pump()
+
+    def _pump(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+            if self.heartbeat is None:
+                self.stopping = Event()
+                self.heartbeat = Thread(target=self._beat, args=(self.stopping,), name="job-heartbeat", daemon=True)
+                self.heartbeat.start()
+            for job_type, waiting in self.waiting.items():
+                limit = job_limits(job_type)[0]
+                while waiting and self.running[job_type] < limit:
+                    agency, job_id = waiting.popleft()
+                    self.running[job_type] += 1
+                    self.executor.submit(self._run, agency, job_id, job_type)
+
+    def _beat(self, stopping: Event):
+        while not stopping.wait(config.get("job_heartbeat_s", 10)):
+            with self.lock:
+                owned = {agency: list(ids) for agency, ids in self.owned.items() if ids}
+            for agency, ids in owned.items():
+                token = current_agency.set(agency)
+                try:
+                    now = time.time()
+                    run_write(lambda s: s.execute(update(Job).where(Job.id.in_(ids), Job.owner == BOOT_ID)
+                                                  .values(heartbeat=now)))
+                except Exception:
+                    # A missed beat is retried next interval, well inside the lease
+                    pass
+                finally:
+                    current_agency.reset(token)
+
+    def _run(self, agency, job_id, job_type):
+        token = current_agency.set(agency)
+        tenant = None
+        try:
+            tenant = tenants.acquire(agency)
+            self._execute(job_id, job_type)
+        finally:
+            if tenant is not None:
+                tenants.release(tenant)
+            current_agency.reset(token)
+            with self.lock:
+                self.running[job_type] -= 1
+                self.owned[agency].discard(job_id)
+            self._pump()
+
+    def _execute(self, job_id, job_type):
+        def claim(s: Session):
+            # Skip jobs another worker reclaimed or already started
+            return s.execute(
+                update(Job).where(Job.id == job_id, Job.status == "queued", Job.owner == BOOT_ID)
+                .values(status="running", started_at=time.time(), heartbeat=time.time(), progress=0.0)
+            ).rowcount
+        if not run_write(claim):
+            return
+        with Session(get_engine()) as s:
+            params = orjson.loads(s.get(Job, job_id).params)
+
+        last = [0.0]
+
+        def progress(fraction: float):
+            now = time.monotonic()
+            if now - last[0] < 0.5:
+                return
+            last[0] = now
+            run_write(lambda s: s.execute(update(Job).where(Job.id == job_id)
+                                          .values(progress=round(min(fraction, 1.0), 3))))
+
+        try:
+            body, media_type, file_name = JOB_TYPES[job_type](params, progress)
+            values = {"status": "done", "progress": 1.0, "result": body, "media_type": media_type, "file_name": file_name}
+        except Exception as exc:
+            values = {"status": "failed", "error": f"{type(exc).__name__}: {exc}"}
+        values["finished_at"] = time.time()
+        run_write(lambda s: s.execute(update(Job).where(Job.id == job_id).values(**values)))
+
+runner = JobRunner(config.get("job_workers", 2))
+
+def ensure_recovered():
+    """
+    Recovers the current agency's abandoned jobs, and prunes its expired
+    finished ones, at most once per lease period per process, so jobs of a
+    worker that died are picked up by the next job request to any other
+    worker.
+    """
+    tenant = get_tenant()
+    now = time.time()
+    if now - tenant.caches.get("jobs_recovered", 0) < config.get("job_lease_s", 60):
+        return
+    tenant.caches["jobs_recovered"] = now
+    runner.recover()
+    runner.prune()
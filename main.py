@@ -1,9 +1,15 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from database import engine, create_db_and_tables
-from routes import users, papers, subscriptions, exclusions, indents, billing,bill_payment_status,health
+from database import create_db_and_tables, tenants
+from config import config
+from writer import get_writer
+from tenancy import TenantMiddleware
+from serialization import ORJSONResponse, add_compression
+from jobs import runner, ensure_recovered
+import profiling
+from routes import users, papers, subscriptions, exclusions, indents, billing,bill_payment_status,health,analytics,admin,sync,jobs
 
-app = FastAPI(title="Newspaper Agency API")
+app = FastAPI(title="Newspaper Agency API", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -12,6 +18,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+add_compression(app)
+profiling.install(app)
+app.add_middleware(TenantMiddleware)
 
 app.include_router(users.router, prefix="/users", tags=["users"])
 app.include_router(papers.router, prefix="/papers", tags=["papers"])
@@ -21,8 +30,21 @@ app.include_router(indents.router, prefix="/indents", tags=["indents"])
 app.include_router(billing.router, prefix="/billing", tags=["billing"])
 app.include_router(bill_payment_status.router, prefix="/payment", tags=["billing"])
 app.include_router(health.router, prefix="/health", tags=["health"])
+app.include_router(analytics.router, prefix="/analytics", tags=["analytics"])
+app.include_router(admin.router, prefix="/admin", tags=["admin"])
+app.include_router(sync.router, prefix="/sync", tags=["sync"])
+app.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
 
 
 @app.on_event("startup")
 def on_startup():
     create_db_and_tables()
+    if config.get("single_writer"):
+        get_writer().start()
+    ensure_recovered()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    runner.stop()
+    for tenant in [tenants.default, *tenants.open.values()]:
+        tenant.close()
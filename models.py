@@ -1,4 +1,5 @@
 from sqlmodel import SQLModel, Field
+from sqlalchemy import Index
 from typing import Optional
 from datetime import date
 from enum import Enum
@@ -8,12 +9,13 @@ class Frequency(str, Enum):
     WEEKLY = 'weekly'
     MONTHLY = 'monthly'
     ALTERNATING = 'alternating'
+    CUSTOM = 'custom'
 
 class User(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str
-    mobile: str
-    flat_id: str
+    mobile: str = Field(index=True)
+    flat_id: str = Field(index=True)
     apt_name: str
 
 class Paper(SQLModel, table=True):
@@ -25,35 +27,119 @@ class PaperPrice(SQLModel, table=True):
     paper_id: int = Field(foreign_key="paper.id")
     day_of_week: Optional[int] = None
     price: float
-
-class PaperPriceView(SQLModel, table=True):
-    id: Optional[int] = Field(default=None, primary_key=True)
-    paper_id: int = Field(foreign_key="paper.id")
-    day_of_week: Optional[int] = None
-    price: float
+    effective_from: Optional[date] = None
+    effective_to: Optional[date] = None
 
 class Subscription(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    user_id: int = Field(foreign_key="user.id")
-    paper_id: int = Field(foreign_key="paper.id")
+    user_id: int = Field(foreign_key="user.id", index=True)
+    paper_id: int = Field(foreign_key="paper.id", index=True)
     frequency: Frequency
     weekday: Optional[int] = None
     day_of_month: Optional[int] = None
     start_date: Optional[date] = None
     end_date: Optional[date] = None
+    # Compiled schedule, see schedules.py; set from weekday/day_of_month unless CUSTOM
+    weekdays: Optional[int] = None
+    month_days: Optional[int] = None
+    interval_days: Optional[int] = None
+    week_pattern: Optional[str] = None
 
 class Exclusion(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    user_id: int = Field(foreign_key="user.id")
+    user_id: int = Field(foreign_key="user.id", index=True)
     paper_id: Optional[int] = Field(foreign_key="paper.id")
     date_from: date
     date_to: date
 
 class BillPaymentStatus(SQLModel, table=True):
+    __table_args__ = (Index("ix_billpaymentstatus_period", "year", "month"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id", nullable=False, index=True)
+    year: int
+    month: int
+    status: str
+    amount_paid: float = 0.0
+    balance: float = 0.0
+
+class BillPaymentStatusArchive(SQLModel, table=True):
+    # SQLite hands a moved row's id out again, so archived rows get their own and keep the old one here
     id: Optional[int] = Field(default=None, primary_key=True)
-    user_id: int = Field(foreign_key="user.id", nullable=False)
+    source_id: Optional[int] = None
+    user_id: int = Field(index=True)
     year: int
     month: int
     status: str
     amount_paid: float = 0.0
-    balance: float = 0.0
\ No newline at end of file
+    balance: float = 0.0
+    archived_at: float
+
+class ExclusionArchive(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    source_id: Optional[int] = None
+    user_id: int = Field(index=True)
+    paper_id: Optional[int] = None
+    date_from: date
+    date_to: date
+    archived_at: float
+
+class ArchiveState(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    # Paid months before year * 12 + month (0-based) have been archived
+    payments_before: int = 0
+    # Exclusions that ended before this date have been archived
+    exclusions_before: Optional[date] = None
+
+class CirculationSummary(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    year: int = Field(index=True)
+    month: int = Field(index=True)
+    user_id: int = Field(foreign_key="user.id", index=True)
+    paper_id: int = Field(foreign_key="paper.id")
+    apt_name: str
+    block: str
+    qty: int = 0
+    amount: float = 0.0
+
+class ChangeLog(SQLModel, table=True):
+    __table_args__ = {"sqlite_autoincrement": True}
+    seq: Optional[int] = Field(default=None, primary_key=True)
+    table_name: str
+    row_id: int
+    op: str
+    data: Optional[str] = None
+    ts: float = Field(index=True)
+
+class ChangeLogState(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    purged_through: int = 0
+
+class MonthClose(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    year: int
+    month: int
+    status: str
+    users_billed: int = 0
+    total_amount: float = 0.0
+    inserted: int = 0
+    updated: int = 0
+    skipped: int = 0
+    started_at: Optional[str] = None
+    duration_ms: float = 0.0
+
+class Job(SQLModel, table=True):
+    id: str = Field(primary_key=True)
+    type: str = Field(index=True)
+    params: str
+    status: str = Field(index=True)
+    progress: float = 0.0
+    error: Optional[str] = None
+    result: Optional[bytes] = None
+    media_type: Optional[str] = None
+    file_name: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # Process holding the job and its last sign of life; see jobs.JobRunner.recover
+    owner: Optional[str] = None
+    heartbeat: Optional[float] = None
@@ -0,0 +1,77 @@
+from bisect import bisect_right
+from datetime import date
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+from sqlmodel import Session
+from models import PaperPrice
+from database import get_tenant
+from fastread import records, all_prices, PriceRec
+from billcache import get_bill_cache
+
+class PriceTimeline:
+    """
+    Effective-dated prices of one paper. Each weekday slot (0-6, plus None
+    for the every-day default) keeps its prices sorted by effective_from so a
+    (weekday, date) lookup is one bisection.
+    """
+
+    def __init__(self, rows: List[PaperPrice]):
+        slots: Dict[Optional[int], list] = {}
+        for r in rows:
+            start = r.effective_from.toordinal() if r.effective_from else 0
+            end = r.effective_to.toordinal() if r.effective_to else None
+            slots.setdefault(r.day_of_week, []).append((start, r.id or 0, end, r.price))
+        self.slots = {}
+        for dow, entries in slots.items():
+            entries.sort()
+            self.slots[dow] = ([e[0] for e in entries], [(e[2], e[3]) for e in entries])
+
+    def _lookup(self, dow: Optional[int], ordinal: int) -> Optional[float]:
+        slot = self.slots.get(dow)
+        if slot is None:
+            return None
+        starts, values = slot
+        i = bisect_right(starts, ordinal) - 1
+        if i < 0:
+            return None
+        end, price = values[i]
+        if end is not None and ordinal > end:
+            return None
+        return price
+
+    def price_on(self, target: date) -> Tuple[float, bool]:
+        """Returns (price, is_day_specific) for the given date."""
+        ordinal = target.toordinal()
+        price = self._lookup(target.weekday(), ordinal)
+        if price is not None:
+            return price, True
+        return self._lookup(None, ordinal) or 0.0, False
+
+_lock = Lock()
+PRICES = ("prices",)
+
+def get_timelines(session: Session) -> Dict[int, PriceTimeline]:
+    """
+    Timelines for every paper of the current agency, loaded once and kept
+    while the cache's "prices" stamp is unchanged. With the shared cache
+    backend a price write in any worker moves the stamp for all of them.
+    """
+    tenant = get_tenant()
+    stamp = get_bill_cache(tenant).stamp(PRICES)
+    cached = tenant.caches.get("prices")
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    with _lock:
+        cached = tenant.caches.get("prices")
+        if cached is None or cached[0] != stamp:
+            by_paper: Dict[int, list] = {}
+            for r in records(session, all_prices(), PriceRec):
+                by_paper.setdefault(r.paper_id, []).append(r)
+            cached = tenant.caches["prices"] = (stamp, {paper_id: PriceTimeline(rows) for paper_id, rows in by_paper.items()})
+        return cached[1]
+
+def get_timeline(session: Session, paper_id: int) -> PriceTimeline:
+    return get_timelines(session).get(paper_id) or PriceTimeline([])
+
+def invalidate_prices():
+    get_bill_cache().invalidate({PRICES})
@@ -0,0 +1,310 @@
+"""
+On-demand profiling of single requests. With `profile_token` configured, a
+request carrying `X-Profile: <token>` (or `?_profile=<token>`) runs its
+endpoint under a deterministic tracer; the profile is saved with the route,
+parameters, SQL statements and timings and can be downloaded as pstats or
+speedscope JSON. Reading saved profiles back takes the same token in
+`X-Profile-Token`. Without a token nothing here is installed.
+"""
+import functools
+import hmac
+import inspect
+import json
+import marshal
+import os
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Optional
+from urllib.parse import parse_qs
+from fastapi import Header, HTTPException
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.concurrency import run_in_threadpool
+from config import config
+from database import current_agency
+
+HEADER = b"x-profile"
+# Sent separately from X-Profile so reading profiles does not record new ones
+TOKEN_HEADER = "X-Profile-Token"
+QUERY_FLAG = "_profile"
+
+active: ContextVar[Optional["RequestProfile"]] = ContextVar("active_profile", default=None)
+
+def profile_dir() -> str:
+    return config.get("profile_dir", "./profiles")
+
+class Tracer:
+    """
+    A sys.setprofile hook that keeps cProfile-style per-function stats and,
+    up to `max_events`, the open/close events speedscope draws.
+    """
+
+    def __init__(self, max_events: int):
+        self.max_events = max_events
+        self.frames = {}
+        self.events = []
+        self.truncated = False
+        self.stack = []
+        self.on_stack = {}
+        self.stats = {}
+        self.start = time.perf_counter_ns()
+        self.end = self.start
+
+    def _frame(self, key):
+        index = self.frames.get(key)
+        if index is None:
+            index = self.frames[key] = len(self.frames)
+        return index
+
+    def _open(self, key, now):
+        recorded = len(self.events) < self.max_events
+        self.stack.append([key, now, 0, recorded])
+        self.on_stack[key] = self.on_stack.get(key, 0) + 1
+        if recorded:
+            self.events.append(("O", self._frame(key), now - self.start))
+        else:
+            self.truncated = True
+
+    def _close(self, now):
+        key, started, children, recorded = self.stack.pop()
+        self.on_stack[key] -= 1
+        total = now - started
+        own = total - children
+        caller = self.stack[-1][0] if self.stack else None
+        if self.stack:
+            self.stack[-1][2] += total
+        recursive = self.on_stack[key] > 0
+        cc, nc, tt, ct, callers = self.stats.get(key, (0, 0, 0, 0, {}))
+        self.stats[key] = (cc + (not recursive), nc + 1, tt + own, ct + (0 if recursive else total), callers)
+        if caller is not None:
+            c_cc, c_nc, c_tt, c_ct = callers.get(caller, (0, 0, 0, 0))
+            callers[caller] = (c_cc + (not recursive), c_nc + 1, c_tt + own, c_ct + (0 if recursive else total))
+        if recorded:
+            self.events.append(("C", self._frame(key), now - self.start))
+
+    def __call__(self, frame, what, arg):
+        now = time.perf_counter_ns()
+        if what == "call":
+            code = frame.f_code
+            self._open((code.co_filename, code.co_firstlineno, code.co_name), now)
+        elif what == "c_call":
+            self._open(("~", 0, f"<built-in {getattr(arg, '__qualname__', repr(arg))}>"), now)
+        elif self.stack:
+            self._close(now)
+
+    def run(self, call, args, kwargs):
+        sys.setprofile(self)
+        try:
+            return call(*args, **kwargs)
+        finally:
+            sys.setprofile(None)
+            self.end = time.perf_counter_ns()
+            # The c_call for sys.setprofile(None) is never matched by a c_return
+            while self.stack:
+                self._close(self.end)
+
+    def pstats(self) -> dict:
+        """Stats in the layout pstats.Stats loads, times in seconds."""
+        seconds = lambda ns: ns / 1e9
+        return {key: (cc, nc, seconds(tt), seconds(ct),
+                      {c: (a, b, seconds(t), seconds(u)) for c, (a, b, t, u) in callers.items()})
+                for key, (cc, nc, tt, ct, callers) in self.stats.items()}
+
+    def speedscope(self, name: str) -> dict:
+        frames = [None] * len(self.frames)
+        for (file, line, func), index in self.frames.items():
+            frames[index] = {"name": func, "file": file, "line": line} if file != "~" else {"name": func}
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "newspaper-agency",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "evented",
+                "name": name,
+                "unit": "nanoseconds",
+                "startValue": 0,
+                "endValue": self.end - self.start,
+                "events": [{"type": t, "frame": f, "at": at} for t, f, at in self.events],
+            }],
+        }
+
+class RequestProfile:
+    def __init__(self, scope):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.params = {k: v if len(v) > 1 else v[0]
+                       for k, v in parse_qs(scope.get("query_string", b"").decode("latin-1")).items() if k != QUERY_FLAG}
+        self.agency = current_agency.get()
+        self.sql = []
+        self.tracer = None
+        self.endpoint_ms = None
+        self.started = time.perf_counter()
+
+    def run_endpoint(self, call, args, kwargs):
+        self.tracer = Tracer(config.get("profile_max_events", 500_000))
+        started = time.perf_counter()
+        try:
+            return self.tracer.run(call, args, kwargs)
+        finally:
+            self.endpoint_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    def save(self, route: Optional[str], status: int):
+        directory = profile_dir()
+        os.makedirs(directory, exist_ok=True)
+        sql_ms = sum(q["ms"] for q in self.sql)
+        meta = {
+            "id": self.id,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "agency": self.agency,
+            "method": self.method,
+            "path": self.path,
+            "route": route,
+            "params": self.params,
+            "status": status,
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "endpoint_ms": self.endpoint_ms,
+            "sql_count": len(self.sql),
+            "sql_ms": round(sql_ms, 2),
+            "truncated": bool(self.tracer and self.tracer.truncated),
+            "sql": self.sql,
+        }
+        base = os.path.join(directory, self.id)
+        if self.tracer is not None:
+            with open(base + ".prof", "wb") as f:
+                marshal.dump(self.tracer.pstats(), f)
+            with open(base + ".speedscope.json", "w") as f:
+                json.dump(self.tracer.speedscope(f"{self.method} {route or self.path}"), f)
+        with open(base + ".json", "w") as f:
+            json.dump(meta, f, indent=1, default=str)
+        rotate(config.get("profile_keep", 50))
+        return meta
+
+def list_profiles() -> list:
+    directory = profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in os.listdir(directory):
+        if name.endswith(".json") and not name.endswith(".speedscope.json"):
+            with open(os.path.join(directory, name)) as f:
+                profiles.append(json.load(f))
+    return sorted(profiles, key=lambda p: p["created_at"], reverse=True)
+
+def profile_path(profile_id: str, suffix: str) -> Optional[str]:
+    if not profile_id.isalnum():
+        return None
+    path = os.path.join(profile_dir(), profile_id + suffix)
+    return path if os.path.exists(path) else None
+
+def rotate(keep: int):
+    for meta in list_profiles()[keep:]:
+        for suffix in (".json", ".prof", ".speedscope.json"):
+            path = profile_path(meta["id"], suffix)
+            if path:
+                os.remove(path)
+
+_listeners = {"count": 0}
+_listeners_lock = threading.Lock()
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if active.get() is not None:
+        conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = active.get()
+    started = conn.info.get("profile_started")
+    if profile is not None and started:
+        profile.sql.append({"statement": " ".join(statement.split()), "params": repr(parameters)[:300],
+                            "ms": round((time.perf_counter() - started.pop()) * 1000, 3)})
+
+def _listen(on: bool):
+    # SQL hooks are only attached while some request is being profiled
+    with _listeners_lock:
+        _listeners["count"] += 1 if on else -1
+        if on and _listeners["count"] == 1:
+            event.listen(Engine, "before_cursor_execute", _before_execute)
+            event.listen(Engine, "after_cursor_execute", _after_execute)
+        elif not on and _listeners["count"] == 0:
+            event.remove(Engine, "before_cursor_execute", _before_execute)
+            event.remove(Engine, "after_cursor_execute", _after_execute)
+
+class ProfileMiddleware:
+    """Starts a RequestProfile for requests that carry the profile token."""
+
+    def __init__(self, app, token: str):
+        self.app = app
+        self.token = token
+
+    def requested(self, scope) -> bool:
+        for key, value in scope.get("headers", []):
+            if key == HEADER:
+                return value.decode("latin-1") == self.token
+        query = scope.get("query_string", b"")
+        return QUERY_FLAG.encode() in query and parse_qs(query.decode("latin-1")).get(QUERY_FLAG) == [self.token]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.requested(scope):
+            return await self.app(scope, receive, send)
+        profile = RequestProfile(scope)
+        status = {}
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message = dict(message, headers=[*message.get("headers", []), (b"x-profile-id", profile.id.encode())])
+            await send(message)
+
+        token = active.set(profile)
+        _listen(True)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _listen(False)
+            active.reset(token)
+            route = scope.get("route")
+            await run_in_threadpool(profile.save, getattr(route, "path", None), status.get("code", 500))
+
+def profiled(call):
+    """Wraps a sync endpoint so it runs under the tracer when its request is profiled."""
+    @functools.wraps(call)
+    def run(*args, **kwargs):
+        profile = active.get()
+        if profile is None:
+            return call(*args, **kwargs)
+        return profile.run_endpoint(call, args, kwargs)
+    run.profiled = True
+    return run
+
+class ProfiledRoute(APIRoute):
+    """
+    Sync endpoints run on threadpool threads, so the tracer is switched on
+    inside the endpoint call rather than in the middleware. Async endpoints
+    share the event loop with other requests and are only timed. Without a
+    profile token this is a plain APIRoute.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        if config.get("profile_token") and not inspect.iscoroutinefunction(endpoint) \
+                and not getattr(endpoint, "profiled", False):
+            endpoint = profiled(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+def require_profile_token(x_profile_token: Optional[str] = Header(None, alias=TOKEN_HEADER)):
+    """Dependency for the profile endpoints: 404 with profiling off, 403 without the token."""
+    token = config.get("profile_token")
+    if not token:
+        raise HTTPException(status_code=404, detail="Profiling is not enabled")
+    if x_profile_token is None or not hmac.compare_digest(x_profile_token.encode(), token.encode()):
+        raise HTTPException(status_code=403, detail=f"{TOKEN_HEADER} header missing or wrong")
+
+def install(app):
+    """Adds the middleware; does nothing unless `profile_token` is set."""
+    token = config.get("profile_token")
+    if token:
+        app.add_middleware(ProfileMiddleware, token=token)
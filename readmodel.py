@@ -0,0 +1,200 @@
+from datetime import date
+from threading import Lock
+from typing import Dict, List, Optional
+import orjson
+from sqlmodel import Session, select
+from models import User, Paper, Exclusion, Frequency, ChangeLog
+from changes import latest_seq, purged_through
+from database import get_tenant
+from fastread import records, SUBSCRIPTION_COLUMNS
+
+class UserRec:
+    __slots__ = ("id", "name", "mobile", "flat_id", "apt_name", "block")
+
+    def __init__(self, id, name, mobile, flat_id, apt_name):
+        self.id = id
+        self.name = name
+        self.mobile = mobile
+        self.flat_id = flat_id
+        self.apt_name = apt_name
+        self.block = flat_id[0] if flat_id else ""
+
+class PaperRec:
+    __slots__ = ("id", "name")
+
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+class SubRec:
+    __slots__ = ("id", "user_id", "paper_id", "frequency", "weekday", "day_of_month", "start_date", "end_date",
+                 "weekdays", "month_days", "interval_days", "week_pattern", "schedule")
+
+    def __init__(self, id, user_id, paper_id, frequency, weekday, day_of_month, start_date, end_date,
+                 weekdays=None, month_days=None, interval_days=None, week_pattern=None):
+        self.id = id
+        self.user_id = user_id
+        self.paper_id = paper_id
+        self.frequency = Frequency(frequency)
+        self.weekday = weekday
+        self.day_of_month = day_of_month
+        self.start_date = start_date
+        self.end_date = end_date
+        self.weekdays = weekdays
+        self.month_days = month_days
+        self.interval_days = interval_days
+        self.week_pattern = week_pattern
+        self.schedule = None
+
+class ExclusionRec:
+    __slots__ = ("id", "user_id", "paper_id", "date_from", "date_to")
+
+    def __init__(self, id, user_id, paper_id, date_from, date_to):
+        self.id = id
+        self.user_id = user_id
+        self.paper_id = paper_id
+        self.date_from = date_from
+        self.date_to = date_to
+
+def _date(value):
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+class ReadModel:
+    """
+    Users, papers, subscriptions and exclusions held as __slots__ records,
+    indexed by user, paper and (apt_name, block). It is built once from the
+    tables and then kept current by replaying the change log, so a request
+    pays one max(seq) query instead of re-hydrating ORM objects.
+    """
+
+    def __init__(self):
+        self.seq = 0
+        self.users: Dict[int, UserRec] = {}
+        self.papers: Dict[int, PaperRec] = {}
+        self.subs: Dict[int, SubRec] = {}
+        self.exclusions: Dict[int, ExclusionRec] = {}
+        self.subs_by_user: Dict[int, Dict[int, SubRec]] = {}
+        self.subs_by_paper: Dict[int, Dict[int, SubRec]] = {}
+        self.exclusions_by_user: Dict[int, Dict[int, ExclusionRec]] = {}
+        self.users_by_block: Dict[tuple, Dict[int, UserRec]] = {}
+        self.lock = Lock()
+
+    def load(self, s: Session):
+        self.seq = latest_seq(s)
+        for u in records(s, select(User.id, User.name, User.mobile, User.flat_id, User.apt_name), UserRec):
+            self._put_user(u)
+        for p in records(s, select(Paper.id, Paper.name), PaperRec):
+            self.papers[p.id] = p
+        for sub in records(s, select(*SUBSCRIPTION_COLUMNS), SubRec):
+            self._put_sub(sub)
+        for e in records(s, select(Exclusion.id, Exclusion.user_id, Exclusion.paper_id,
+                                   Exclusion.date_from, Exclusion.date_to), ExclusionRec):
+            self._put_exclusion(e)
+
+    def refresh(self, s: Session) -> "ReadModel":
+        """
+        Applies changes logged since the last refresh. Returns a freshly
+        loaded model instead when the log no longer reaches back that far.
+        """
+        head = latest_seq(s)
+        if head <= self.seq:
+            return self
+        with self.lock:
+            if head <= self.seq:
+                return self
+            if self.seq < purged_through(s):
+                fresh = ReadModel()
+                fresh.load(s)
+                return fresh
+            changes = s.exec(
+                select(ChangeLog).where(ChangeLog.seq > self.seq, ChangeLog.seq <= head).order_by(ChangeLog.seq)
+            ).all()
+            for c in changes:
+                self.apply(c.table_name, c.op, c.row_id, orjson.loads(c.data) if c.data else None)
+            self.seq = head
+        return self
+
+    def apply(self, table: str, op: str, row_id: int, data: Optional[dict]):
+        if table == "user":
+            self._drop_user(row_id)
+            if op != "delete":
+                self._put_user(UserRec(row_id, data["name"], data["mobile"], data["flat_id"], data["apt_name"]))
+        elif table == "paper":
+            self.papers.pop(row_id, None)
+            if op != "delete":
+                self.papers[row_id] = PaperRec(row_id, data["name"])
+        elif table == "subscription":
+            self._drop_sub(row_id)
+            if op != "delete":
+                self._put_sub(SubRec(row_id, data["user_id"], data["paper_id"], data["frequency"], data["weekday"],
+                                     data["day_of_month"], _date(data["start_date"]), _date(data["end_date"]),
+                                     data.get("weekdays"), data.get("month_days"), data.get("interval_days"),
+                                     data.get("week_pattern")))
+        elif table == "exclusion":
+            self._drop_exclusion(row_id)
+            if op != "delete":
+                self._put_exclusion(ExclusionRec(row_id, data["user_id"], data["paper_id"],
+                                                 _date(data["date_from"]), _date(data["date_to"])))
+
+    def _put_user(self, u: UserRec):
+        self.users[u.id] = u
+        self.users_by_block.setdefault((u.apt_name, u.block), {})[u.id] = u
+
+    def _drop_user(self, user_id: int):
+        u = self.users.pop(user_id, None)
+        if u:
+            self.users_by_block.get((u.apt_name, u.block), {}).pop(user_id, None)
+
+    def _put_sub(self, sub: SubRec):
+        self.subs[sub.id] = sub
+        self.subs_by_user.setdefault(sub.user_id, {})[sub.id] = sub
+        self.subs_by_paper.setdefault(sub.paper_id, {})[sub.id] = sub
+
+    def _drop_sub(self, sub_id: int):
+        sub = self.subs.pop(sub_id, None)
+        if sub:
+            self.subs_by_user.get(sub.user_id, {}).pop(sub_id, None)
+            self.subs_by_paper.get(sub.paper_id, {}).pop(sub_id, None)
+
+    def _put_exclusion(self, e: ExclusionRec):
+        self.exclusions[e.id] = e
+        self.exclusions_by_user.setdefault(e.user_id, {})[e.id] = e
+
+    def _drop_exclusion(self, exclusion_id: int):
+        e = self.exclusions.pop(exclusion_id, None)
+        if e:
+            self.exclusions_by_user.get(e.user_id, {}).pop(exclusion_id, None)
+
+    def subscriptions_of(self, user_id: int) -> List[SubRec]:
+        return list(self.subs_by_user.get(user_id, {}).values())
+
+    def is_excluded(self, user_id: int, paper_id: int, target: date):
+        for e in list(self.exclusions_by_user.get(user_id, {}).values()):
+            if e.paper_id is not None and e.paper_id != paper_id: continue
+            if e.date_from <= target <= e.date_to:
+                return True
+        return False
+
+_load_lock = Lock()
+
+def get_read_model(s: Session) -> Optional[ReadModel]:
+    """
+    The current agency's read model, brought up to date, or None when the
+    read model is switched off in config.
+    """
+    tenant = get_tenant()
+    if not tenant.config.get("read_model"):
+        return None
+    model = tenant.caches.get("read_model")
+    if model is None:
+        with _load_lock:
+            model = tenant.caches.get("read_model")
+            if model is None:
+                model = ReadModel()
+                model.load(s)
+                tenant.caches["read_model"] = model
+                return model
+    fresh = model.refresh(s)
+    if fresh is not model:
+        tenant.caches["read_model"] = fresh
+    return fresh
@@ -0,0 +1,138 @@
+import os
+from fastapi import APIRouter, Depends, HTTPException, Response
+from profiling import ProfiledRoute
+from fastapi.responses import FileResponse
+from sqlmodel import Session, select
+from sqlalchemy import func
+from database import tenants, current_agency
+from backup import backup_dir, list_snapshots, verify
+from profiling import list_profiles, profile_path, require_profile_token
+from schedules import merge_weekly_rows
+from writer import run_write
+from routes.jobs import submit_job, JobRequest
+from models import User, Subscription, BillPaymentStatus, CirculationSummary
+
+router = APIRouter(route_class=ProfiledRoute)
+
+def agency_summary(name, year: int = None, month: int = None):
+    with tenants.reading(name) as tenant:
+        return summarize(tenant, name, year, month)
+
+def summarize(tenant, name, year: int = None, month: int = None):
+    with Session(tenant.engine) as s:
+        users = s.exec(select(func.count(User.id))).one()
+        subscriptions = s.exec(select(func.count(Subscription.id))).one()
+        outstanding = s.exec(
+            select(func.coalesce(func.sum(BillPaymentStatus.balance), 0.0))
+            .where(BillPaymentStatus.status != "paid")
+        ).one()
+        revenue_stmt = select(func.coalesce(func.sum(CirculationSummary.amount), 0.0))
+        if year:
+            revenue_stmt = revenue_stmt.where(CirculationSummary.year == year)
+        if month:
+            revenue_stmt = revenue_stmt.where(CirculationSummary.month == month)
+        revenue = s.exec(revenue_stmt).one()
+    return {
+        "agency": name or "default",
+        "agency_name": tenant.config.get("agency_name"),
+        "users": users,
+        "subscriptions": subscriptions,
+        "outstanding": round(float(outstanding), 2),
+        "billed": round(float(revenue), 2)
+    }
+
+@router.get("/agencies")
+def list_agencies():
+    open_now = set(tenants.open)
+    return [{"agency": name, "open": name in open_now} for name in tenants.known()]
+
+@router.get("/summary")
+def cross_agency_summary(year: int = None, month: int = None, include_default: bool = True):
+    """
+    Headline numbers for every agency side by side, plus a grand total.
+    `billed` comes from the analytics summary so it only covers billed months.
+    """
+    names = ([None] if include_default else []) + tenants.known()
+    rows = [agency_summary(name, year, month) for name in names]
+    total = {"agency": "all", "agency_name": None}
+    for key in ("users", "subscriptions", "outstanding", "billed"):
+        total[key] = round(sum(r[key] for r in rows), 2)
+    return {"agencies": rows, "total": total}
+
+@router.post("/backup", status_code=202)
+def start_backup(response: Response, keep: int = None):
+    """
+    Snapshots the agency database in the background with the online backup
+    API; follow the returned job for progress and the snapshot manifest.
+    """
+    return submit_job(JobRequest(type="backup", params={"keep": keep} if keep is not None else {}), response)
+
+@router.get("/backups")
+def list_backups():
+    return list_snapshots(backup_dir(current_agency.get()))
+
+@router.post("/backups/{file_name}/verify")
+def verify_backup(file_name: str):
+    """Restores the snapshot into a scratch file and checks it against its manifest."""
+    directory = backup_dir(current_agency.get())
+    if file_name not in {m["file"] for m in list_snapshots(directory)}:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    return verify(os.path.join(directory, file_name))
+
+@router.post("/archive", status_code=202)
+def start_archive(response: Response, payment_months: int = None, exclusion_days: int = None):
+    """
+    Moves closed payment months and ended exclusions into the archive tables
+    as a background job. Reads pass history=true to include archived rows.
+    """
+    params = {"payment_months": payment_months, "exclusion_days": exclusion_days}
+    return submit_job(JobRequest(type="archive", params={k: v for k, v in params.items() if v is not None}), response)
+
+@router.post("/schedules/merge")
+def merge_schedules(dry_run: bool = True):
+    """
+    Folds WEEKLY subscriptions split across weekdays (one row per day for
+    the same user, paper and dates) into single CUSTOM rows with a weekday
+    mask. Reports what it would merge unless dry_run=false.
+    """
+    return run_write(lambda s: merge_weekly_rows(s, dry_run))
+
+# Profiles hold request parameters and SQL, so reading them needs the profile token
+profile_access = [Depends(require_profile_token)]
+
+@router.get("/profiles", dependencies=profile_access)
+def list_request_profiles(limit: int = 20):
+    """
+    Recent profiled requests, newest first. Profile a request by sending the
+    configured token in the X-Profile header or as ?_profile=; read them
+    back with the same token in X-Profile-Token.
+    """
+    agency = current_agency.get()
+    return [{k: v for k, v in p.items() if k != "sql"} for p in list_profiles() if p["agency"] == agency][:limit]
+
+def find_profile(profile_id: str) -> dict:
+    for p in list_profiles():
+        if p["id"] == profile_id and p["agency"] == current_agency.get():
+            return p
+    raise HTTPException(status_code=404, detail="Profile not found")
+
+@router.get("/profiles/{profile_id}", dependencies=profile_access)
+def get_request_profile(profile_id: str):
+    """The profile's route, parameters, timings and every SQL statement it ran."""
+    return find_profile(profile_id)
+
+@router.get("/profiles/{profile_id}/download", dependencies=profile_access)
+def download_request_profile(profile_id: str, format: str = "pstats"):
+    """
+    The call profile as a pstats file (python -m pstats, snakeviz) or as
+    speedscope JSON (https://www.speedscope.app).
+    """
+    find_profile(profile_id)
+    suffixes = {"pstats": (".prof", "application/octet-stream"), "speedscope": (".speedscope.json", "application/json")}
+    if format not in suffixes:
+        raise HTTPException(status_code=400, detail="format must be pstats or speedscope")
+    suffix, media_type = suffixes[format]
+    path = profile_path(profile_id, suffix)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile has no call data")
+    return FileResponse(path, media_type=media_type, filename=profile_id + suffix)
@@ -0,0 +1,152 @@
+from fastapi import APIRouter
+from profiling import ProfiledRoute
+from sqlmodel import Session, select
+from sqlalchemy import delete, func
+from database import get_engine
+from writer import run_write
+from models import CirculationSummary, Paper, User
+from collections import defaultdict
+
+router = APIRouter(route_class=ProfiledRoute)
+
+MONTH_NAMES = ["Jan", "Feb", "Mar", "Apr", "May", "Jun",
+               "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+def store_circulation(session: Session, user: User, year: int, month: int, per_paper: dict):
+    """
+    Replaces the summary rows of one user for one month with the freshly
+    computed per-paper (qty, amount). Called from month close and
+    /analytics/refresh only, never while serving a bill. Caller commits.
+    """
+    session.exec(delete(CirculationSummary).where(
+        CirculationSummary.user_id == user.id,
+        CirculationSummary.year == year,
+        CirculationSummary.month == month
+    ))
+    block = user.flat_id[0] if user.flat_id else ""
+    for paper_id, (qty, amount) in per_paper.items():
+        session.add(CirculationSummary(
+            year=year, month=month, user_id=user.id, paper_id=paper_id,
+            apt_name=user.apt_name, block=block, qty=qty, amount=round(amount, 2)
+        ))
+
+@router.post("/refresh")
+def refresh_summary(year: int, month: int):
+    from routes.billing import compute_bill_items
+    def work(s: Session):
+        users = s.exec(select(User)).all()
+        for user in users:
+            _, _, per_paper = compute_bill_items(s, user.id, year, month)
+            store_circulation(s, user, year, month, per_paper)
+        return {"year": year, "month": month, "users": len(users)}
+    return run_write(work)
+
+@router.get("/revenue")
+def revenue_by_paper(year: int, month: int = None):
+    with Session(get_engine()) as s:
+        stmt = (
+            select(
+                CirculationSummary.year,
+                CirculationSummary.month,
+                CirculationSummary.paper_id,
+                Paper.name,
+                func.sum(CirculationSummary.qty),
+                func.sum(CirculationSummary.amount)
+            )
+            .join(Paper, Paper.id == CirculationSummary.paper_id)
+            .where(CirculationSummary.year == year)
+            .group_by(CirculationSummary.year, CirculationSummary.month, CirculationSummary.paper_id)
+            .order_by(CirculationSummary.month, CirculationSummary.paper_id)
+        )
+        if month:
+            stmt = stmt.where(CirculationSummary.month == month)
+        results = s.exec(stmt).all()
+    return [
+        {
+            "year": r[0],
+            "month": MONTH_NAMES[r[1] - 1],
+            "paper_id": r[2],
+            "paper_name": r[3],
+            "qty": r[4],
+            "amount": round(r[5], 2)
+        }
+        for r in results
+    ]
+
+@router.get("/circulation")
+def circulation_by_block(year: int, month: int, apt_name: str = None):
+    with Session(get_engine()) as s:
+        stmt = (
+            select(
+                CirculationSummary.apt_name,
+                CirculationSummary.block,
+                Paper.name,
+                func.sum(CirculationSummary.qty),
+                func.sum(CirculationSummary.amount),
+                func.count(CirculationSummary.user_id)
+            )
+            .join(Paper, Paper.id == CirculationSummary.paper_id)
+            .where(CirculationSummary.year == year, CirculationSummary.month == month)
+            .group_by(CirculationSummary.apt_name, CirculationSummary.block, CirculationSummary.paper_id)
+            .order_by(CirculationSummary.apt_name, CirculationSummary.block, Paper.name)
+        )
+        if apt_name:
+            stmt = stmt.where(CirculationSummary.apt_name == apt_name)
+        results = s.exec(stmt).all()
+    return [
+        {
+            "apt_name": r[0],
+            "block": r[1],
+            "paper": r[2],
+            "qty": r[3],
+            "amount": round(r[4], 2),
+            "subscribers": r[5]
+        }
+        for r in results
+    ]
+
+@router.get("/churn")
+def churn_by_month(year: int, paper_id: int = None):
+    """
+    Subscribers per paper per month with the number gained and lost compared
+    to the previous month. December of the previous year is the baseline.
+    """
+    with Session(get_engine()) as s:
+        stmt = (
+            select(
+                CirculationSummary.year,
+                CirculationSummary.month,
+                CirculationSummary.paper_id,
+                CirculationSummary.user_id
+            )
+            .where(
+                ((CirculationSummary.year == year) | ((CirculationSummary.year == year - 1) & (CirculationSummary.month == 12))),
+                CirculationSummary.qty > 0
+            )
+        )
+        if paper_id:
+            stmt = stmt.where(CirculationSummary.paper_id == paper_id)
+        results = s.exec(stmt).all()
+        papers = {p.id: p.name for p in s.exec(select(Paper)).all()}
+
+    readers = defaultdict(set)
+    for r in results:
+        month = 0 if r[0] == year - 1 else r[1]
+        readers[(r[2], month)].add(r[3])
+
+    months = sorted({k[1] for k in readers if k[1] > 0})
+    rows = []
+    for pid in sorted({k[0] for k in readers}):
+        for month in months:
+            cur = readers.get((pid, month), set())
+            prev = readers.get((pid, month - 1), set())
+            rows.append({
+                "year": year,
+                "month": MONTH_NAMES[month - 1],
+                "paper_id": pid,
+                "paper_name": papers.get(pid),
+                "subscribers": len(cur),
+                "gained": len(cur - prev),
+                "lost": len(prev - cur)
+            })
+    return rows
@@ -1,71 +1,101 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, HTTPException
+from profiling import ProfiledRoute
 from sqlmodel import Session, select
-from models import BillPaymentStatus,User
-from database import get_session
-from database import engine
+from models import BillPaymentStatus,BillPaymentStatusArchive,User,CirculationSummary,MonthClose
+from database import get_engine
+from writer import run_write
 from typing import List
-from sqlalchemy import insert
+from sqlalchemy import insert, and_, case, func, literal, union_all
+from fastapi.responses import StreamingResponse
+from datetime import date
+from io import StringIO
+import csv
+from schemas import PaymentStatusWithName
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 MONTH_NAMES = ["Jan", "Feb", "Mar", "Apr", "May", "Jun",
                "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
 
 @router.post("/", response_model=BillPaymentStatus)
-def create_payment_status(
-    payment_status: BillPaymentStatus,
-    session: Session = Depends(get_session)
-):
+def create_payment_status(payment_status: BillPaymentStatus):
     print("Creating payment status:", payment_status)
-    # Prevent duplicate entries for same month & user
-    statement = select(BillPaymentStatus).where(
-        BillPaymentStatus.user_id == payment_status.user_id,
-        BillPaymentStatus.year == payment_status.year,
-        BillPaymentStatus.month == payment_status.month
-    )
-    existing = session.exec(statement).first()
-    if existing:
-        raise HTTPException(status_code=400, detail="Payment status already exists for this month")
-    session.add(payment_status)
-    session.commit()
-    session.refresh(payment_status)
-    return payment_status
-
-@router.post("/bulk")
-def create_bulk_payment_status(payment_statuses: List[BillPaymentStatus],session: Session = Depends(get_session)):
-    for payment_status in payment_statuses:
-        print("Creating payment status:", payment_status)
+    def work(session: Session):
         # Prevent duplicate entries for same month & user
         statement = select(BillPaymentStatus).where(
             BillPaymentStatus.user_id == payment_status.user_id,
             BillPaymentStatus.year == payment_status.year,
             BillPaymentStatus.month == payment_status.month
         )
+        archived = session.exec(select(BillPaymentStatusArchive.id).where(
+            BillPaymentStatusArchive.user_id == payment_status.user_id,
+            BillPaymentStatusArchive.year == payment_status.year,
+            BillPaymentStatusArchive.month == payment_status.month
+        )).first()
         existing = session.exec(statement).first()
-        if existing:
-            continue
+        if existing or archived:
+            raise HTTPException(status_code=400, detail="Payment status already exists for this month")
         session.add(payment_status)
-        session.commit()
-        session.refresh(payment_status)
+        session.flush()
+        return payment_status
+    return run_write(work)
+
+@router.post("/bulk")
+def create_bulk_payment_status(payment_statuses: List[BillPaymentStatus]):
+    def work(session: Session):
+        # Prevent duplicate entries for same month & user
+        years = {p.year for p in payment_statuses}
+        existing = set(session.exec(
+            select(BillPaymentStatus.user_id, BillPaymentStatus.year, BillPaymentStatus.month)
+            .where(BillPaymentStatus.year.in_(years))
+        ).all())
+        existing |= set(session.exec(
+            select(BillPaymentStatusArchive.user_id, BillPaymentStatusArchive.year, BillPaymentStatusArchive.month)
+            .where(BillPaymentStatusArchive.year.in_(years))
+        ).all())
+        for payment_status in payment_statuses:
+            key = (payment_status.user_id, payment_status.year, payment_status.month)
+            if key in existing:
+                continue
+            existing.add(key)
+            session.add(payment_status)
+    run_write(work)
     return {"message": "Bulk payment status created successfully", "count": len(payment_statuses)}
 
-@router.get("/")
-def get_payment_status():
-    with Session(engine) as s:
-        results = (
+def query_payments(s: Session, table, user_id: int = None, year: int = None, month: int = None):
+    results = (
         s.query(
-            BillPaymentStatus.id,
-            BillPaymentStatus.user_id,
-            BillPaymentStatus.year,
-            BillPaymentStatus.month,
-            BillPaymentStatus.status,
-            BillPaymentStatus.amount_paid,
-            BillPaymentStatus.balance,
+            table.id,
+            table.user_id,
+            table.year,
+            table.month,
+            table.status,
+            table.amount_paid,
+            table.balance,
             User.name.label("user_name")
         )
-        .join(User,User.id == BillPaymentStatus.user_id)
-        .all()
-        )
+        .join(User,User.id == table.user_id)
+    )
+    if user_id:
+        results = results.filter(table.user_id == user_id)
+    if year:
+        results = results.filter(table.year == year)
+    if month:
+        results = results.filter(table.month == month - 1)
+    return results.order_by(table.id).all()
+
+def payment_rows(user_id: int = None, year: int = None, month: int = None, history: bool = False):
+    """Live payment status rows, plus archived months when `history` is set."""
+    with Session(get_engine()) as s:
+        results = query_payments(s, BillPaymentStatus, user_id, year, month)
+        if history:
+            results = sorted(results + query_payments(s, BillPaymentStatusArchive, user_id, year, month),
+                             key=lambda r: r.id)
+    return results
+
+@router.get("/", response_model=List[PaymentStatusWithName])
+def get_payment_status(history: bool = False):
+    results = payment_rows(history=history)
 
     # Convert SQLAlchemy rows to list of dicts for Pydantic
     rows = [
@@ -83,26 +113,12 @@ def get_payment_status():
     ]
     return rows
 
-@router.get("/by-filter")
-def get_user_by_filter(user_id: int = None, year: int = None,month :int= None):
-    with Session(engine) as s:
-        results = (
-        s.query(
-            BillPaymentStatus.id,
-            BillPaymentStatus.user_id,
-            BillPaymentStatus.year,
-            BillPaymentStatus.month,
-            BillPaymentStatus.status,
-            BillPaymentStatus.amount_paid,
-            BillPaymentStatus.balance,
-            User.name.label("user_name")
-        )
-        .join(User,User.id == BillPaymentStatus.user_id)
-        .all()
-    )
+@router.get("/by-filter", response_model=List[PaymentStatusWithName])
+def get_user_by_filter(user_id: int = None, year: int = None,month :int= None, history: bool = False):
+    results = payment_rows(user_id, year, month, history)
 
     # Convert SQLAlchemy rows to list of dicts for Pydantic
-    rows = [
+    return [
         {
             "id": r.id,
             "month": MONTH_NAMES[r.month] if r.month else None,
@@ -115,18 +131,10 @@ def get_user_by_filter(user_id: int = None, year: int = None,month :int= None):
         }
         for r in results
     ]
-    if user_id:
-        rows = [r for r in rows if r["user_id"] == user_id]
-    if year:
-        rows = [r for r in rows if r["year"] == year]
-    if month:
-        month = MONTH_NAMES[month - 1]
-        rows = [r for r in rows if r["month"] == month]
-    return rows
 
 @router.put("/")
 def update_payment(payload: BillPaymentStatus):
-    with Session(engine) as s:
+    def work(s: Session):
         p = s.get(BillPaymentStatus, payload.id)
 
         if not p:
@@ -134,19 +142,97 @@ def update_payment(payload: BillPaymentStatus):
         for k, v in payload.dict().items():
             if k != "id":
                 setattr(p, k, v)
-        s.add(p); s.commit(); s.refresh(p)
+        s.add(p); s.flush()
         p = p.model_dump()
         users = s.get(User, payload.user_id)
         p['user_name'] = users.name
         p['month'] = MONTH_NAMES[p['month']] if p['month'] else None
         return p
+    return run_write(work)
 
 @router.delete("/{id}")
 def delete_payment(id: int):
-    with Session(engine) as s:
+    def work(s: Session):
         p = s.get(BillPaymentStatus, id)
         if not p:
             raise HTTPException(status_code=404, detail="Payment status not found")
         s.delete(p)
-        s.commit()
-        return {"message": "Payment status deleted successfully"}
\ No newline at end of file
+        return {"message": "Payment status deleted successfully"}
+    return run_write(work)
+
+AGING_BUCKETS = ["0-30", "31-60", "61-90", "90+"]
+
+def aging_rows(as_of: date, apt_name: str = None):
+    """
+    Outstanding amount per user split by days since each month's bill fell
+    due (the 1st of the following month), in one aggregate query. A month
+    owes nothing once paid, its balance when partial or unpaid, and the
+    stored circulation total when the month was closed but the user has no
+    status row yet. Months not yet due are left out. Archived months are
+    all paid and count as such.
+    """
+    statuses = [
+        select(t.user_id.label("user_id"), t.year.label("year"), (t.month + 1).label("month"),
+               t.status.label("status"), t.balance.label("balance"), literal(None).label("billed"))
+        for t in (BillPaymentStatus, BillPaymentStatusArchive)
+    ]
+    billed = (select(CirculationSummary.user_id, CirculationSummary.year, CirculationSummary.month,
+                     literal(None), literal(None), func.sum(CirculationSummary.amount))
+              # Summaries of months never closed (analytics refreshes) are not bills
+              .join(MonthClose, and_(MonthClose.year == CirculationSummary.year,
+                                     MonthClose.month == CirculationSummary.month, MonthClose.status == "done"))
+              .group_by(CirculationSummary.user_id, CirculationSummary.year, CirculationSummary.month))
+    periods = union_all(*statuses, billed).subquery()
+    months = (
+        select(periods.c.user_id,
+               func.max(periods.c.status).label("status"),
+               func.max(periods.c.balance).label("balance"),
+               func.max(periods.c.billed).label("billed"),
+               (func.julianday(as_of.isoformat())
+                - func.julianday(func.date(func.printf("%04d-%02d-01", periods.c.year, periods.c.month), "+1 month"))
+                ).label("age"))
+        .group_by(periods.c.user_id, periods.c.year, periods.c.month)
+        .subquery()
+    )
+    owed = case((months.c.status == "paid", 0.0),
+                (months.c.status.is_not(None), func.coalesce(months.c.balance, 0.0)),
+                else_=func.coalesce(months.c.billed, 0.0))
+    bucket = lambda low, high: func.sum(case((and_(months.c.age > low, months.c.age <= high), owed), else_=0.0))
+    stmt = (
+        select(User.id, User.name, User.flat_id, User.apt_name,
+               bucket(-1, 30), bucket(30, 60), bucket(60, 90), bucket(90, 10 ** 6), func.sum(owed).label("total"))
+        .join(months, and_(months.c.user_id == User.id, months.c.age >= 0))
+        .group_by(User.id)
+        .having(func.sum(owed) > 0.005)
+        .order_by(func.sum(owed).desc(), User.id)
+    )
+    if apt_name:
+        stmt = stmt.where(User.apt_name == apt_name)
+    with Session(get_engine()) as s:
+        return s.exec(stmt).all()
+
+@router.get("/aging")
+def get_aging(as_of: date = None, apt_name: str = None):
+    """Every customer with dues, bucketed by age in days, largest balance first."""
+    as_of = as_of or date.today()
+    rows = [
+        {"user_id": r[0], "user_name": r[1], "flat_id": r[2], "apt_name": r[3],
+         **{b: round(v, 2) for b, v in zip(AGING_BUCKETS, r[4:8])}, "total": round(r[8], 2)}
+        for r in aging_rows(as_of, apt_name)
+    ]
+    totals = {b: round(sum(r[b] for r in rows), 2) for b in AGING_BUCKETS + ["total"]}
+    return {"as_of": as_of.isoformat(), "apt_name": apt_name, "buckets": AGING_BUCKETS, "rows": rows, "totals": totals}
+
+@router.get("/aging.csv")
+def get_aging_csv(as_of: date = None, apt_name: str = None):
+    """The aging report as CSV for follow-up calls."""
+    report = get_aging(as_of, apt_name)
+    out = StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["user_id", "user_name", "flat_id", "apt_name", *AGING_BUCKETS, "total"])
+    for r in report["rows"]:
+        writer.writerow([r["user_id"], r["user_name"], r["flat_id"], r["apt_name"], *(r[b] for b in AGING_BUCKETS), r["total"]])
+    writer.writerow(["", "Total", "", "", *(report["totals"][b] for b in AGING_BUCKETS), report["totals"]["total"]])
+    return StreamingResponse(iter([out.getvalue()]), media_type="text/csv", headers={
+        "Content-Disposition": f"attachment; filename=aging_{report['as_of']}.csv"
+    })
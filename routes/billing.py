@@ -1,21 +1,30 @@
-from fastapi import APIRouter,HTTPException,Depends,BackgroundTasks
-from fastapi.responses import FileResponse
+from fastapi import APIRouter,HTTPException,Depends
+from profiling import ProfiledRoute
+from fastapi.responses import Response
 from sqlmodel import Session, select
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
-import tempfile
-import os
+from io import BytesIO
 from datetime import datetime
-from database import engine,get_session
-from models import Subscription, Paper, Exclusion, PaperPrice, Frequency, User, BillPaymentStatus
+from database import get_engine,get_session
+from models import Paper, User, BillPaymentStatus, MonthClose
 from datetime import date
 from calendar import monthrange
 from pydantic import BaseModel,RootModel
 import re
-from config import config
+from database import get_config
+from routes.analytics import store_circulation
+from pricing import get_timeline, get_timelines
+from readmodel import get_read_model, SubRec
+from fastread import tuples, records, user_subscriptions, user_exclusions
+from schedules import subscription_applies_on
 from typing import Dict, List
+from writer import run_write
+from archive import payment_history, with_archived_exclusions
+from billcache import get_bill_cache
+import time
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 MONTH_NAMES = ["Jan", "Feb", "Mar", "Apr", "May", "Jun",
                "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
@@ -38,38 +47,30 @@ class BillRequest(BaseModel):
     grand_total: float
 
 def get_price(session: Session, paper_id: int, target: date):
-    dow = target.weekday()
-    rows = session.exec(select(PaperPrice).where(PaperPrice.paper_id==paper_id)).all()
-    default = None; day_specific = None
-    for r in rows:
-        if r.day_of_week is None:
-            default = r.price
-        elif r.day_of_week == dow:
-            day_specific = r.price
-    return day_specific if day_specific is not None else (default or 0.0)
-
-def subscription_applies_on(sub: Subscription, target: date):
-    if sub.start_date and target < sub.start_date: return False
-    if sub.end_date and target > sub.end_date: return False
-    dow = target.weekday()
-    if sub.frequency == Frequency.DAILY: return True
-    if sub.frequency == Frequency.WEEKLY: return sub.weekday == dow
-    if sub.frequency == Frequency.MONTHLY: return sub.day_of_month == target.day
-    if sub.frequency == Frequency.ALTERNATING:
-        if sub.weekday != dow: return False
-        if sub.start_date:
-            return (target.isocalendar()[1] % 2) == (sub.start_date.isocalendar()[1] % 2)
-        return True
-    return False
+    return get_timeline(session, paper_id).price_on(target)[0]
 
 def is_excluded(session: Session, user_id: int, paper_id: int, target: date):
-    exs = session.exec(select(Exclusion).where(Exclusion.user_id==user_id)).all()
-    for e in exs:
-        if e.paper_id is not None and e.paper_id != paper_id: continue
-        if e.date_from <= target <= e.date_to:
+    for ex_paper_id, date_from, date_to in tuples(session, user_exclusions(user_id)):
+        if ex_paper_id is not None and ex_paper_id != paper_id: continue
+        if date_from <= target <= date_to:
             return True
     return False
 
+def billing_source(s: Session, user_id: int):
+    """
+    A user's subscriptions plus exclusion and paper-name lookups, served by
+    the read model when it is enabled and by the ORM otherwise.
+    """
+    model = get_read_model(s)
+    if model is not None:
+        return (model.subscriptions_of(user_id),
+                with_archived_exclusions(s, model.is_excluded),
+                lambda paper_id: model.papers[paper_id].name)
+    subs = records(s, user_subscriptions(user_id), SubRec)
+    return (subs,
+            with_archived_exclusions(s, lambda uid, paper_id, target: is_excluded(s, uid, paper_id, target)),
+            lambda paper_id: s.get(Paper, paper_id).name)
+
 def get_pending_payments(session: Session, user_id: int, year: int, month: int):
     """
     Returns pending payments before the given year/month for a user
@@ -78,34 +79,22 @@ def get_pending_payments(session: Session, user_id: int, year: int, month: int):
 
     results = []
     grand_total = 0.0
-    today = date.today()
 
     # Get subscriptions
-    subs = session.exec(
-        select(Subscription).where(Subscription.user_id == user_id)
-    ).all()
+    subs, excluded, _ = billing_source(session, user_id)
     if not subs:
         return {"pending_payments": [], "grand_total": 0.0,"pending_total": 0.0}
 
     # Determine the earliest subscription start
     start_date = min(sub.start_date for sub in subs if sub.start_date)
-    # End date is either subscription end or today's date
-    end_date = max(
-        (sub.end_date for sub in subs if sub.end_date), default=today
-    )
 
     # Loop from start_date to the month before given year/month
+    payments = payment_history(session, user_id)
+    timelines = get_timelines(session)
     cur_year, cur_month = start_date.year, start_date.month
     while (cur_year, cur_month) < (year, month):
         # Check payment status
-        payment = session.exec(
-            select(BillPaymentStatus).where(
-                BillPaymentStatus.user_id == user_id,
-                BillPaymentStatus.year == cur_year,
-                BillPaymentStatus.month == cur_month - 1 
-            )
-        ).first()
-        print(payment)
+        payment = payments.get((cur_year, cur_month - 1))
         if not payment or payment.status not in ["paid","partial"]:
             days_in_month = monthrange(cur_year, cur_month)[1]
             month_total = 0.0
@@ -113,8 +102,9 @@ def get_pending_payments(session: Session, user_id: int, year: int, month: int):
             for day in range(1, days_in_month + 1):
                 cur_date = date(cur_year, cur_month, day)
                 for sub in subs:
-                    if subscription_applies_on(sub, cur_date) and not is_excluded(session, sub.user_id, sub.paper_id, cur_date):
-                        price = get_price(session, sub.paper_id, cur_date)
+                    if subscription_applies_on(sub, cur_date) and not excluded(sub.user_id, sub.paper_id, cur_date):
+                        timeline = timelines.get(sub.paper_id)
+                        price = timeline.price_on(cur_date)[0] if timeline else 0.0
                         month_total += price
 
             if month_total > 0:
@@ -138,125 +128,224 @@ def get_pending_payments(session: Session, user_id: int, year: int, month: int):
         "pending_total": round(grand_total, 2)
     }
 
-@router.get("/user/{user_id}")
-def monthly_bill(user_id: int, year: int, month: int):
+def compute_bill_items(s: Session, user_id: int, year: int, month: int):
+    """
+    Walks every day of the month for a user's subscriptions and returns the
+    bill line items, the total and the per-paper (qty, amount) breakdown.
+    """
     days = monthrange(year, month)[1]
     items = {}
+    per_paper = {}
     total = 0.0
-    with Session(engine) as s:
-        subs = s.exec(select(Subscription).where(Subscription.user_id==user_id)).all()
-        # Pre-fetch all prices for each paper
-        paper_prices = {}
+    subs, excluded, paper_name = billing_source(s, user_id)
+    timelines = get_timelines(s)
+
+    for day in range(1, days+1):
+        cur = date(year, month, day)
+        dow = cur.weekday()
         for sub in subs:
-            rows = s.exec(select(PaperPrice).where(PaperPrice.paper_id==sub.paper_id)).all()
-            paper_prices[sub.paper_id] = rows
-
-        for day in range(1, days+1):
-            cur = date(year, month, day)
-            dow = cur.weekday()
-            for sub in subs:
-                if subscription_applies_on(sub, cur) and not is_excluded(s, sub.user_id, sub.paper_id, cur):
-                    # Find price and if it's day-specific
-                    price = 0.0
-                    price_type = "default"
-                    for r in paper_prices[sub.paper_id]:
-                        if r.day_of_week == dow:
-                            price = r.price
-                            price_type = WeekdayNames[dow]
-                            break
-                        elif r.day_of_week is None:
-                            price = r.price
-                    p = s.get(Paper, sub.paper_id)
-                    if price_type != "default":
-                        key = f"{p.name} ({price_type})"
-                    else:
-                        key = p.name
-                    if price:
-                        items.setdefault(key, {"qty":0, "amount":0.0})
-                        if price:
-                            items[key]["qty"] += 1
-                        items[key]["amount"] += price
-                        items[key]["unit_price"] = price
-                        total += price
-        pending = get_pending_payments(s,user_id,year,month)
+            if subscription_applies_on(sub, cur) and not excluded(sub.user_id, sub.paper_id, cur):
+                # Find price and if it's day-specific
+                timeline = timelines.get(sub.paper_id)
+                price, day_specific = timeline.price_on(cur) if timeline else (0.0, False)
+                name = paper_name(sub.paper_id)
+                if day_specific:
+                    key = f"{name} ({WeekdayNames[dow]})"
+                else:
+                    key = name
+                if price:
+                    # A price change mid-month gets its own line so qty x unit_price adds up
+                    if key in items and items[key]["unit_price"] != price:
+                        key = f"{key} @ {price:g}"
+                    items.setdefault(key, {"qty":0, "amount":0.0})
+                    items[key]["qty"] += 1
+                    items[key]["amount"] += price
+                    items[key]["unit_price"] = price
+                    per_paper.setdefault(sub.paper_id, [0, 0.0])
+                    per_paper[sub.paper_id][0] += 1
+                    per_paper[sub.paper_id][1] += price
+                    total += price
+    return items, total, per_paper
+
+def bill_tags(s: Session, user_id: int):
+    """Bill cache tags for everything a user's bill reads."""
+    return {("user", user_id)} | {("paper", sub.paper_id) for sub in billing_source(s, user_id)[0]}
+
+def build_bill(s: Session, user_id: int, year: int, month: int):
+    """
+    The bill for one user and month, served from the bill cache until a
+    write touches the user or one of the papers it bills for.
+    """
+    cache = get_bill_cache()
+    key = (user_id, year, month)
+    result, generation = cache.get(key)
+    if result is not None:
+        return result
+    items, total, _ = compute_bill_items(s, user_id, year, month)
+    pending = get_pending_payments(s,user_id,year,month)
     result =  {"user_id": user_id, "year": year, "month": month, "items": items, "total": round(total,2),"pending_payments": pending}
     result.update(pending)
     result["grand_total"] = result["pending_total"] + result["total"]
+    cache.put(key, result, bill_tags(s, user_id), generation)
     return result
 
+@router.get("/user/{user_id}")
+def monthly_bill(user_id: int, year: int, month: int):
+    with Session(get_engine()) as s:
+        return build_bill(s, user_id, year, month)
+
+@router.get("/cache-stats")
+def bill_cache_stats():
+    return get_bill_cache().summary()
+
 @router.get("/bulk")
 def bulk_billing(year: int, month: int):
+    return bulk_bills(year, month)
+
+def bulk_bills(year: int, month: int, progress=None):
     response = []
-    with Session(engine) as s:
+    with Session(get_engine()) as s:
         users = s.exec(select(User)).all()
-    for user in users:
+    for i, user in enumerate(users):
+        if progress:
+            progress(i / len(users))
         user_id = user.id
-        days = monthrange(year, month)[1]
-        items = {}
-        total = 0.0
-        with Session(engine) as s:
-            subs = s.exec(select(Subscription).where(Subscription.user_id==user_id)).all()
-            # Pre-fetch all prices for each paper
-            paper_prices = {}
-            for sub in subs:
-                rows = s.exec(select(PaperPrice).where(PaperPrice.paper_id==sub.paper_id)).all()
-                paper_prices[sub.paper_id] = rows
-
-            for day in range(1, days+1):
-                cur = date(year, month, day)
-                dow = cur.weekday()
-                for sub in subs:
-                    if subscription_applies_on(sub, cur) and not is_excluded(s, sub.user_id, sub.paper_id, cur):
-                        # Find price and if it's day-specific
-                        price = 0.0
-                        price_type = "default"
-                        for r in paper_prices[sub.paper_id]:
-                            if r.day_of_week == dow:
-                                price = r.price
-                                price_type = WeekdayNames[dow]
-                                break
-                            elif r.day_of_week is None:
-                                price = r.price
-                        p = s.get(Paper, sub.paper_id)
-                        if price_type != "default":
-                            key = f"{p.name} ({price_type})"
-                        else:
-                            key = p.name
-                        if price:
-                            items.setdefault(key, {"qty":0, "amount":0.0})
-                            if price:
-                                items[key]["qty"] += 1
-                            items[key]["amount"] += price
-                            items[key]["unit_price"] = price
-                            total += price
+        with Session(get_engine()) as s:
+            _, total, _ = compute_bill_items(s, user_id, year, month)
         if total > 0:
             result =  {"user_id": user_id,"user_name":user.name, "year": year, "month": month - 1, "status":"unpaid","balance": round(total,2),"amount_paid": 0}
             response.append(result)
     return response
 
 
+def month_close_summary(run: MonthClose):
+    return {
+        "year": run.year,
+        "month": run.month,
+        "status": run.status,
+        "users_billed": run.users_billed,
+        "total_amount": round(run.total_amount, 2),
+        "inserted": run.inserted,
+        "updated": run.updated,
+        "skipped": run.skipped,
+        "started_at": run.started_at,
+        "duration_ms": round(run.duration_ms, 1)
+    }
+
+@router.post("/close-month")
+def close_month(year: int, month: int, force: bool = False):
+    return run_month_close(year, month, force)
+
+def run_month_close(year: int, month: int, force: bool = False, progress=None):
+    """
+    Bills every user for the month and records their unpaid status rows in
+    a single transaction, stored with the same month - 1 offset as
+    /billing/bulk. Existing paid or partial rows are left alone and unpaid
+    ones get the recomputed balance, so re-running is safe. A crashed run
+    leaves nothing half-written and is simply run again; a finished one
+    returns its stored summary unless `force` is set.
+    """
+    started = time.perf_counter()
+    with Session(get_engine()) as s:
+        done = s.exec(select(MonthClose).where(
+            MonthClose.year == year, MonthClose.month == month, MonthClose.status == "done"
+        )).first()
+        if done and not force:
+            return month_close_summary(done)
+        users = s.exec(select(User)).all()
+        bills = []
+        for i, user in enumerate(users):
+            if progress:
+                progress(i / len(users))
+            _, total, per_paper = compute_bill_items(s, user.id, year, month)
+            bills.append((user, round(total, 2), per_paper))
+
+    def work(s: Session):
+        existing = {
+            r.user_id: r for r in s.exec(select(BillPaymentStatus).where(
+                BillPaymentStatus.year == year, BillPaymentStatus.month == month - 1
+            )).all()
+        }
+        new_rows, updates, skipped = [], [], 0
+        for user, total, per_paper in bills:
+            store_circulation(s, user, year, month, per_paper)
+            if total <= 0:
+                continue
+            row = existing.get(user.id)
+            if row is None:
+                new_rows.append(BillPaymentStatus(user_id=user.id, year=year, month=month - 1, status="unpaid",
+                                                  amount_paid=0.0, balance=total))
+            elif row.status == "unpaid":
+                if row.balance != total:
+                    row.balance = total
+                    updates.append(row)
+            else:
+                skipped += 1
+        # One flush batches the inserts and updates and feeds the change log
+        s.add_all(new_rows)
+        run = done or MonthClose(year=year, month=month, status="done")
+        run.status = "done"
+        run.users_billed = sum(1 for _, total, _ in bills if total > 0)
+        run.total_amount = sum(total for _, total, _ in bills if total > 0)
+        run.inserted = len(new_rows)
+        run.updated = len(updates)
+        run.skipped = skipped
+        run.started_at = datetime.now().isoformat(timespec="seconds")
+        run.duration_ms = (time.perf_counter() - started) * 1000
+        s.add(run)
+        s.flush()
+        return month_close_summary(run)
+
+    return run_write(work)
+
+def bill_file_name(user: User, year: int, month: int):
+    safe_username = re.sub(r"[^a-zA-Z0-9_-]", "_", user.name)
+    return f"bill_{safe_username}_{year}_{month}.pdf"
+
+def pdf_response(body: bytes, file_name: str):
+    return Response(body, media_type="application/pdf",
+                    headers={"Content-Disposition": f'attachment; filename="{file_name}"'})
+
 @router.post("/pdf/user")
 def generate_bill_for_user(
     data: BillRequest, 
-    background_tasks: BackgroundTasks, 
     db: Session = Depends(get_session)
 ):
     user = db.query(User).filter(User.id == data.user_id).first()
     if not user:
         db.close()
         raise HTTPException(status_code=404, detail="User not found")
+    db.close()
+    return pdf_response(render_bill_pdf(user, data), bill_file_name(user, data.year, data.month))
 
-    safe_username = re.sub(r"[^a-zA-Z0-9_-]", "_", user.name)
-    temp_dir = tempfile.gettempdir()
-    file_name = f"bill_{safe_username}_{data.year}_{data.month}.pdf"
-    file_path = os.path.join(temp_dir, file_name)
-
-    c = canvas.Canvas(file_path, pagesize=A4)
+@router.get("/pdf/user/{user_id}")
+def bill_pdf_for_user(user_id: int, year: int, month: int):
+    """
+    Computes the bill on the server and renders it in one call. PDFs live in
+    the bill cache under the same tags as the bill, so a reprint is served
+    from the cache until a write touches this user or one of their papers.
+    """
+    cache = get_bill_cache()
+    # The PDF carries its generation date
+    key = ("pdf", user_id, year, month, date.today())
+    with Session(get_engine()) as s:
+        user = s.get(User, user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        body, generation = cache.get(key)
+        if body is None:
+            body = render_bill_pdf(user, BillRequest(**build_bill(s, user_id, year, month)))
+            cache.put(key, body, bill_tags(s, user_id), generation)
+    return pdf_response(body, bill_file_name(user, year, month))
+
+def render_bill_pdf(user: User, data: BillRequest) -> bytes:
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
     c.setTitle(f"Bill for {user.name} - {data.month}/{data.year}")
 
     # Header
     c.setFont("Helvetica-Bold", 16)
-    c.drawString(100, 800, f"{config['agency_name']} Newspaper Bill - {user.name}")
+    c.drawString(100, 800, f"{get_config()['agency_name']} Newspaper Bill - {user.name}")
 
     c.setFont("Helvetica", 12)
     c.drawString(100, 780, f"Bill Month: {data.month:02d}/{data.year}")
@@ -317,12 +406,4 @@ def generate_bill_for_user(
 
     c.showPage()
     c.save()
-    db.close()
-
-    background_tasks.add_task(os.remove, file_path)
-
-    return FileResponse(
-        file_path,
-        filename=file_name,
-        media_type="application/pdf"
-    )
\ No newline at end of file
+    return buffer.getvalue()
\ No newline at end of file
@@ -1,10 +1,13 @@
 from fastapi import APIRouter,Depends
-from sqlmodel import Session, select
-from database import engine,get_session
-from models import Exclusion,Paper,User
-from schemas import ExclusionCreate,ExclusionPut
+from profiling import ProfiledRoute
+from sqlmodel import Session
+from database import get_session
+from models import Exclusion,ExclusionArchive,Paper,User
+from writer import run_write
+from schemas import ExclusionCreate,ExclusionPut,ExclusionWithNames
+from typing import List
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 @router.post("/")
 def create_exclusion(payload: ExclusionCreate):
@@ -14,27 +17,33 @@ def create_exclusion(payload: ExclusionCreate):
         date_from=payload.date_from,
         date_to=payload.date_to
     )
-    with Session(engine) as s:
-        s.add(ex); s.commit(); s.refresh(ex)
-    return ex
+    def work(s: Session):
+        s.add(ex); s.flush()
+        return ex
+    return run_write(work)
 
-@router.get("/")
-def list_subscriptions(db: Session = Depends(get_session)):
-    results = (
+def query_exclusions(db: Session, table):
+    return (
         db.query(
-            Exclusion.id,
-            Exclusion.paper_id,
-            Exclusion.user_id,
-            Exclusion.date_from,
-            Exclusion.date_to,
+            table.id,
+            table.paper_id,
+            table.user_id,
+            table.date_from,
+            table.date_to,
             Paper.name.label("paper_name"),
             User.name.label("user_name")
         )
-        .join(Paper, Paper.id == Exclusion.paper_id)
-        .join(User,User.id == Exclusion.user_id)
+        .join(Paper, Paper.id == table.paper_id)
+        .join(User,User.id == table.user_id)
         .all()
     )
 
+@router.get("/", response_model=List[ExclusionWithNames])
+def list_subscriptions(history: bool = False, db: Session = Depends(get_session)):
+    results = query_exclusions(db, Exclusion)
+    if history:
+        results = sorted(results + query_exclusions(db, ExclusionArchive), key=lambda r: r.id)
+
     # Convert SQLAlchemy rows to list of dicts for Pydantic
     return [
         {
@@ -51,7 +60,7 @@ def list_subscriptions(db: Session = Depends(get_session)):
 
 @router.put("/")
 def update_exclusion(payload: ExclusionPut):
-    with Session(engine) as s:
+    def work(s: Session):
         ex = s.get(Exclusion, payload.id)
         if not ex:
             return {"error": "not found"}
@@ -59,15 +68,15 @@ def update_exclusion(payload: ExclusionPut):
             if k != "id":
                 setattr(ex, k, v)
         s.add(ex)
-        s.commit()
-        s.refresh(ex)
+        s.flush()
         return ex
+    return run_write(work)
 
 @router.delete("/{exclusion_id}")
 def delete_exclusion(exclusion_id: int):
-    with Session(engine) as s:
+    def work(s: Session):
         ex = s.get(Exclusion, exclusion_id)
         if ex:
             s.delete(ex)
-            s.commit()
         return {"ok": True}
+    return run_write(work)
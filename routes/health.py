@@ -1,6 +1,7 @@
 from fastapi import APIRouter
+from profiling import ProfiledRoute
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 @router.get("/")
 def health():
@@ -1,7 +1,8 @@
 from fastapi import APIRouter,HTTPException, BackgroundTasks, Body
+from profiling import ProfiledRoute
 from sqlmodel import Session, select
-from database import engine
-from models import Subscription, Paper, Exclusion, PaperPrice, Frequency, User
+from database import get_engine
+from models import Paper
 from typing import Dict
 from datetime import date as date
 from pydantic import BaseModel
@@ -14,9 +15,16 @@ from reportlab.lib.styles import getSampleStyleSheet
 from fastapi.responses import StreamingResponse
 from reportlab.platypus import PageBreak
 from collections import defaultdict
+import re
+import numpy as np
 import pandas as pd
 from typing import List
 from config import config
+from readmodel import get_read_model, ReadModel, SubRec
+from fastread import tuples, records, subscriptions_with_names, user_exclusions, SUBSCRIPTION_COLUMNS
+from schedules import subscription_applies_on, schedule_for
+from archive import with_archived_exclusions, exclusions_between
+from billcache import get_bill_cache, INDENTS
 
 
 class IndentPDFRequest(BaseModel):
@@ -38,78 +46,224 @@ class IndentPDFPayload(BaseModel):
     indent: List[IndentItem]
     papers: List[PaperItem]
 
-router = APIRouter()
-
-def get_price(session: Session, paper_id: int, target: date):
-    dow = target.weekday()
-    rows = session.exec(select(PaperPrice).where(PaperPrice.paper_id==paper_id)).all()
-    default = None; day_specific = None
-    for r in rows:
-        if r.day_of_week is None:
-            default = r.price
-        elif r.day_of_week == dow:
-            day_specific = r.price
-    return day_specific if day_specific is not None else (default or 0.0)
-
-def subscription_applies_on(sub: Subscription, target: date):
-    if sub.start_date and target < sub.start_date: return False
-    if sub.end_date and target > sub.end_date: return False
-    dow = target.weekday()
-    if sub.frequency == Frequency.DAILY: return True
-    if sub.frequency == Frequency.WEEKLY: return sub.weekday == dow
-    if sub.frequency == Frequency.MONTHLY: return sub.day_of_month == target.day
-    if sub.frequency == Frequency.ALTERNATING:
-        if sub.weekday != dow: return False
-        if sub.start_date:
-            return (target.isocalendar()[1] % 2) == (sub.start_date.isocalendar()[1] % 2)
-        return True
-    return False
+router = APIRouter(route_class=ProfiledRoute)
 
 def is_excluded(session: Session, user_id: int, paper_id: int, target: date):
-    exs = session.exec(select(Exclusion).where(Exclusion.user_id==user_id)).all()
-    for e in exs:
-        if e.paper_id is not None and e.paper_id != paper_id: continue
-        if e.date_from <= target <= e.date_to:
+    for ex_paper_id, date_from, date_to in tuples(session, user_exclusions(user_id)):
+        if ex_paper_id is not None and ex_paper_id != paper_id: continue
+        if date_from <= target <= date_to:
             return True
     return False
 
 @router.get("/")
 def get_indent(date_str: str = None):
-    from datetime import date
-    if date_str:
-        target = date.fromisoformat(date_str)
-    else:
-        from datetime import date, timedelta
-        target = date.fromordinal(date.today().toordinal() + 1)
-    with Session(engine) as s:
-        subs = (
-            s.query(
-                Subscription.id,
-                Subscription.paper_id,
-                Subscription.day_of_month,
-                Subscription.user_id,
-                Subscription.frequency,
-                Subscription.weekday,
-                Subscription.start_date,
-                Subscription.end_date,
-                Paper.name.label("paper_name"),
-                User.name.label("user_name"),
-                User.flat_id.label("flat_id"),
-                User.apt_name.label("apt_name")
-            )
-            .join(Paper, Paper.id == Subscription.paper_id)
-            .join(User,User.id == Subscription.user_id)
-            .all()
-        )
-        papers = []
-        for sub in subs:
-            if subscription_applies_on(sub, target) and not is_excluded(s, sub.user_id, sub.paper_id, target):
-                papers.append({"paper":sub.paper_name,"apt_name": sub.apt_name, 'block':sub.flat_id[0], "quantity": 1})
-        indents = pd.DataFrame(papers).groupby(['paper','apt_name','block'], as_index=False)['quantity'].sum()
+    target = indent_target(date_str)
+    # Only the shared cache sees writes from every worker; a per-process copy would go stale
+    cache = get_bill_cache()
+    if cache.shared:
+        result, generation = cache.get(("indent", target))
+        if result is not None:
+            return result
+    with Session(get_engine()) as s:
+        model = get_read_model(s)
+        if model is not None:
+            excluded = with_archived_exclusions(s, model.is_excluded)
+            papers = []
+            for sub in list(model.subs.values()):
+                user = model.users.get(sub.user_id)
+                paper = model.papers.get(sub.paper_id)
+                if user is None or paper is None:
+                    continue
+                if subscription_applies_on(sub, target) and not excluded(sub.user_id, sub.paper_id, target):
+                    papers.append({"paper":paper.name,"apt_name": user.apt_name, 'block':user.block, "quantity": 1})
+        else:
+            subs = tuples(s, subscriptions_with_names())
+            excluded = with_archived_exclusions(s, lambda uid, paper_id, day: is_excluded(s, uid, paper_id, day))
+            papers = []
+            for row in subs:
+                sub = SubRec(*row[:12])
+                paper_name, _, flat_id, apt_name = row[12:]
+                if subscription_applies_on(sub, target) and not excluded(sub.user_id, sub.paper_id, target):
+                    papers.append({"paper":paper_name,"apt_name": apt_name, 'block':flat_id[0], "quantity": 1})
+    result = indent_response(target, papers)
+    if cache.shared:
+        cache.put(("indent", target), result, {INDENTS}, generation)
+    return result
+
+def indent_response(target, papers):
+    indents = pd.DataFrame(papers).groupby(['paper','apt_name','block'], as_index=False)['quantity'].sum()
     return {"date": target.isoformat(), "indent": indents.to_dict(orient='records'),"papers":indents.groupby(["paper"],as_index=False)['quantity'].sum().to_dict(orient='records')}
 
+def indent_target(date_str: str = None) -> date:
+    return date.fromisoformat(date_str) if date_str else date.fromordinal(date.today().toordinal() + 1)
+
+def flat_key(flat_id: str):
+    # A2 before A10
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", flat_id or "")]
+
+def delivery_manifest(s: Session, target: date, apt_name: str = None):
+    """
+    Per-block delivery sheets for `target`: each flat with the papers it
+    gets, blocks ordered by apartment and block and flats by flat number.
+    Uses the read model when it is on, otherwise loads the same records
+    once for the request.
+    """
+    model = get_read_model(s)
+    if model is None:
+        model = ReadModel()
+        model.load(s)
+    excluded = with_archived_exclusions(s, model.is_excluded)
+    blocks = []
+    for (apt, block), users in sorted(model.users_by_block.items()):
+        if apt_name and apt != apt_name:
+            continue
+        flats = []
+        counts = defaultdict(int)
+        for user in sorted(list(users.values()), key=lambda u: flat_key(u.flat_id)):
+            papers = sorted(model.papers[sub.paper_id].name for sub in model.subscriptions_of(user.id)
+                            if sub.paper_id in model.papers and subscription_applies_on(sub, target)
+                            and not excluded(user.id, sub.paper_id, target))
+            if not papers:
+                continue
+            for paper in papers:
+                counts[paper] += 1
+            flats.append({"flat_id": user.flat_id, "user_id": user.id, "name": user.name, "papers": papers})
+        if flats:
+            blocks.append({"apt_name": apt, "block": block, "flats": flats,
+                           "papers": [{"paper": p, "quantity": q} for p, q in sorted(counts.items())],
+                           "copies": sum(counts.values())})
+    return {"date": target.isoformat(), "blocks": blocks,
+            "flats": sum(len(b["flats"]) for b in blocks), "copies": sum(b["copies"] for b in blocks)}
+
+@router.get("/manifest")
+def get_manifest(date_str: str = None, apt_name: str = None):
+    """Which flat gets which papers on a date (tomorrow by default), grouped into per-block sheets."""
+    with Session(get_engine()) as s:
+        return delivery_manifest(s, indent_target(date_str), apt_name)
+
+@router.get("/manifest/pdf")
+def get_manifest_pdf(date_str: str = None, apt_name: str = None):
+    """The manifest as one PDF with a sheet per block, to print for delivery staff."""
+    with Session(get_engine()) as s:
+        manifest = delivery_manifest(s, indent_target(date_str), apt_name)
+    return StreamingResponse(BytesIO(render_manifest_pdf(manifest)), media_type='application/pdf', headers={
+        "Content-Disposition": f"inline; filename=manifest_{manifest['date']}.pdf"
+    })
+
+def render_manifest_pdf(manifest: dict) -> bytes:
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    styles = getSampleStyleSheet()
+    elements = []
+    if not manifest["blocks"]:
+        elements.append(Paragraph(f"Delivery Manifest - Date: {manifest['date']}", styles['Title']))
+        elements.append(Paragraph("No deliveries", styles['Normal']))
+    for idx, block in enumerate(manifest["blocks"]):
+        if idx > 0:
+            elements.append(PageBreak())
+        elements.append(Paragraph(f"Delivery Manifest - {block['apt_name']} Block {block['block']} - {manifest['date']}", styles['Heading2']))
+        summary = ", ".join(f"{p['paper']}: {p['quantity']}" for p in block["papers"])
+        elements.append(Paragraph(f"{len(block['flats'])} flats, {block['copies']} copies ({summary})", styles['Normal']))
+        elements.append(Spacer(1, 8))
+        data = [["Flat", "Name", "Papers", "Done"]]
+        for flat in block["flats"]:
+            data.append([flat["flat_id"], flat["name"], Paragraph(", ".join(flat["papers"]), styles['Normal']), ""])
+        table = Table(data, hAlign='LEFT', colWidths=[50, 130, 260, 40], repeatRows=1)
+        table.setStyle(TableStyle([
+            ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
+            ('GRID', (0,0), (-1,-1), 0.5, colors.black),
+            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+            ('VALIGN', (0,0), (-1,-1), 'TOP'),
+        ]))
+        elements.append(table)
+    doc.build(elements)
+    return buffer.getvalue()
+
+def forecast_matrix(s: Session, start: date, days: int):
+    """
+    Copies of each paper needed on each of `days` days from `start`, as
+    (dates, papers, matrix) with one row per paper. Each distinct schedule
+    pattern (weekday mask, days of month, step) is evaluated once over the
+    window as an array and shared by every subscription that has it; start
+    and end dates, then exclusions overlapping the window, are masked out
+    before rows are summed per paper.
+    """
+    first = start.toordinal()
+    ordinals = np.arange(first, first + days)
+    dates = [date.fromordinal(int(o)) for o in ordinals]
+    month_days = np.array([d.day for d in dates])
+
+    sub_records = records(s, select(*SUBSCRIPTION_COLUMNS), SubRec)
+    papers = s.exec(select(Paper.id, Paper.name).order_by(Paper.id)).all()
+    if not sub_records:
+        return dates, papers, np.zeros((len(papers), days), dtype=int)
+    subs = pd.DataFrame({"user_id": [r.user_id for r in sub_records], "paper_id": [r.paper_id for r in sub_records]})
+    col = lambda values: values.to_numpy()[:, None]
+    schedules = [schedule_for(r) for r in sub_records]
+    distinct = {}
+    which = np.array([distinct.setdefault(schedule.pattern(), (len(distinct), schedule))[0] for schedule in schedules])
+    patterns = np.array([schedule.pattern_on(ordinals, month_days) for _, schedule in distinct.values()], dtype=bool)
+    starts = np.array([schedule.start for schedule in schedules])[:, None]
+    ends = np.array([schedule.end for schedule in schedules])[:, None]
+    delivered = patterns[which] & (starts <= ordinals) & (ordinals <= ends)
+
+    exclusions = exclusions_between(s, dates[0], dates[-1])
+    if exclusions:
+        exclusions = pd.DataFrame(exclusions, columns=["user_id", "ex_paper_id", "date_from", "date_to"])
+        pairs = subs.reset_index().merge(exclusions, on="user_id")
+        pairs = pairs[pairs.ex_paper_id.isna() | (pairs.ex_paper_id == pairs.paper_id)]
+        if len(pairs):
+            skipped = (col(pairs.date_from.map(date.toordinal)) <= ordinals) & (ordinals <= col(pairs.date_to.map(date.toordinal)))
+            excluded = np.zeros_like(delivered)
+            np.logical_or.at(excluded, pairs["index"].to_numpy(), skipped)
+            delivered &= ~excluded
+
+    row = {paper_id: i for i, (paper_id, _) in enumerate(papers)}
+    matrix = np.zeros((len(papers), days), dtype=int)
+    known = subs.paper_id.map(row).notna().to_numpy()
+    np.add.at(matrix, subs.paper_id[known].map(row).astype(int).to_numpy(), delivered[known].astype(int))
+    return dates, papers, matrix
+
+def forecast_window(start: str, days: int):
+    if not 1 <= days <= 366:
+        raise HTTPException(status_code=400, detail="days must be between 1 and 366")
+    with Session(get_engine()) as s:
+        return forecast_matrix(s, indent_target(start), days)
+
+@router.get("/forecast")
+def get_forecast(days: int = 30, start: str = None):
+    """
+    Projected copies per paper per day for the next `days` days (from
+    tomorrow unless `start` is given), for ordering from publishers.
+    """
+    dates, papers, matrix = forecast_window(start, days)
+    return {
+        "start": dates[0].isoformat(),
+        "days": days,
+        "dates": [d.isoformat() for d in dates],
+        "papers": [{"paper_id": paper_id, "paper": name, "quantities": matrix[i].tolist(), "total": int(matrix[i].sum())}
+                   for i, (paper_id, name) in enumerate(papers)],
+        "totals": matrix.sum(axis=0).tolist(),
+    }
+
+@router.get("/forecast.csv")
+def get_forecast_csv(days: int = 30, start: str = None):
+    """The forecast as CSV, one row per paper and one column per date."""
+    dates, papers, matrix = forecast_window(start, days)
+    frame = pd.DataFrame(matrix, index=[name for _, name in papers], columns=[d.isoformat() for d in dates])
+    frame.index.name = "paper"
+    frame["total"] = frame.sum(axis=1)
+    return StreamingResponse(iter([frame.to_csv()]), media_type="text/csv", headers={
+        "Content-Disposition": f"attachment; filename=forecast_{dates[0].isoformat()}_{days}d.csv"
+    })
+
 @router.post("/pdf")
 def generate_indents_pdf(payload: IndentPDFPayload = Body(...)):
+    return StreamingResponse(BytesIO(render_indent_pdf(payload)), media_type='application/pdf', headers={
+        "Content-Disposition": f"inline; filename=indents_{payload.date}.pdf"
+    })
+
+def render_indent_pdf(payload: IndentPDFPayload) -> bytes:
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4)
     elements = []
@@ -166,8 +320,4 @@ def generate_indents_pdf(payload: IndentPDFPayload = Body(...)):
 
     # Build PDF
     doc.build(elements)
-    buffer.seek(0)
-
-    return StreamingResponse(buffer, media_type='application/pdf', headers={
-        "Content-Disposition": f"inline; filename=indents_{payload.date}.pdf"
-    })
\ No newline at end of file
+    return buffer.getvalue()
\ No newline at end of file
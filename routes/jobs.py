@@ -0,0 +1,80 @@
+import orjson
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Response
+from profiling import ProfiledRoute
+from pydantic import BaseModel
+from sqlmodel import Session, select
+from database import get_engine
+from models import Job
+from jobs import runner, JOB_TYPES, QueueFull, ensure_recovered
+
+router = APIRouter(route_class=ProfiledRoute)
+
+class JobRequest(BaseModel):
+    type: str
+    params: dict = {}
+
+def job_status(job: Job):
+    return {
+        "id": job.id,
+        "type": job.type,
+        "params": orjson.loads(job.params),
+        "status": job.status,
+        "progress": job.progress,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "result_url": f"/jobs/{job.id}/result" if job.status == "done" else None
+    }
+
+@router.post("/", status_code=202)
+def submit_job(request: JobRequest, response: Response):
+    """
+    Queues a bulk billing run, month close, pending payments lookup or PDF
+    render and returns at once. Poll the status URL for progress; 429 means
+    too many jobs of that type are already waiting.
+    """
+    if request.type not in JOB_TYPES:
+        raise HTTPException(status_code=400, detail=f"unknown job type {request.type!r}, expected one of {sorted(JOB_TYPES)}")
+    ensure_recovered()
+    try:
+        job = runner.submit(request.type, request.params)
+    except QueueFull as exc:
+        raise HTTPException(status_code=429, detail=str(exc), headers={"Retry-After": "5"})
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return {"id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}"}
+
+@router.get("/")
+def list_jobs(status: Optional[str] = None, type: Optional[str] = None, limit: int = 50):
+    ensure_recovered()
+    with Session(get_engine()) as s:
+        stmt = select(Job).order_by(Job.created_at.desc()).limit(limit)
+        if status:
+            stmt = stmt.where(Job.status == status)
+        if type:
+            stmt = stmt.where(Job.type == type)
+        return [job_status(job) for job in s.exec(stmt).all()]
+
+@router.get("/{job_id}")
+def get_job(job_id: str):
+    ensure_recovered()
+    with Session(get_engine()) as s:
+        job = s.get(Job, job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return job_status(job)
+
+@router.get("/{job_id}/result")
+def get_job_result(job_id: str):
+    with Session(get_engine()) as s:
+        job = s.get(Job, job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if job.status == "failed":
+            # The job failed, not this request: report it as a state conflict carrying the job's error
+            raise HTTPException(status_code=409, detail=f"Job failed: {job.error}")
+        if job.status != "done":
+            raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+        headers = {"Content-Disposition": f'attachment; filename="{job.file_name}"'} if job.file_name else None
+        return Response(job.result, media_type=job.media_type, headers=headers)
@@ -1,26 +1,32 @@
 from fastapi import APIRouter, Depends
+from profiling import ProfiledRoute
 from sqlmodel import Session, select
-from database import engine,get_session
+from database import get_engine,get_session
 from models import Paper, PaperPrice
-from schemas import PaperCreate, PriceCreate
+from pricing import invalidate_prices
+from writer import run_write
+from datetime import date, timedelta
+from schemas import PaperCreate, PriceCreate, PricePut, PaperPriceWithName
+from typing import List
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 @router.post("/")
 def create_paper(payload: PaperCreate):
     p = Paper(name=payload.name)
-    with Session(engine) as s:
-        s.add(p); s.commit(); s.refresh(p)
-    return p
+    def work(s: Session):
+        s.add(p); s.flush(); s.refresh(p)
+        return p
+    return run_write(work)
 
 @router.get("/")
 def list_papers():
-    with Session(engine) as s:
+    with Session(get_engine()) as s:
         return s.exec(select(Paper)).all()
 
 @router.put("/")
 def update_exclusion(payload: Paper):
-    with Session(engine) as s:
+    def work(s: Session):
         ex = s.get(Paper, payload.id)
         if not ex:
             return {"error": "not found"}
@@ -28,18 +34,39 @@ def update_exclusion(payload: Paper):
             if k != "id":
                 setattr(ex, k, v)
         s.add(ex)
-        s.commit()
-        s.refresh(ex)
+        s.flush()
         return ex
+    return run_write(work)
 
 @router.post("/{paper_id}/price")
 def set_price(paper_id: int, payload: PriceCreate):
-    pp = PaperPrice(paper_id=paper_id, day_of_week=payload.day_of_week, price=payload.price)
-    with Session(engine) as s:
-        s.add(pp); s.commit(); s.refresh(pp)
+    """
+    Adds a price. The open-ended price for the same weekday slot is closed
+    the day before `effective_from` so past months keep their price. An
+    undated price applies from today, or from the start when it is the
+    slot's first price.
+    """
+    def work(s: Session):
+        if payload.day_of_week is None:
+            same_slot = PaperPrice.day_of_week.is_(None)
+        else:
+            same_slot = PaperPrice.day_of_week == payload.day_of_week
+        existing = s.exec(select(PaperPrice).where(PaperPrice.paper_id == paper_id, same_slot)).all()
+        effective_from = payload.effective_from or (date.today() if existing else None)
+        if effective_from:
+            for c in existing:
+                if c.effective_to is None and (c.effective_from is None or c.effective_from < effective_from):
+                    c.effective_to = effective_from - timedelta(days=1)
+                    s.add(c)
+        pp = PaperPrice(paper_id=paper_id, day_of_week=payload.day_of_week, price=payload.price,
+                        effective_from=effective_from)
+        s.add(pp); s.flush(); s.refresh(pp)
+        return pp
+    pp = run_write(work)
+    invalidate_prices()
     return pp
 
-@router.get("/paperprice")
+@router.get("/paperprice", response_model=List[PaperPriceWithName])
 def get_paper_prices(db: Session = Depends(get_session)):
     results = (
         db.query(
@@ -47,6 +74,8 @@ def get_paper_prices(db: Session = Depends(get_session)):
             PaperPrice.paper_id,
             PaperPrice.day_of_week,
             PaperPrice.price,
+            PaperPrice.effective_from,
+            PaperPrice.effective_to,
             Paper.name.label("paper_name")
         )
         .join(Paper, Paper.id == PaperPrice.paper_id)
@@ -60,33 +89,42 @@ def get_paper_prices(db: Session = Depends(get_session)):
             "paper_id": r.paper_id,
             "day_of_week": r.day_of_week,
             "price": r.price,
+            "effective_from": r.effective_from,
+            "effective_to": r.effective_to,
             "paper_name": r.paper_name
         }
         for r in results
     ]
 
 @router.put("/paperprice")
-def update_exclusion(payload: PaperPrice):
-    with Session(engine) as s:
+def update_exclusion(payload: PricePut):
+    def work(s: Session):
         ex = s.get(PaperPrice, payload.id)
         if not ex:
-            return {"error": "not found"}
+            return None
         for k, v in payload.model_dump().items():
             if k != "id":
                 setattr(ex, k, v)
         s.add(ex)
-        s.commit()
+        s.flush()
         s.refresh(ex)
         papers = s.get(Paper, payload.paper_id)
         ex = ex.model_dump()
         ex['paper_name'] = papers.name
         return ex
+    ex = run_write(work)
+    if ex is None:
+        return {"error": "not found"}
+    invalidate_prices()
+    return ex
 
 @router.delete("/paperprice/{price_id}")
 def delete_exclusion(price_id: int):
-    with Session(engine) as s:
+    def work(s: Session):
         ex = s.get(PaperPrice, price_id)
         if ex:
             s.delete(ex)
-            s.commit()
-        return {"ok": True}
+        return ex is not None
+    if run_write(work):
+        invalidate_prices()
+    return {"ok": True}
@@ -1,12 +1,18 @@
 from fastapi import APIRouter,Depends
-from sqlmodel import Session, select
-from database import engine,get_session
-from models import Subscription,Paper,User
-from schemas import SubscriptionCreate,SubscriptionPut
+from profiling import ProfiledRoute
+from sqlmodel import Session
+from database import get_engine,get_session
+from models import Subscription
+from writer import run_write
+from readmodel import get_read_model, SubRec
+from schedules import describe
+from fastread import tuples, subscriptions_with_names
+from schemas import SubscriptionCreate,SubscriptionPut,SubscriptionWithNames
+from typing import List
 
 DAYS = {0:"Monday", 1:"Tuesday", 2:"Wednesday", 3:"Thursday", 4:"Friday", 5:"Saturday", 6:"Sunday",None:None}
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 @router.post("/")
 def create_subscription(payload: SubscriptionCreate):
@@ -17,112 +23,95 @@ def create_subscription(payload: SubscriptionCreate):
         weekday=payload.weekday,
         day_of_month=payload.day_of_month,
         start_date=payload.start_date,
-        end_date=payload.end_date
+        end_date=payload.end_date,
+        weekdays=payload.weekdays,
+        month_days=payload.month_days,
+        interval_days=payload.interval_days,
+        week_pattern=payload.week_pattern
     )
-    with Session(engine) as s:
-        s.add(sub); s.commit(); s.refresh(sub)
-    return sub
-
-@router.get("/")
-def list_subscriptions(db: Session = Depends(get_session)):
-    results = (
-        db.query(
-            Subscription.id,
-            Subscription.paper_id,
-            Subscription.day_of_month,
-            Subscription.user_id,
-            Subscription.frequency,
-            Subscription.weekday,
-            Subscription.start_date,
-            Subscription.end_date,
-            Paper.name.label("paper_name"),
-            User.name.label("user_name")
-        )
-        .join(Paper, Paper.id == Subscription.paper_id)
-        .join(User,User.id == Subscription.user_id)
-        .all()
-    )
-
-    # Convert SQLAlchemy rows to list of dicts for Pydantic
-    return [
-        {
-            "id": r.id,
-            "day_of_month": r.day_of_month,
-            "user_id": r.user_id,
-            "user_name":r.user_name,
-            "paper_id": r.paper_id,
-            "paper_name": r.paper_name,
-            "frequency":r.frequency,
-            "weekday":DAYS[r.weekday],
-            "start_date":r.start_date,
-            "end_date":r.end_date
-        }
-        for r in results
-    ]
+    def work(s: Session):
+        s.add(sub); s.flush(); s.refresh(sub)
+        return sub
+    return run_write(work)
 
-@router.get("/filter")
-def filter_subscriptions(user_id:int=None,paper_id:int=None):
-    with Session(engine) as db:
-        results = (
-            db.query(
-                Subscription.id,
-                Subscription.paper_id,
-                Subscription.day_of_month,
-                Subscription.user_id,
-                Subscription.frequency,
-                Subscription.weekday,
-                Subscription.start_date,
-                Subscription.end_date,
-                Paper.name.label("paper_name"),
-                User.name.label("user_name")
-            )
-            .join(Paper, Paper.id == Subscription.paper_id)
-            .join(User,User.id == Subscription.user_id)
-            .all()
-        )
-    rows = [
-        {
-            "id": r.id,
-            "day_of_month": r.day_of_month,
-            "user_id": r.user_id,
-            "user_name":r.user_name,
-            "paper_id": r.paper_id,
-            "paper_name": r.paper_name,
-            "frequency":r.frequency,
-            "weekday":DAYS[r.weekday],
-            "start_date":r.start_date,
-            "end_date":r.end_date
-        }
-        for r in results if (not user_id or r.user_id == user_id) and (not paper_id or r.paper_id == paper_id)
-    ]
+def subscription_row(sub, user_name: str, paper_name: str) -> dict:
+    return {
+        "id": sub.id,
+        "day_of_month": sub.day_of_month,
+        "user_id": sub.user_id,
+        "user_name":user_name,
+        "paper_id": sub.paper_id,
+        "paper_name": paper_name,
+        "frequency":sub.frequency,
+        "weekday":DAYS[sub.weekday],
+        "start_date":sub.start_date,
+        "end_date":sub.end_date,
+        "weekdays":sub.weekdays,
+        "month_days":sub.month_days,
+        "interval_days":sub.interval_days,
+        "week_pattern":sub.week_pattern,
+        "schedule":describe(sub)
+    }
 
+def rows_from_read_model(model, user_id: int = None, paper_id: int = None):
     if user_id:
-        rows = [r for r in rows if r['user_id'] == user_id]
-    if paper_id:
-        rows = [r for r in rows if r['paper_id'] == paper_id]
+        subs = model.subscriptions_of(user_id)
+    elif paper_id:
+        subs = list(model.subs_by_paper.get(paper_id, {}).values())
+    else:
+        subs = list(model.subs.values())
+    rows = []
+    for sub in subs:
+        user = model.users.get(sub.user_id)
+        paper = model.papers.get(sub.paper_id)
+        if user is None or paper is None or (paper_id and sub.paper_id != paper_id):
+            continue
+        rows.append(subscription_row(sub, user.name, paper.name))
+    rows.sort(key=lambda r: r["id"])
     return rows
 
+def rows_from_database(db: Session, user_id: int = None, paper_id: int = None):
+    return [subscription_row(SubRec(*row[:12]), row[13], row[12])
+            for row in tuples(db, subscriptions_with_names(user_id, paper_id))]
+
+@router.get("/", response_model=List[SubscriptionWithNames])
+def list_subscriptions(db: Session = Depends(get_session)):
+    model = get_read_model(db)
+    if model is not None:
+        return rows_from_read_model(model)
+    return rows_from_database(db)
+
+@router.get("/filter", response_model=List[SubscriptionWithNames])
+def filter_subscriptions(user_id:int=None,paper_id:int=None):
+    with Session(get_engine()) as db:
+        model = get_read_model(db)
+        if model is not None:
+            return rows_from_read_model(model, user_id, paper_id)
+        return rows_from_database(db, user_id, paper_id)
+
 @router.get("/{sub_id}")
 def get_subscription(sub_id: int):
-    with Session(engine) as s:
+    with Session(get_engine()) as s:
         return s.get(Subscription, sub_id)
 
 @router.put("/")
 def update_subscription(payload: SubscriptionPut):
-    with Session(engine) as s:
+    def work(s: Session):
         sub = s.get(Subscription, payload.id)
         if not sub:
             return {"error": "not found"}
         for k, v in payload.dict().items():
             if k != "id":
                 setattr(sub, k, v)
-        s.add(sub); s.commit(); s.refresh(sub)
+        s.add(sub); s.flush(); s.refresh(sub)
         return sub
+    return run_write(work)
 
 @router.delete("/{sub_id}")
 def delete_subscription(sub_id: int):
-    with Session(engine) as s:
+    def work(s: Session):
         sub = s.get(Subscription, sub_id)
         if sub:
-            s.delete(sub); s.commit()
-        return {"ok": True}
\ No newline at end of file
+            s.delete(sub)
+        return {"ok": True}
+    return run_write(work)
\ No newline at end of file
@@ -0,0 +1,99 @@
+import asyncio
+import orjson
+from fastapi import APIRouter, Request
+from profiling import ProfiledRoute
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session, select
+from database import get_engine, get_config
+from models import ChangeLog
+from changes import latest_seq, purged_through, compact_changes
+from writer import run_write
+
+router = APIRouter(route_class=ProfiledRoute)
+
+# Client-facing names for the tracked tables
+TABLES = {
+    "user": "users",
+    "paper": "papers",
+    "paperprice": "paperprice",
+    "subscription": "subscriptions",
+    "exclusion": "exclusions",
+    "billpaymentstatus": "payments",
+}
+
+def to_change(r: ChangeLog):
+    return {
+        "seq": r.seq,
+        "table": TABLES.get(r.table_name, r.table_name),
+        "id": r.row_id,
+        "op": r.op,
+        "data": orjson.loads(r.data) if r.data else None
+    }
+
+def read_changes(s: Session, since: int, limit: int, tables: list = None):
+    stmt = select(ChangeLog).where(ChangeLog.seq > since).order_by(ChangeLog.seq).limit(limit)
+    if tables:
+        names = [k for k, v in TABLES.items() if v in tables]
+        stmt = stmt.where(ChangeLog.table_name.in_(names))
+    return s.exec(stmt).all()
+
+@router.get("/")
+def sync(since: int = 0, limit: int = 1000, tables: str = None):
+    """
+    Changes after `since`, oldest first. Feed the returned `seq` back as the
+    next `since`. `reset: true` means the cursor is older than compacted
+    history and the client must reload the full lists.
+    """
+    wanted = tables.split(",") if tables else None
+    with Session(get_engine()) as s:
+        head = latest_seq(s)
+        if since < purged_through(s):
+            return {"reset": True, "seq": head, "more": False, "changes": []}
+        rows = read_changes(s, since, limit, wanted)
+    changes = [to_change(r) for r in rows]
+    seq = rows[-1].seq if len(rows) == limit else head
+    return {"reset": False, "seq": seq, "more": len(rows) == limit, "changes": changes}
+
+@router.get("/stream")
+async def sync_stream(request: Request, since: int = None, tables: str = None, poll: float = 1.0):
+    """
+    Server-Sent Events: one `change` event per change after `since` (or
+    from now when omitted), with the sequence as the event id.
+    """
+    engine = get_engine()
+    wanted = tables.split(",") if tables else None
+    last_id = request.headers.get("last-event-id")
+    cursor = int(last_id) if last_id and last_id.isdigit() else since
+
+    def fetch(after):
+        with Session(engine) as s:
+            if after is None:
+                return latest_seq(s), []
+            if after < purged_through(s):
+                return latest_seq(s), None
+            return after, read_changes(s, after, 500, wanted)
+
+    async def events():
+        nonlocal cursor
+        while not await request.is_disconnected():
+            head, rows = await asyncio.to_thread(fetch, cursor)
+            if rows is None:
+                yield f"event: reset\nid: {head}\ndata: {{}}\n\n"
+                cursor = head
+                continue
+            if cursor is None:
+                cursor = head
+            for r in rows:
+                cursor = r.seq
+                yield f"event: change\nid: {r.seq}\ndata: {orjson.dumps(to_change(r)).decode()}\n\n"
+            if not rows:
+                yield ": keep-alive\n\n"
+                await asyncio.sleep(poll)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.post("/compact")
+def compact(retention_days: float = None):
+    days = retention_days if retention_days is not None else get_config().get("change_log_retention_days", 30)
+    return run_write(lambda s: compact_changes(s, days))
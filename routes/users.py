@@ -1,37 +1,39 @@
 from fastapi import APIRouter, Depends, HTTPException
+from profiling import ProfiledRoute
 from sqlmodel import Session, select
-from database import engine
+from database import get_engine
 from models import User
+from writer import run_write
 from schemas import UserCreate,UserPut
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 @router.post("/", response_model=UserCreate)
 def create_user(payload: UserCreate):
     u = User(name=payload.name, mobile=payload.mobile, flat_id=payload.flat_id, apt_name=payload.apt_name)
-    with Session(engine) as s:
-        s.add(u); s.commit(); s.refresh(u)
+    def work(s: Session):
+        s.add(u)
+    run_write(work)
     return payload
 
 @router.get("/")
 def list_users():
-    with Session(engine) as s:
+    with Session(get_engine()) as s:
         return s.exec(select(User)).all()
 
 @router.get("/by-filter")
 def get_user_by_filter(mobile: str = None, flat_id: str = None):
-    with Session(engine) as s:
+    with Session(get_engine()) as s:
         stmt = select(User)
-        rows = s.exec(stmt).all()
         if mobile:
-            rows = [r for r in rows if r.mobile == mobile]
+            stmt = stmt.where(User.mobile == mobile)
         if flat_id:
-            rows = [r for r in rows if r.flat_id == flat_id]
-        return rows
+            stmt = stmt.where(User.flat_id == flat_id)
+        return s.exec(stmt).all()
 
 @router.put("/")
 def update_exclusion(payload: UserPut):
-    with Session(engine) as s:
+    def work(s: Session):
         ex = s.get(User, payload.id)
         if not ex:
             return {"error": "not found"}
@@ -39,15 +41,15 @@ def update_exclusion(payload: UserPut):
             if k != "id":
                 setattr(ex, k, v)
         s.add(ex)
-        s.commit()
-        s.refresh(ex)
+        s.flush()
         return ex
+    return run_write(work)
 
 @router.delete("/{user_id}")
 def delete_exclusion(user_id: int):
-    with Session(engine) as s:
+    def work(s: Session):
         ex = s.get(User, user_id)
         if ex:
             s.delete(ex)
-            s.commit()
-        return {"ok": True}
\ No newline at end of file
+        return {"ok": True}
+    return run_write(work)
\ No newline at end of file
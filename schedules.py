@@ -0,0 +1,196 @@
+"""
+Subscription schedules compiled once into bitmasks. Every frequency comes
+down to a weekday mask (bit 0 = Monday), a day-of-month bitset (bit 0 =
+the 1st), an optional every-N-days step and an optional week pattern such
+as "1101" (three weeks on, one skipped) counted from the start week.
+ALTERNATING keeps its ISO week parity rule. Billing, indents and the
+forecast all ask the same compiled Schedule whether a date is delivered.
+"""
+from datetime import date
+from functools import lru_cache
+from typing import Optional
+import numpy as np
+from sqlalchemy import event
+from models import Subscription, Frequency
+
+ALL_WEEKDAYS = (1 << 7) - 1
+ALL_MONTH_DAYS = (1 << 31) - 1
+WEEKDAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+@lru_cache(maxsize=4096)
+def iso_week_parity(monday: int) -> int:
+    """ISO week number mod 2 of the week starting on ordinal `monday`."""
+    thursday = monday + 3
+    year = date.fromordinal(thursday).year
+    return ((thursday - date(year, 1, 1).toordinal()) // 7 + 1) % 2
+
+class Schedule:
+    __slots__ = ("start", "end", "weekdays", "month_days", "interval", "anchor", "weeks", "iso_parity")
+
+    def __init__(self, start: Optional[date], end: Optional[date], weekdays: int, month_days: int,
+                 interval: Optional[int] = None, week_pattern: Optional[str] = None, iso_parity: Optional[int] = None):
+        self.start = start.toordinal() if start else 0
+        self.end = end.toordinal() if end else 1 << 30
+        self.weekdays = weekdays
+        self.month_days = month_days
+        self.interval = interval if interval and interval > 1 else None
+        # Ordinal 1 is a Monday, so start-less schedules count weeks and steps from there
+        self.anchor = self.start or 1
+        self.weeks = tuple(c == "1" for c in week_pattern) if week_pattern and "0" in week_pattern else None
+        self.iso_parity = iso_parity
+
+    def applies_on(self, target: date) -> bool:
+        o = target.toordinal()
+        if o < self.start or o > self.end:
+            return False
+        weekday = (o - 1) % 7
+        if not self.weekdays >> weekday & 1:
+            return False
+        if self.month_days != ALL_MONTH_DAYS and not self.month_days >> (target.day - 1) & 1:
+            return False
+        if self.interval and (o - self.anchor) % self.interval:
+            return False
+        if self.weeks:
+            week = (o - weekday - (self.anchor - (self.anchor - 1) % 7)) // 7
+            if not self.weeks[week % len(self.weeks)]:
+                return False
+        if self.iso_parity is not None and iso_week_parity(o - weekday) != self.iso_parity:
+            return False
+        return True
+
+    def pattern(self):
+        """Everything but the start and end date; the anchor only matters for steps and week patterns."""
+        anchor = self.anchor if self.interval or self.weeks else None
+        return self.weekdays, self.month_days, self.interval, anchor, self.weeks, self.iso_parity
+
+    def pattern_on(self, ordinals: np.ndarray, month_days: np.ndarray) -> np.ndarray:
+        """
+        applies_on() for a whole window at once, ignoring start and end:
+        `ordinals` are the dates as ordinals and `month_days` their days of month.
+        """
+        weekday = (ordinals - 1) % 7
+        on = (self.weekdays >> weekday & 1).astype(bool)
+        if self.month_days != ALL_MONTH_DAYS:
+            on &= (self.month_days >> (month_days - 1) & 1).astype(bool)
+        if self.interval:
+            on &= (ordinals - self.anchor) % self.interval == 0
+        if self.weeks:
+            week = (ordinals - weekday - (self.anchor - (self.anchor - 1) % 7)) // 7
+            on &= np.array(self.weeks)[week % len(self.weeks)]
+        if self.iso_parity is not None:
+            mondays = ordinals - weekday
+            on &= np.array([iso_week_parity(int(m)) for m in mondays]) == self.iso_parity
+        return on
+
+def legacy_masks(frequency, weekday: Optional[int], day_of_month: Optional[int]):
+    """(weekdays, month_days) equivalent to a DAILY/WEEKLY/MONTHLY/ALTERNATING row."""
+    if frequency == Frequency.DAILY:
+        return ALL_WEEKDAYS, ALL_MONTH_DAYS
+    if frequency in (Frequency.WEEKLY, Frequency.ALTERNATING):
+        return (1 << weekday if weekday is not None and 0 <= weekday < 7 else 0), ALL_MONTH_DAYS
+    if frequency == Frequency.MONTHLY:
+        return ALL_WEEKDAYS, (1 << day_of_month - 1 if day_of_month and 1 <= day_of_month <= 31 else 0)
+    return ALL_WEEKDAYS, ALL_MONTH_DAYS
+
+@lru_cache(maxsize=16384)
+def compile_schedule(frequency, weekday, day_of_month, weekdays, month_days, interval_days, week_pattern,
+                     start_date, end_date) -> Schedule:
+    if frequency != Frequency.CUSTOM:
+        weekdays, month_days = legacy_masks(frequency, weekday, day_of_month)
+        interval_days = week_pattern = None
+    iso_parity = None
+    if frequency == Frequency.ALTERNATING and start_date:
+        iso_parity = start_date.isocalendar()[1] % 2
+    return Schedule(start_date, end_date,
+                    ALL_WEEKDAYS if weekdays is None else weekdays,
+                    ALL_MONTH_DAYS if month_days is None else month_days,
+                    interval_days, week_pattern, iso_parity)
+
+def schedule_for(sub) -> Schedule:
+    """The compiled schedule of a subscription row, record or ORM object."""
+    compiled = getattr(sub, "schedule", None)
+    if compiled is None:
+        compiled = compile_schedule(sub.frequency, sub.weekday, sub.day_of_month, getattr(sub, "weekdays", None),
+                                    getattr(sub, "month_days", None), getattr(sub, "interval_days", None),
+                                    getattr(sub, "week_pattern", None), sub.start_date, sub.end_date)
+        if hasattr(type(sub), "__slots__") and "schedule" in type(sub).__slots__:
+            sub.schedule = compiled
+    return compiled
+
+def subscription_applies_on(sub, target: date) -> bool:
+    return schedule_for(sub).applies_on(target)
+
+def describe(sub) -> Optional[str]:
+    """A short label for CUSTOM schedules, e.g. "Mon-Fri" or "Sat,Sun every 2 days"."""
+    if sub.frequency != Frequency.CUSTOM:
+        return None
+    parts = []
+    weekdays = ALL_WEEKDAYS if sub.weekdays is None else sub.weekdays
+    days = [WEEKDAY_NAMES[i] for i in range(7) if weekdays >> i & 1]
+    if weekdays == 0b0011111:
+        parts.append("Mon-Fri")
+    elif weekdays != ALL_WEEKDAYS:
+        parts.append(",".join(days))
+    if sub.month_days not in (None, ALL_MONTH_DAYS):
+        parts.append("on " + ",".join(str(d + 1) for d in range(31) if sub.month_days >> d & 1))
+    if sub.interval_days and sub.interval_days > 1:
+        parts.append(f"every {sub.interval_days} days")
+    if sub.week_pattern and "0" in sub.week_pattern:
+        parts.append(f"weeks {sub.week_pattern}")
+    return " ".join(parts) or "daily"
+
+@event.listens_for(Subscription, "before_insert")
+@event.listens_for(Subscription, "before_update")
+def sync_masks(mapper, connection, target):
+    # Legacy frequencies keep their masks derived from weekday/day_of_month
+    if target.frequency != Frequency.CUSTOM:
+        target.weekdays, target.month_days = legacy_masks(target.frequency, target.weekday, target.day_of_month)
+        target.interval_days = None
+        target.week_pattern = None
+
+def backfill_sql() -> str:
+    """Fills the masks of rows written before the schedule columns existed."""
+    return f"""
+        UPDATE subscription SET
+            weekdays = CASE
+                WHEN frequency IN ('WEEKLY', 'ALTERNATING') THEN
+                    CASE WHEN weekday BETWEEN 0 AND 6 THEN 1 << weekday ELSE 0 END
+                ELSE {ALL_WEEKDAYS} END,
+            month_days = CASE
+                WHEN frequency = 'MONTHLY' THEN
+                    CASE WHEN day_of_month BETWEEN 1 AND 31 THEN 1 << (day_of_month - 1) ELSE 0 END
+                ELSE {ALL_MONTH_DAYS} END
+        WHERE weekdays IS NULL AND frequency != 'CUSTOM'
+    """
+
+def merge_weekly_rows(s, dry_run: bool = False) -> dict:
+    """
+    Folds WEEKLY rows of the same user and paper with the same start and end
+    dates into one CUSTOM row carrying their weekday mask, e.g. five rows for
+    Mon..Fri become one Mon-Fri row. Groups with a repeated weekday are left
+    alone since merging them would drop copies.
+    """
+    from sqlmodel import select
+    groups = {}
+    for sub in s.exec(select(Subscription).where(Subscription.frequency == Frequency.WEEKLY)
+                      .order_by(Subscription.id)).all():
+        groups.setdefault((sub.user_id, sub.paper_id, sub.start_date, sub.end_date), []).append(sub)
+    merged, removed = [], 0
+    for rows in groups.values():
+        weekdays = [r.weekday for r in rows]
+        if len(rows) < 2 or None in weekdays or len(set(weekdays)) != len(weekdays):
+            continue
+        keep = rows[0]
+        merged.append({"id": keep.id, "user_id": keep.user_id, "paper_id": keep.paper_id,
+                       "merged_ids": [r.id for r in rows[1:]], "weekdays": sorted(weekdays)})
+        removed += len(rows) - 1
+        if dry_run:
+            continue
+        keep.frequency = Frequency.CUSTOM
+        keep.weekdays = sum(1 << w for w in set(weekdays))
+        keep.month_days = ALL_MONTH_DAYS
+        keep.weekday = None
+        s.add(keep)
+        for r in rows[1:]:
+            s.delete(r)
+    return {"merged": len(merged), "rows_removed": removed, "dry_run": dry_run, "groups": merged}
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
 from datetime import date
 from enum import Enum
@@ -8,6 +8,7 @@ class Frequency(str, Enum):
     WEEKLY = 'weekly'
     MONTHLY = 'monthly'
     ALTERNATING = 'alternating'
+    CUSTOM = 'custom'
 
 class UserCreate(BaseModel):
     name: str
@@ -28,6 +29,15 @@ class PaperCreate(BaseModel):
 class PriceCreate(BaseModel):
     day_of_week: Optional[int] = None
     price: float
+    effective_from: Optional[date] = None
+
+class PricePut(BaseModel):
+    id: int
+    paper_id: int
+    day_of_week: Optional[int] = None
+    price: float
+    effective_from: Optional[date] = None
+    effective_to: Optional[date] = None
 
 class SubscriptionCreate(BaseModel):
     user_id: int
@@ -37,6 +47,12 @@ class SubscriptionCreate(BaseModel):
     day_of_month: Optional[int] = None
     start_date: Optional[date] = None
     end_date: Optional[date] = None
+    # CUSTOM schedules: weekday mask (bit 0 = Monday), day-of-month bitset
+    # (bit 0 = the 1st), every N days and a weekly on/off pattern like "10"
+    weekdays: Optional[int] = Field(None, ge=0, le=127)
+    month_days: Optional[int] = Field(None, ge=0, le=(1 << 31) - 1)
+    interval_days: Optional[int] = Field(None, ge=1)
+    week_pattern: Optional[str] = Field(None, pattern=r"^[01]*1[01]*$", max_length=52)
 
 class SubscriptionPut(BaseModel):
     id: int
@@ -47,6 +63,12 @@ class SubscriptionPut(BaseModel):
     day_of_month: Optional[int] = None
     start_date: Optional[date] = None
     end_date: Optional[date] = None
+    # CUSTOM schedules: weekday mask (bit 0 = Monday), day-of-month bitset
+    # (bit 0 = the 1st), every N days and a weekly on/off pattern like "10"
+    weekdays: Optional[int] = Field(None, ge=0, le=127)
+    month_days: Optional[int] = Field(None, ge=0, le=(1 << 31) - 1)
+    interval_days: Optional[int] = Field(None, ge=1)
+    week_pattern: Optional[str] = Field(None, pattern=r"^[01]*1[01]*$", max_length=52)
 
 class ExclusionCreate(BaseModel):
     user_id: int
@@ -64,8 +86,10 @@ class ExclusionPut(BaseModel):
 class PaperPriceBase(BaseModel):
     id: int
     paper_id: int
-    day_pattern: str
+    day_of_week: Optional[int] = None
     price: float
+    effective_from: Optional[date] = None
+    effective_to: Optional[date] = None
 
 class PaperPriceWithName(PaperPriceBase):
     id: int
@@ -77,15 +101,43 @@ class SubscriptionBase(BaseModel):
     id: int
     user_id: int
     paper_id: int
-    frequency: str
-    weekday: int
-    day_of_month: int
-    start_date: date
-    end_date: date
+    frequency: Frequency
+    weekday: Optional[str] = None
+    day_of_month: Optional[int] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    weekdays: Optional[int] = None
+    month_days: Optional[int] = None
+    interval_days: Optional[int] = None
+    week_pattern: Optional[str] = None
+    schedule: Optional[str] = None
 
 class SubscriptionWithNames(SubscriptionBase):
     id: int
     paper_name: str
     user_name: str
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class ExclusionWithNames(BaseModel):
+    id: int
+    user_id: int
+    user_name: str
+    paper_id: Optional[int] = None
+    paper_name: str
+    date_from: date
+    date_to: date
+    class Config:
+        from_attributes = True
+
+class PaymentStatusWithName(BaseModel):
+    id: int
+    user_id: int
+    user_name: str
+    year: int
+    month: Optional[str] = None
+    status: str
+    amount_paid: float
+    balance: float
+    class Config:
+        from_attributes = True
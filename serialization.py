@@ -0,0 +1,31 @@
+from typing import Any
+import orjson
+from fastapi.responses import JSONResponse
+from starlette.middleware.gzip import GZipMiddleware
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:  # brotli is optional, gzip covers every client
+    BrotliMiddleware = None
+
+# Payloads smaller than this go out uncompressed; the list endpoints are far above it
+MINIMUM_COMPRESS_SIZE = 1024
+# Event streams must reach the client as soon as each event is written
+UNCOMPRESSED_PATHS = [r"/sync/stream$"]
+
+class ORJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+def add_compression(app):
+    """
+    Negotiates brotli (when installed) or gzip from Accept-Encoding for
+    responses above MINIMUM_COMPRESS_SIZE.
+    """
+    if BrotliMiddleware is not None:
+        app.add_middleware(BrotliMiddleware, minimum_size=MINIMUM_COMPRESS_SIZE, gzip_fallback=True,
+                           excluded_handlers=UNCOMPRESSED_PATHS)
+    else:
+        app.add_middleware(GZipMiddleware, minimum_size=MINIMUM_COMPRESS_SIZE)
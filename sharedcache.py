@@ -0,0 +1,133 @@
+"""
+Cache backend shared by every uvicorn worker on one host. Entries live in a
+small SQLite file next to the agency database. An invalidation bumps a
+version stamp per tag in the same file, and a read only returns an entry
+whose tags still carry the stamps it was built under, so a write in one
+worker evicts the entry for all of them. Same interface as BillCache.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+from threading import Lock
+import orjson
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stamp (tag TEXT PRIMARY KEY, version INTEGER NOT NULL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS entry (key TEXT PRIMARY KEY, value BLOB NOT NULL, stamps TEXT NOT NULL);
+"""
+# Bumped by every invalidation so a put computed before a write is dropped
+GENERATION = "*"
+
+def tag_name(tag) -> str:
+    return ":".join(str(part) for part in tag)
+
+def shared_cache_path(engine):
+    """<name>.cache.db beside a file-backed SQLite database, else None."""
+    database = engine.url.database
+    if not database or database == ":memory:":
+        return None
+    return os.path.splitext(database)[0] + ".cache.db"
+
+class SharedCache:
+    """
+    Values are pickled into `entry` with the stamps of their tags; eviction
+    drops the oldest written entries first so reads never take a write lock.
+    """
+    shared = True
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self.local = threading.local()
+        self.connections = []
+        self.lock = Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Losing the cache in a crash only costs a recompute
+            conn.execute("PRAGMA synchronous=OFF")
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    def _count(self, stat: str, n: int = 1):
+        with self.lock:
+            self.stats[stat] += n
+
+    @staticmethod
+    def _versions(conn, names) -> dict:
+        names = list(names)
+        found = dict(conn.execute(f"SELECT tag, version FROM stamp WHERE tag IN ({','.join('?' * len(names))})", names))
+        return {name: found.get(name, 0) for name in names}
+
+    def get(self, key):
+        conn = self._conn()
+        k = repr(key)
+        conn.execute("BEGIN")
+        try:
+            generation = self._versions(conn, [GENERATION])[GENERATION]
+            row = conn.execute("SELECT value, stamps FROM entry WHERE key = ?", (k,)).fetchone()
+            fresh = row is not None and self._versions(conn, orjson.loads(row[1])) == orjson.loads(row[1])
+        finally:
+            conn.execute("COMMIT")
+        if not fresh:
+            if row is not None:
+                conn.execute("DELETE FROM entry WHERE key = ? AND stamps = ?", (k, row[1]))
+                self._count("invalidations")
+            self._count("misses")
+            return None, generation
+        self._count("hits")
+        return pickle.loads(row[0]), generation
+
+    def put(self, key, value, tags, generation: int):
+        """Stores `value` unless something was invalidated since `generation`."""
+        conn = self._conn()
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self._versions(conn, [GENERATION])[GENERATION] != generation:
+                return
+            stamps = orjson.dumps(self._versions(conn, sorted(tag_name(t) for t in tags))).decode()
+            conn.execute("INSERT OR REPLACE INTO entry (key, value, stamps) VALUES (?, ?, ?)", (repr(key), blob, stamps))
+            evicted = conn.execute(
+                "DELETE FROM entry WHERE rowid IN (SELECT rowid FROM entry ORDER BY rowid "
+                "LIMIT max(0, (SELECT count(*) FROM entry) - ?))", (self.size,)).rowcount
+        finally:
+            conn.execute("COMMIT")
+        if evicted:
+            self._count("evictions", evicted)
+
+    def invalidate(self, tags):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO stamp (tag, version) VALUES (?, 1) ON CONFLICT(tag) DO UPDATE SET version = version + 1",
+                [(name,) for name in {GENERATION, *(tag_name(t) for t in tags)}])
+        finally:
+            conn.execute("COMMIT")
+
+    def stamp(self, tag) -> int:
+        """Current version of `tag`, for per-process caches validated on read."""
+        row = self._conn().execute("SELECT version FROM stamp WHERE tag = ?", (tag_name(tag),)).fetchone()
+        return row[0] if row else 0
+
+    def summary(self):
+        size = self._conn().execute("SELECT count(*) FROM entry").fetchone()[0]
+        with self.lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return dict(self.stats, size=size, max_size=self.size, backend="shared",
+                        hit_rate=round(self.stats["hits"] / lookups, 4) if lookups else 0.0)
+
+    def stop(self):
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for conn in connections:
+            conn.close()
@@ -0,0 +1,54 @@
+import json
+from starlette.concurrency import run_in_threadpool
+from database import AGENCY_NAME, UnknownAgency, current_agency, tenants
+
+PATH_PREFIX = "/agency/"
+HEADER = b"x-agency"
+
+class TenantMiddleware:
+    """
+    Resolves the agency for a request from the X-Agency header or an
+    /agency/<name>/ path prefix (which is stripped before routing) and makes
+    it current for everything the request touches. Requests with neither use
+    the default database; unknown agencies get a 404. The tenant is held open
+    for the whole request so LRU eviction cannot close it underneath.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        agency = None
+        path = scope["path"]
+        if path.startswith(PATH_PREFIX):
+            agency, _, rest = path[len(PATH_PREFIX):].partition("/")
+            scope = dict(scope, path="/" + rest, raw_path=("/" + rest).encode())
+        else:
+            for key, value in scope.get("headers", []):
+                if key == HEADER:
+                    agency = value.decode("latin-1").strip().lower()
+                    break
+        if agency and not AGENCY_NAME.match(agency):
+            return await reject(send, 400, f"invalid agency {agency!r}")
+        try:
+            if not agency or agency in tenants.open:
+                tenant = tenants.acquire(agency)
+            else:
+                # Opening an agency creates its engine and runs migrations, so keep it off the event loop
+                tenant = await run_in_threadpool(tenants.acquire, agency)
+        except UnknownAgency:
+            return await reject(send, 404, f"unknown agency {agency!r}")
+        token = current_agency.set(agency or None)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_agency.reset(token)
+            tenants.release(tenant)
+
+async def reject(send, status: int, detail: str):
+    body = json.dumps({"detail": detail}).encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
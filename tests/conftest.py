@@ -0,0 +1,24 @@
+import os
+import sys
+import tempfile
+import pytest
+from fastapi.testclient import TestClient
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+# Keep the checked-in newspaper.db and ./agencies out of reach of the tests
+os.environ.setdefault("DB_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='tests_'), 'test.db')}")
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="tests_agencies_"))
+
+@pytest.fixture
+def client(request, monkeypatch):
+    """
+    A TestClient with the app started. Modules that need config changed
+    before startup parametrize it indirectly with a dict of overrides.
+    """
+    from config import config
+    from main import app
+    for key, value in getattr(request, "param", {}).items():
+        monkeypatch.setitem(config, key, value)
+    with TestClient(app) as c:
+        yield c
@@ -0,0 +1,44 @@
+import pytest
+from sqlmodel import Session
+from database import get_engine
+from models import BillPaymentStatus, CirculationSummary, MonthClose, Paper, User
+
+APT = "Aging Towers"
+
+@pytest.fixture
+def debtor(client):
+    with Session(get_engine()) as s:
+        user = User(name="Debtor", mobile="9000000009", flat_id="B201", apt_name=APT)
+        paper = Paper(name="Aging Daily")
+        s.add_all([user, paper])
+        s.flush()
+        # BillPaymentStatus months are 0-based, CirculationSummary months 1-based
+        s.add(BillPaymentStatus(user_id=user.id, year=2023, month=0, status="unpaid", amount_paid=0.0, balance=100.0))
+        s.add(BillPaymentStatus(user_id=user.id, year=2023, month=3, status="unpaid", amount_paid=0.0, balance=50.0))
+        for month, amount in ((2, 70.0), (3, 20.0)):
+            s.add(CirculationSummary(year=2023, month=month, user_id=user.id, paper_id=paper.id,
+                                     apt_name=APT, block="B", qty=10, amount=amount))
+        s.commit()
+        return user.id
+
+def aging(client, as_of, user_id):
+    rows = client.get("/payment/aging", params={"as_of": as_of, "apt_name": APT}).json()["rows"]
+    return [r for r in rows if r["user_id"] == user_id]
+
+def test_months_not_yet_due_are_left_out(client, debtor):
+    # January fell due on Feb 1st; April (stored as month 3) is not due until May 1st
+    [row] = aging(client, "2023-03-15", debtor)
+    assert (row["0-30"], row["31-60"], row["total"]) == (0.0, 100.0, 100.0)
+
+def test_only_closed_months_count_without_a_status_row(client, debtor):
+    assert aging(client, "2023-04-15", debtor)[0]["total"] == 100.0
+    with Session(get_engine()) as s:
+        s.add(MonthClose(year=2023, month=3, status="done"))
+        s.commit()
+    [row] = aging(client, "2023-04-15", debtor)
+    # March was due on April 1st
+    assert (row["0-30"], row["61-90"], row["total"]) == (20.0, 100.0, 120.0)
+
+def test_malformed_as_of_is_rejected(client):
+    for path in ("/payment/aging", "/payment/aging.csv"):
+        assert client.get(path, params={"as_of": "2023-13-01"}).status_code == 422
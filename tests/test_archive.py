@@ -0,0 +1,43 @@
+from datetime import date
+from sqlmodel import Session, select
+from archive import payment_history, run_archive
+from database import get_engine
+from models import BillPaymentStatus, BillPaymentStatusArchive, Exclusion, Frequency, Paper, PaperPrice, Subscription, User
+from routes.billing import compute_bill_items, get_pending_payments
+
+def test_archived_history_still_counts(client):
+    with Session(get_engine()) as s:
+        user, paper = User(name="Archived", mobile="9000000031", flat_id="H1", apt_name="History"), Paper(name="Old Chronicle")
+        s.add_all([user, paper])
+        s.flush()
+        s.add(PaperPrice(paper_id=paper.id, price=3.0))
+        s.add(Subscription(user_id=user.id, paper_id=paper.id, frequency=Frequency.DAILY, start_date=date(2020, 1, 1)))
+        s.add(Exclusion(user_id=user.id, paper_id=None, date_from=date(2020, 2, 5), date_to=date(2020, 2, 10)))
+        s.add(BillPaymentStatus(user_id=user.id, year=2020, month=0, status="paid", amount_paid=93.0, balance=0.0))
+        s.add(BillPaymentStatus(user_id=user.id, year=2020, month=1, status="unpaid", amount_paid=0.0, balance=69.0))
+        s.commit()
+        user_id = user.id
+
+    def answers():
+        with Session(get_engine()) as s:
+            return (compute_bill_items(s, user_id, 2020, 2), get_pending_payments(s, user_id, 2020, 4),
+                    {key: (p.status, p.balance) for key, p in payment_history(s, user_id).items()})
+    before = answers()
+    run_archive(payment_months=12, exclusion_days=30)
+
+    with Session(get_engine()) as s:
+        assert [(p.year, p.month) for p in s.exec(select(BillPaymentStatus).where(BillPaymentStatus.user_id == user_id))] == [(2020, 1)]
+        assert [(p.year, p.month) for p in s.exec(select(BillPaymentStatusArchive).where(
+            BillPaymentStatusArchive.user_id == user_id))] == [(2020, 0)]
+        assert s.exec(select(Exclusion).where(Exclusion.user_id == user_id)).all() == []
+    after = answers()
+    assert after == before
+    assert after[2][(2020, 0)] == ("paid", 0.0)
+
+    # The paid month is still taken, for single and bulk inserts alike
+    duplicate = {"user_id": user_id, "year": 2020, "month": 0, "status": "unpaid", "amount_paid": 0.0, "balance": 93.0}
+    assert client.post("/payment/", json=duplicate).status_code == 400
+    assert client.post("/payment/bulk", json=[duplicate]).status_code == 200
+    with Session(get_engine()) as s:
+        assert s.exec(select(BillPaymentStatus).where(BillPaymentStatus.user_id == user_id,
+                                                      BillPaymentStatus.month == 0)).all() == []
@@ -0,0 +1,62 @@
+import json
+import sqlite3
+import pytest
+import backup
+from backup import Restarted, restore, snapshot, verify
+
+@pytest.fixture
+def live(tmp_path):
+    path = tmp_path / "live.db"
+    con = sqlite3.connect(path)
+    con.execute("CREATE TABLE paper (id INTEGER PRIMARY KEY, name TEXT)")
+    con.executemany("INSERT INTO paper (name) VALUES (?)", [(f"paper {i}",) for i in range(500)])
+    con.commit()
+    con.close()
+    return str(path)
+
+def rows(path):
+    con = sqlite3.connect(path)
+    try:
+        return con.execute("SELECT id, name FROM paper ORDER BY id").fetchall()
+    finally:
+        con.close()
+
+def test_snapshot_verify_restore(live, tmp_path):
+    manifest = snapshot(live, str(tmp_path / "backups"), keep=5)
+    assert manifest["tables"] == {"paper": 500}
+    path = str(tmp_path / "backups" / manifest["file"])
+    assert verify(path) == {"file": manifest["file"], "ok": True, "problems": []}
+
+    target = str(tmp_path / "restored.db")
+    restore(path, target)
+    assert rows(target) == rows(live)
+    with pytest.raises(FileExistsError):
+        restore(path, target)
+    restore(path, target, force=True)
+
+def test_tampered_snapshot_is_not_restored(live, tmp_path):
+    manifest = snapshot(live, str(tmp_path / "backups"), keep=5)
+    path = str(tmp_path / "backups" / manifest["file"])
+    manifest["tables"]["paper"] = 499
+    manifest["sha256"] = "0" * 64
+    with open(path + ".json", "w") as f:
+        json.dump(manifest, f)
+    result = verify(path)
+    assert not result["ok"]
+    assert result["problems"] == ["checksum mismatch", "paper: expected 499 rows, found 500"]
+    with pytest.raises(ValueError):
+        restore(path, str(tmp_path / "restored.db"))
+
+def test_copy_kept_restarting_by_writes_gives_up(live, tmp_path, monkeypatch):
+    for key, value in {"backup_max_restarts": 1, "backup_attempts": 2, "backup_retry_backoff_s": 0}.items():
+        monkeypatch.setitem(backup.config, key, value)
+    monkeypatch.setattr(backup, "step_settings", lambda: (1, 0))
+    writer = sqlite3.connect(live, isolation_level=None)
+
+    def write_between_steps(fraction):
+        writer.execute("INSERT INTO paper (name) VALUES ('late')")
+
+    with pytest.raises(Restarted, match="after 2 attempts"):
+        snapshot(live, str(tmp_path / "backups"), keep=5, progress=write_between_steps)
+    writer.close()
+    assert list((tmp_path / "backups").iterdir()) == []
@@ -0,0 +1,58 @@
+from datetime import date
+import pytest
+from sqlmodel import Session, select
+from database import get_engine
+from models import CirculationSummary, Frequency, Paper, PaperPrice, Subscription, User
+
+@pytest.fixture
+def subscriber(client):
+    with Session(get_engine()) as s:
+        user = User(name="Reader", mobile="9000000001", flat_id="A101", apt_name="Tests")
+        paper = Paper(name="Test Times")
+        s.add_all([user, paper])
+        s.flush()
+        s.add(PaperPrice(paper_id=paper.id, price=5.0, effective_from=date(2024, 1, 1)))
+        s.add(Subscription(user_id=user.id, paper_id=paper.id, frequency=Frequency.DAILY, start_date=date(2024, 1, 1)))
+        s.commit()
+        return user.id, paper.id
+
+def summary_rows(user_id, year, month):
+    with Session(get_engine()) as s:
+        return s.exec(select(CirculationSummary).where(
+            CirculationSummary.user_id == user_id, CirculationSummary.year == year, CirculationSummary.month == month
+        )).all()
+
+def test_reading_bills_writes_no_summary(client, subscriber):
+    user_id, _ = subscriber
+    bill = client.get(f"/billing/user/{user_id}", params={"year": 2024, "month": 3}).json()
+    assert bill["total"] == 31 * 5.0
+    assert client.get("/billing/bulk", params={"year": 2024, "month": 3}).status_code == 200
+    assert summary_rows(user_id, 2024, 3) == []
+
+def test_month_close_fills_summary(client, subscriber):
+    user_id, paper_id = subscriber
+    assert client.post("/billing/close-month", params={"year": 2024, "month": 4}).status_code == 200
+    rows = summary_rows(user_id, 2024, 4)
+    assert [(r.paper_id, r.qty, r.amount) for r in rows] == [(paper_id, 30, 150.0)]
+
+def test_bill_pdf_is_reused_until_the_user_changes(client, subscriber, monkeypatch):
+    import routes.billing
+    user_id, _ = subscriber
+    renders = []
+    render = routes.billing.render_bill_pdf
+    monkeypatch.setattr(routes.billing, "render_bill_pdf", lambda *a: renders.append(a) or render(*a))
+    fetch = lambda: client.get(f"/billing/pdf/user/{user_id}", params={"year": 2024, "month": 5})
+
+    assert fetch().headers["content-type"] == "application/pdf"
+    with Session(get_engine()) as s:
+        # Another user's write leaves this user's PDF cached
+        s.add(User(name="Neighbour", mobile="9000000002", flat_id="A102", apt_name="Tests"))
+        s.commit()
+    fetch()
+    assert len(renders) == 1
+    with Session(get_engine()) as s:
+        s.get(User, user_id).name = "Renamed Reader"
+        s.commit()
+    fetch()
+    assert len(renders) == 2
+    assert renders[-1][0].name == "Renamed Reader"
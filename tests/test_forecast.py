@@ -0,0 +1,56 @@
+from datetime import date, timedelta
+import numpy as np
+import pytest
+from sqlmodel import Session
+from archive import run_archive
+from database import create_db_and_tables, get_engine
+from models import Exclusion, Frequency, Paper, Subscription, User
+from routes.indents import forecast_matrix
+from schedules import ALL_WEEKDAYS, compile_schedule
+
+SCHEDULES = [
+    (Frequency.DAILY, None, None, None, None, None, None),
+    (Frequency.WEEKLY, 2, None, None, None, None, None),
+    (Frequency.MONTHLY, None, 31, None, None, None, None),
+    (Frequency.ALTERNATING, 4, None, None, None, None, None),
+    (Frequency.CUSTOM, None, None, 0b0011111, None, None, None),
+    (Frequency.CUSTOM, None, None, ALL_WEEKDAYS, (1 << 0) | (1 << 14), 3, None),
+    (Frequency.CUSTOM, None, None, 0b1100000, None, None, "110"),
+]
+
+@pytest.mark.parametrize("fields", SCHEDULES)
+def test_pattern_matches_applies_on(fields):
+    schedule = compile_schedule(*fields, date(2024, 1, 10), date(2024, 9, 20))
+    dates = [date(2023, 12, 1) + timedelta(days=i) for i in range(400)]
+    ordinals = np.array([d.toordinal() for d in dates])
+    inside = (schedule.start <= ordinals) & (ordinals <= schedule.end)
+    vectorized = schedule.pattern_on(ordinals, np.array([d.day for d in dates])) & inside
+    assert vectorized.tolist() == [schedule.applies_on(d) for d in dates]
+
+def test_schedules_differing_only_in_dates_share_a_pattern():
+    daily = [compile_schedule(Frequency.DAILY, None, None, None, None, None, None, date(2024, 1, day), None)
+             for day in range(1, 20)]
+    assert len({s.pattern() for s in daily}) == 1
+
+def test_forecast_sees_archived_exclusions():
+    create_db_and_tables()
+    today = date.today()
+    with Session(get_engine()) as s:
+        user, paper = User(name="Away", mobile="9000000007", flat_id="F1", apt_name="Forecast"), Paper(name="Forecast Gazette")
+        s.add_all([user, paper])
+        s.flush()
+        s.add(Subscription(user_id=user.id, paper_id=paper.id, frequency=Frequency.DAILY, start_date=today - timedelta(days=200)))
+        s.add(Exclusion(user_id=user.id, paper_id=paper.id, date_from=today - timedelta(days=100), date_to=today - timedelta(days=91)))
+        s.commit()
+        paper_id = paper.id
+    start = today - timedelta(days=105)
+
+    def copies():
+        with Session(get_engine()) as s:
+            _, papers, matrix = forecast_matrix(s, start, 20)
+        return matrix[[p for p, _ in papers].index(paper_id)].tolist()
+
+    before = copies()
+    assert before == [1] * 5 + [0] * 10 + [1] * 5
+    run_archive(exclusion_days=30)
+    assert copies() == before
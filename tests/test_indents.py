@@ -0,0 +1,57 @@
+from collections import Counter
+from datetime import date
+import pytest
+from sqlmodel import Session
+from billcache import get_bill_cache, INDENTS
+from database import create_db_and_tables, get_engine, tenants
+from models import Exclusion, Frequency, Paper, Subscription, User
+from routes.indents import delivery_manifest, get_indent
+
+DAY = date(2024, 7, 3)
+
+@pytest.mark.parametrize("read_model", [True, False])
+def test_manifest_adds_up_to_the_indent(read_model, monkeypatch):
+    create_db_and_tables()
+    monkeypatch.setitem(tenants.default.config, "read_model", read_model)
+    tenants.default.caches.pop("read_model", None)
+    apt = f"Manifest Court {read_model}"
+    with Session(get_engine()) as s:
+        users = [User(name=f"Reader {flat}", mobile=f"900000050{i}", flat_id=flat, apt_name=apt)
+                 for i, flat in enumerate(["A2", "A10", "B1", "B3"])]
+        papers = [Paper(name="Manifest Times"), Paper(name="Manifest Weekly")]
+        s.add_all(users + papers)
+        s.flush()
+        s.add_all([Subscription(user_id=u.id, paper_id=papers[0].id, frequency=Frequency.DAILY, start_date=date(2024, 1, 1))
+                   for u in users])
+        s.add_all([
+            Subscription(user_id=users[0].id, paper_id=papers[1].id, frequency=Frequency.WEEKLY, weekday=DAY.weekday(),
+                         start_date=date(2024, 1, 1)),
+            Subscription(user_id=users[2].id, paper_id=papers[1].id, frequency=Frequency.WEEKLY, weekday=DAY.weekday(),
+                         start_date=date(2024, 1, 1)),
+            # Not on the day
+            Subscription(user_id=users[3].id, paper_id=papers[1].id, frequency=Frequency.WEEKLY,
+                         weekday=(DAY.weekday() + 1) % 7, start_date=date(2024, 1, 1)),
+        ])
+        s.add(Exclusion(user_id=users[1].id, paper_id=None, date_from=DAY, date_to=DAY))
+        s.commit()
+    # Seeded around the routes, so nothing told the cache
+    get_bill_cache().invalidate({INDENTS})
+
+    with Session(get_engine()) as s:
+        manifest = delivery_manifest(s, DAY, apt)
+    indent = get_indent(DAY.isoformat())
+    tenants.default.caches.pop("read_model", None)
+
+    from_manifest = Counter()
+    for block in manifest["blocks"]:
+        for flat in block["flats"]:
+            for paper in flat["papers"]:
+                from_manifest[(paper, block["apt_name"], block["block"])] += 1
+        assert block["copies"] == sum(p["quantity"] for p in block["papers"])
+    from_indent = {(r["paper"], r["apt_name"], r["block"]): r["quantity"] for r in indent["indent"] if r["apt_name"] == apt}
+    assert dict(from_manifest) == from_indent == {
+        ("Manifest Times", apt, "A"): 1, ("Manifest Weekly", apt, "A"): 1,
+        ("Manifest Times", apt, "B"): 2, ("Manifest Weekly", apt, "B"): 1,
+    }
+    assert manifest["copies"] == sum(from_indent.values())
+    assert [f["flat_id"] for b in manifest["blocks"] for f in b["flats"]] == ["A2", "B1", "B3"]
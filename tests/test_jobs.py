@@ -0,0 +1,84 @@
+import time
+import pytest
+from sqlmodel import Session, select
+from sqlalchemy import func
+from database import create_db_and_tables, get_engine
+from models import Job
+import jobs
+
+@pytest.fixture
+def runner(monkeypatch):
+    create_db_and_tables()
+    monkeypatch.setitem(jobs.JOB_TYPES, "noop", lambda params, progress: (b"{}", "application/json", None))
+    runner = jobs.JobRunner(1)
+    yield runner
+    runner.stop()
+
+def add_job(job_id, status, owner, heartbeat, job_type="noop", finished_at=None):
+    with Session(get_engine()) as s:
+        s.add(Job(id=job_id, type=job_type, params="{}", status=status, created_at=time.time(),
+                  owner=owner, heartbeat=heartbeat, finished_at=finished_at))
+        s.commit()
+
+def wait_finished(job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with Session(get_engine()) as s:
+            job = s.get(Job, job_id)
+            if job.status in ("done", "failed"):
+                return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish")
+
+def test_recover_leaves_jobs_of_live_workers_alone(runner):
+    add_job("live", "running", "other-worker", time.time())
+    assert runner.recover() == 0
+    with Session(get_engine()) as s:
+        job = s.get(Job, "live")
+        assert (job.status, job.owner) == ("running", "other-worker")
+
+def test_recover_reclaims_jobs_with_lapsed_lease(runner):
+    add_job("orphan", "running", "dead-worker", time.time() - 2 * jobs.config.get("job_lease_s", 60))
+    add_job("legacy", "queued", None, None)
+    assert runner.recover() == 2
+    for job_id in ("orphan", "legacy"):
+        job = wait_finished(job_id)
+        assert (job.status, job.owner) == ("done", jobs.BOOT_ID)
+    # A second worker recovering afterwards finds nothing to take
+    assert jobs.JobRunner(1).recover() == 0
+
+def test_running_jobs_heartbeat(runner, monkeypatch):
+    monkeypatch.setitem(jobs.config, "job_heartbeat_s", 0.05)
+    beats = []
+
+    def slow(params, progress):
+        time.sleep(0.2)
+        with Session(get_engine()) as s:
+            beats.append(s.get(Job, job.id).heartbeat)
+        return b"{}", "application/json", None
+
+    monkeypatch.setitem(jobs.JOB_TYPES, "slow", slow)
+    job = runner.submit("slow", {})
+    assert wait_finished(job.id).status == "done"
+    assert beats[0] > job.heartbeat
+
+def test_queue_limit_counts_other_workers_jobs(runner, monkeypatch):
+    monkeypatch.setitem(jobs.config, "job_limits", {"limited": (1, 2)})
+    for job_id in ("other-1", "other-2"):
+        add_job(job_id, "queued", "other-worker", time.time(), job_type="limited")
+    with pytest.raises(jobs.QueueFull):
+        runner.submit("limited", {})
+    with Session(get_engine()) as s:
+        assert s.exec(select(func.count()).select_from(Job).where(Job.type == "limited")).one() == 2
+
+def test_prune_deletes_only_expired_finished_jobs(runner):
+    old = time.time() - 2 * jobs.config.get("job_retention_days", 7) * 86400
+    add_job("old-done", "done", jobs.BOOT_ID, old, finished_at=old)
+    add_job("old-failed", "failed", jobs.BOOT_ID, old, finished_at=old)
+    add_job("recent-done", "done", jobs.BOOT_ID, time.time(), finished_at=time.time())
+    add_job("old-queued", "queued", "other-worker", time.time())
+    assert runner.prune() == 2
+    with Session(get_engine()) as s:
+        assert [s.get(Job, job_id) is not None for job_id in ("old-done", "old-failed", "recent-done", "old-queued")] \
+            == [False, False, True, True]
+
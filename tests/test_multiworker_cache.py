@@ -0,0 +1,17 @@
+"""
+Runs the cross-worker cache check from benchmarks/multiworker_cache.py on a
+small synthetic database: real uvicorn worker processes sharing one cache.
+"""
+import shutil
+from argparse import Namespace
+import pytest
+from benchmarks.multiworker_cache import run_backend
+
+def test_shared_backend_serves_no_stale_reads_across_workers():
+    if shutil.which("uvicorn") is None:
+        pytest.skip("uvicorn is not installed")
+    args = Namespace(users=60, workers=3, rounds=3, reads=12, year=2025, month=6, seed=11)
+    stale, checked, stats = run_backend("shared", args)
+    assert all(checked.values())
+    assert stale == dict.fromkeys(stale, 0)
+    assert stats["backend"] == "shared"
@@ -0,0 +1,54 @@
+from datetime import date
+from sqlmodel import Session
+from database import get_engine
+from models import Frequency, Paper, PaperPrice, Subscription, User
+from pricing import PriceTimeline
+import routes.papers
+
+def row(price, start=None, end=None, dow=None, id=None):
+    return PaperPrice(id=id, paper_id=1, day_of_week=dow, price=price, effective_from=start, effective_to=end)
+
+def test_timeline_picks_the_row_in_effect():
+    timeline = PriceTimeline([
+        row(5.0, end=date(2025, 6, 30), id=1),
+        row(6.0, start=date(2025, 7, 1), id=2),
+        row(8.0, start=date(2025, 7, 1), dow=6, id=3),
+    ])
+    assert timeline.price_on(date(2025, 3, 3)) == (5.0, False)
+    assert timeline.price_on(date(2025, 7, 1)) == (6.0, False)
+    assert timeline.price_on(date(2025, 7, 6)) == (8.0, True)
+    # The weekday row does not reach back before its start
+    assert timeline.price_on(date(2025, 3, 2)) == (5.0, False)
+
+def test_timeline_overlapping_rows_latest_start_wins():
+    timeline = PriceTimeline([row(5.0, id=1), row(6.0, start=date(2025, 7, 1), id=2), row(7.0, start=date(2025, 7, 1), id=3)])
+    assert timeline.price_on(date(2025, 1, 1)) == (5.0, False)
+    # Same start: the row added last wins
+    assert timeline.price_on(date(2025, 8, 1)) == (7.0, False)
+
+def test_timeline_gap_after_closed_row_is_free():
+    timeline = PriceTimeline([row(5.0, start=date(2025, 1, 1), end=date(2025, 1, 31))])
+    assert timeline.price_on(date(2024, 12, 31)) == (0.0, False)
+    assert timeline.price_on(date(2025, 2, 1)) == (0.0, False)
+
+class Today(date):
+    @classmethod
+    def today(cls):
+        return cls(2025, 10, 1)
+
+def test_undated_prices_only_reprice_from_today(client, monkeypatch):
+    monkeypatch.setattr(routes.papers, "date", Today)
+    with Session(get_engine()) as s:
+        user, paper = User(name="Priced", mobile="9000000005", flat_id="P1", apt_name="Prices"), Paper(name="Price Herald")
+        s.add_all([user, paper])
+        s.flush()
+        s.add(Subscription(user_id=user.id, paper_id=paper.id, frequency=Frequency.DAILY, start_date=date(2025, 1, 1)))
+        s.commit()
+        user_id, paper_id = user.id, paper.id
+    bill = lambda month: client.get(f"/billing/user/{user_id}", params={"year": 2025, "month": month}).json()["total"]
+
+    client.post(f"/papers/{paper_id}/price", json={"price": 5})
+    assert bill(3) == 31 * 5.0
+    client.post(f"/papers/{paper_id}/price", json={"price": 6, "effective_from": "2025-07-01"})
+    client.post(f"/papers/{paper_id}/price", json={"price": 7})
+    assert (bill(3), bill(9), bill(10)) == (31 * 5.0, 30 * 6.0, 31 * 7.0)
@@ -0,0 +1,16 @@
+import pytest
+
+PATHS = ["/admin/profiles", "/admin/profiles/abc", "/admin/profiles/abc/download"]
+
+@pytest.mark.parametrize("client", [{"profile_token": None}], indirect=True)
+def test_profiles_are_hidden_when_profiling_is_off(client):
+    for path in PATHS:
+        assert client.get(path, headers={"X-Profile-Token": "anything"}).status_code == 404
+
+@pytest.mark.parametrize("client", [{"profile_token": "s3cret"}], indirect=True)
+def test_profiles_need_the_token(client):
+    for path in PATHS:
+        assert client.get(path).status_code == 403
+        assert client.get(path, headers={"X-Profile-Token": "wrong"}).status_code == 403
+    assert client.get("/admin/profiles", headers={"X-Profile-Token": "s3cret"}).status_code == 200
+    assert client.get("/admin/profiles/abc", headers={"X-Profile-Token": "s3cret"}).status_code == 404
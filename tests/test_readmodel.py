@@ -0,0 +1,66 @@
+from datetime import date
+import pytest
+from sqlmodel import Session
+from database import create_db_and_tables, get_engine, tenants
+from models import Exclusion, Frequency, Paper, PaperPrice, Subscription, User
+from readmodel import get_read_model
+from routes.billing import compute_bill_items, get_pending_payments
+from routes.subscriptions import rows_from_database, rows_from_read_model
+
+@pytest.fixture
+def read_model(monkeypatch):
+    create_db_and_tables()
+    monkeypatch.setitem(tenants.default.config, "read_model", True)
+    tenants.default.caches.pop("read_model", None)
+    yield
+    tenants.default.caches.pop("read_model", None)
+
+def both_paths(user_ids, paper_id):
+    """(read model answers, ORM answers) for bills, pending dues and subscription lists."""
+    answers = []
+    for enabled in (True, False):
+        tenants.default.config["read_model"] = enabled
+        with Session(get_engine()) as s:
+            model = get_read_model(s)
+            rows = (lambda **kw: rows_from_read_model(model, **kw)) if enabled else (lambda **kw: rows_from_database(s, **kw))
+            answers.append((
+                [compute_bill_items(s, user_id, 2024, 6) for user_id in user_ids],
+                [get_pending_payments(s, user_id, 2024, 8) for user_id in user_ids],
+                [rows(user_id=user_id) for user_id in user_ids],
+                rows(paper_id=paper_id),
+            ))
+    tenants.default.config["read_model"] = True
+    return answers
+
+def test_read_model_matches_the_orm_before_and_after_replaying_changes(read_model):
+    with Session(get_engine()) as s:
+        users = [User(name=f"Model {i}", mobile=f"90000003{i:02d}", flat_id=f"M{i}", apt_name="Model Court") for i in range(3)]
+        papers = [Paper(name="Model Daily"), Paper(name="Model Weekly")]
+        s.add_all(users + papers)
+        s.flush()
+        s.add_all([PaperPrice(paper_id=papers[0].id, price=5.0), PaperPrice(paper_id=papers[1].id, price=12.0),
+                   PaperPrice(paper_id=papers[1].id, day_of_week=6, price=15.0)])
+        s.add_all([
+            Subscription(user_id=users[0].id, paper_id=papers[0].id, frequency=Frequency.DAILY, start_date=date(2024, 1, 1)),
+            Subscription(user_id=users[0].id, paper_id=papers[1].id, frequency=Frequency.WEEKLY, weekday=6, start_date=date(2024, 3, 1)),
+            Subscription(user_id=users[1].id, paper_id=papers[1].id, frequency=Frequency.CUSTOM, weekdays=0b1000001,
+                         interval_days=2, start_date=date(2024, 5, 2)),
+            Subscription(user_id=users[2].id, paper_id=papers[0].id, frequency=Frequency.MONTHLY, day_of_month=15,
+                         start_date=date(2024, 2, 1), end_date=date(2024, 6, 30)),
+        ])
+        s.add(Exclusion(user_id=users[0].id, paper_id=None, date_from=date(2024, 6, 10), date_to=date(2024, 6, 14)))
+        s.commit()
+        user_ids, paper_id = [u.id for u in users], papers[1].id
+    loaded, orm = both_paths(user_ids, paper_id)
+    assert loaded == orm
+
+    # Writes after the model was built reach it through the change log
+    with Session(get_engine()) as s:
+        s.get(Paper, paper_id).name = "Model Weekly Renamed"
+        s.get(User, user_ids[1]).apt_name = "Other Court"
+        s.add(Exclusion(user_id=user_ids[2], paper_id=None, date_from=date(2024, 6, 15), date_to=date(2024, 6, 15)))
+        s.add(Subscription(user_id=user_ids[1], paper_id=paper_id, frequency=Frequency.DAILY, start_date=date(2024, 6, 20)))
+        s.commit()
+    replayed, orm = both_paths(user_ids, paper_id)
+    assert replayed == orm
+    assert replayed != loaded
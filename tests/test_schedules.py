@@ -0,0 +1,74 @@
+from datetime import date, timedelta
+import pytest
+from sqlmodel import Session, SQLModel, select
+from database import get_engine, migrate, sqlite_engine
+from models import Frequency, Paper, PaperPrice, Subscription, User
+from pricing import invalidate_prices
+from schedules import ALL_MONTH_DAYS, ALL_WEEKDAYS, compile_schedule, legacy_masks
+
+LEGACY_ROWS = [
+    # frequency, weekday, day_of_month, expected (weekdays, month_days)
+    ("DAILY", None, None, (ALL_WEEKDAYS, ALL_MONTH_DAYS)),
+    ("WEEKLY", 2, None, (1 << 2, ALL_MONTH_DAYS)),
+    ("WEEKLY", None, None, (0, ALL_MONTH_DAYS)),
+    ("ALTERNATING", 4, None, (1 << 4, ALL_MONTH_DAYS)),
+    ("MONTHLY", None, 15, (ALL_WEEKDAYS, 1 << 14)),
+    ("MONTHLY", None, 40, (ALL_WEEKDAYS, 0)),
+]
+
+def test_backfill_gives_legacy_rows_their_masks(tmp_path):
+    engine = sqlite_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as conn:
+        # Written as before the schedule columns existed, bypassing sync_masks
+        conn.exec_driver_sql("INSERT INTO user (id, name, mobile, flat_id, apt_name) VALUES (1, 'Old', '1', 'A1', 'Legacy')")
+        conn.exec_driver_sql("INSERT INTO paper (id, name) VALUES (1, 'Old Times')")
+        for frequency, weekday, day_of_month, _ in LEGACY_ROWS:
+            conn.exec_driver_sql("INSERT INTO subscription (user_id, paper_id, frequency, weekday, day_of_month) "
+                                 "VALUES (1, 1, ?, ?, ?)", (frequency, weekday, day_of_month))
+    migrate(engine)
+    with Session(engine) as s:
+        subs = s.exec(select(Subscription).order_by(Subscription.id)).all()
+    engine.dispose()
+    assert [(sub.weekdays, sub.month_days) for sub in subs] == [expected for *_, expected in LEGACY_ROWS]
+    for sub in subs:
+        assert (sub.weekdays, sub.month_days) == legacy_masks(sub.frequency, sub.weekday, sub.day_of_month)
+
+@pytest.mark.parametrize("frequency, weekday, day_of_month", [
+    (Frequency.DAILY, None, None), (Frequency.WEEKLY, 3, None), (Frequency.MONTHLY, None, 31)])
+def test_masks_deliver_the_legacy_dates(frequency, weekday, day_of_month):
+    weekdays, month_days = legacy_masks(frequency, weekday, day_of_month)
+    legacy = compile_schedule(frequency, weekday, day_of_month, None, None, None, None, date(2024, 1, 1), None)
+    custom = compile_schedule(Frequency.CUSTOM, None, None, weekdays, month_days, None, None, date(2024, 1, 1), None)
+    days = [date(2023, 12, 1) + timedelta(days=i) for i in range(450)]
+    assert [legacy.applies_on(d) for d in days] == [custom.applies_on(d) for d in days]
+
+def test_merged_weekly_rows_bill_the_same(client):
+    with Session(get_engine()) as s:
+        user, paper = User(name="Weekdays", mobile="9000000011", flat_id="W1", apt_name="Merge"), Paper(name="Weekday Post")
+        s.add_all([user, paper])
+        s.flush()
+        s.add(PaperPrice(paper_id=paper.id, price=4.0))
+        s.add(PaperPrice(paper_id=paper.id, day_of_week=0, price=6.0))
+        rows = [Subscription(user_id=user.id, paper_id=paper.id, frequency=Frequency.WEEKLY, weekday=w,
+                             start_date=date(2024, 2, 7)) for w in range(5)]
+        s.add_all(rows)
+        s.commit()
+        user_id, ids = user.id, sorted(r.id for r in rows)
+    # Prices were written around the routes, so drop any timelines an earlier test cached
+    invalidate_prices()
+    bill = lambda: client.get(f"/billing/user/{user_id}", params={"year": 2024, "month": 2}).json()
+    before = bill()
+    assert before["total"] > 0
+
+    preview = client.post("/admin/schedules/merge").json()
+    assert preview["dry_run"] and any(g["id"] == ids[0] for g in preview["groups"])
+    merged = client.post("/admin/schedules/merge", params={"dry_run": False}).json()
+    [group] = [g for g in merged["groups"] if g["id"] == ids[0]]
+    assert (group["merged_ids"], group["weekdays"]) == (ids[1:], [0, 1, 2, 3, 4])
+
+    with Session(get_engine()) as s:
+        [sub] = s.exec(select(Subscription).where(Subscription.user_id == user_id)).all()
+        assert (sub.frequency, sub.weekdays) == (Frequency.CUSTOM, 0b0011111)
+    after = bill()
+    assert (after["items"], after["total"]) == (before["items"], before["total"])
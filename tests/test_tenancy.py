@@ -0,0 +1,72 @@
+import os
+from datetime import date
+import pytest
+from sqlmodel import Session, SQLModel, select
+from config import config
+from database import tenants, sqlite_engine, UnknownAgency
+from models import Frequency, Paper, PaperPrice, Subscription, User
+
+def make_agency(name):
+    os.makedirs(tenants.data_dir, exist_ok=True)
+    engine = sqlite_engine(f"sqlite:///{tenants.path_for(name)}")
+    SQLModel.metadata.create_all(engine)
+    engine.dispose()
+
+def test_unknown_agency_is_404_and_creates_nothing(client):
+    for response in (client.get("/users/", headers={"X-Agency": "nosuch"}), client.get("/agency/nosuch/users/")):
+        assert response.status_code == 404
+    assert not os.path.exists(tenants.path_for("nosuch"))
+    assert "nosuch" not in tenants.open
+
+def test_existing_and_configured_agencies_resolve(client, monkeypatch):
+    make_agency("north")
+    assert client.get("/agency/north/users/").status_code == 200
+    monkeypatch.setitem(config, "agencies", {"south": {"agency_name": "South"}})
+    assert client.get("/users/", headers={"X-Agency": "south"}).status_code == 200
+    assert os.path.exists(tenants.path_for("south"))
+
+def test_summary_does_not_open_agencies(client):
+    make_agency("east")
+    tenants.open.pop("east", None)
+    rows = client.get("/admin/summary").json()["agencies"]
+    assert "east" in [r["agency"] for r in rows]
+    assert "east" not in tenants.open
+
+def test_eviction_waits_for_active_requests(monkeypatch):
+    monkeypatch.setattr(tenants, "max_open", 1)
+    make_agency("west")
+    make_agency("central")
+    held = tenants.acquire("west")
+    tenants.get("central")
+    assert held.evicted and held.caches is not None
+    # Still usable until released
+    with held.engine.connect() as conn:
+        conn.exec_driver_sql("SELECT 1")
+    held.caches["marker"] = object()
+    tenants.release(held)
+    assert held.caches == {}
+    with pytest.raises(UnknownAgency):
+        tenants.get("nowhere")
+
+@pytest.mark.parametrize("client", [{"single_writer": True}], indirect=True)
+def test_single_writer_keeps_agencies_apart(client):
+    make_agency("isolated")
+    with Session(tenants.get("isolated").engine) as s:
+        user, paper = User(name="Far", mobile="1", flat_id="Z1", apt_name="Elsewhere"), Paper(name="Far Post")
+        s.add_all([user, paper])
+        s.flush()
+        s.add(PaperPrice(paper_id=paper.id, price=9.0))
+        s.add(Subscription(user_id=user.id, paper_id=paper.id, frequency=Frequency.DAILY, start_date=date(2024, 1, 1)))
+        s.commit()
+    tenants.default.caches.pop("prices", None)
+    headers = {"X-Agency": "isolated"}
+
+    assert client.post("/analytics/refresh", params={"year": 2024, "month": 1}, headers=headers).status_code == 200
+    assert client.post("/users/", json={"name": "Only There", "mobile": "2", "flat_id": "Z2", "apt_name": "Elsewhere"},
+                       headers=headers).status_code == 200
+    # The writer thread ran both units against the agency, never the default tenant
+    assert "prices" in tenants.get("isolated").caches
+    assert "prices" not in tenants.default.caches
+    for tenant, found in ((tenants.get("isolated"), 1), (tenants.default, 0)):
+        with Session(tenant.engine) as s:
+            assert len(s.exec(select(User).where(User.name == "Only There")).all()) == found
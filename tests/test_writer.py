@@ -0,0 +1,56 @@
+import pytest
+from sqlalchemy import event
+from sqlmodel import SQLModel, Session, select
+from database import sqlite_engine
+from models import Paper
+from writer import WriteQueue
+
+@pytest.fixture
+def traced(tmp_path):
+    """An engine on a scratch database plus the SQL its connections run."""
+    engine = sqlite_engine(f"sqlite:///{tmp_path / 'writer.db'}")
+    SQLModel.metadata.create_all(engine)
+    engine.dispose()
+    statements = []
+    event.listen(engine, "connect", lambda dbapi_connection, record: dbapi_connection.set_trace_callback(statements.append))
+    yield engine, statements
+    engine.dispose()
+
+def add_paper(name):
+    def work(s):
+        s.add(Paper(name=name))
+        return name
+    return work
+
+def fail(s):
+    s.add(Paper(name="doomed"))
+    s.flush()
+    raise ValueError("unit failed")
+
+def test_batch_shares_one_commit(traced):
+    engine, statements = traced
+    writer = WriteQueue(engine, window=0.5)
+    futures = [writer.submit(add_paper(f"paper {i}")) for i in range(5)]
+    assert [f.result(timeout=10) for f in futures] == [f"paper {i}" for i in range(5)]
+    writer.stop()
+
+    assert statements.count("BEGIN IMMEDIATE") == 1
+    assert statements.count("COMMIT") == 1
+    # Every savepoint runs inside the batch transaction
+    assert statements.index("BEGIN IMMEDIATE") < min(i for i, sql in enumerate(statements) if sql.startswith("SAVEPOINT"))
+    assert writer.stats == {"units": 5, "commits": 1, "failed": 0}
+
+def test_failing_unit_only_rolls_back_itself(traced):
+    engine, statements = traced
+    writer = WriteQueue(engine, window=0.5)
+    futures = [writer.submit(add_paper("first")), writer.submit(fail), writer.submit(add_paper("last"))]
+    assert futures[0].result(timeout=10) == "first"
+    with pytest.raises(ValueError):
+        futures[1].result(timeout=10)
+    assert futures[2].result(timeout=10) == "last"
+    writer.stop()
+
+    assert statements.count("COMMIT") == 1
+    with Session(engine) as s:
+        assert sorted(p.name for p in s.exec(select(Paper)).all()) == ["first", "last"]
+    assert writer.stats == {"units": 3, "commits": 1, "failed": 1}
@@ -0,0 +1,127 @@
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Any
+from sqlmodel import Session
+from database import get_engine, get_tenant
+from config import config
+
+def write_session(engine) -> Session:
+    """A session whose transaction begins IMMEDIATE, see database.sqlite_engine."""
+    s = Session(engine, expire_on_commit=False)
+    try:
+        s.connection(execution_options={"immediate": True})
+    except BaseException:
+        s.close()
+        raise
+    return s
+
+class WriteQueue:
+    """
+    Funnels every write through one thread. Units of work queued within
+    `window` seconds of each other run in a single transaction, each inside
+    its own savepoint so one failing unit does not roll back its neighbours,
+    and the batch pays for one commit instead of one per request.
+    """
+
+    def __init__(self, engine, window: float = 0.005, max_batch: int = 256):
+        self.engine = engine
+        self.window = window
+        self.max_batch = max_batch
+        self.pending = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.stats = {"units": 0, "commits": 0, "failed": 0}
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        with self.lock:
+            if self.thread is not None:
+                self.pending.put(None)
+                self.thread.join()
+                self.thread = None
+
+    def submit(self, work: Callable[[Session], Any]) -> Future:
+        self.start()
+        future = Future()
+        # The unit runs on the writer thread but must see the caller's agency
+        self.pending.put((work, future, contextvars.copy_context()))
+        return future
+
+    def _collect(self):
+        first = self.pending.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.pending.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self.pending.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            results = []
+            with write_session(self.engine) as s:
+                for work, future, context in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with s.begin_nested():
+                            results.append((future, context.run(work, s), None))
+                    except BaseException as exc:
+                        results.append((future, None, exc))
+                try:
+                    s.commit()
+                except BaseException as exc:
+                    s.rollback()
+                    results = [(future, None, exc) for future, _, _ in results]
+            self.stats["units"] += len(results)
+            self.stats["commits"] += 1
+            for future, result, exc in results:
+                if exc is not None:
+                    self.stats["failed"] += 1
+                    future.set_exception(exc)
+                else:
+                    future.set_result(result)
+
+def get_writer() -> WriteQueue:
+    """The writer of the current agency, created on first use."""
+    tenant = get_tenant()
+    writer = tenant.caches.get("writer")
+    if writer is None:
+        writer = tenant.caches.setdefault("writer", WriteQueue(
+            tenant.engine, window=tenant.config.get("writer_window_ms", 5) / 1000))
+    return writer
+
+def run_write(work: Callable[[Session], Any]):
+    """
+    Runs `work(session)` and commits. With `single_writer` enabled in config
+    the unit is handed to the shared writer thread; otherwise it runs on the
+    calling thread in its own transaction as before.
+    """
+    if config.get("single_writer"):
+        return get_writer().submit(work).result()
+    with write_session(get_engine()) as s:
+        result = work(s)
+        s.commit()
+        return result